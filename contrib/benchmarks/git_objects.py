@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+#
+# Compares reading objects from a git repository through the memory-mapped
+# pack reader (rbtools.clients.gitobjects) against a 'git cat-file --batch'
+# coprocess, which is the fastest way to get objects out of git itself.
+#
+# Objects are looked up one at a time, as GitClient does, rather than
+# streamed through cat-file in bulk. Both the full reads (--batch) and the
+# existence lookups (--batch-check, against the pack index binary search)
+# are timed.
+#
+# Usage: git_objects.py [REPOSITORY [NUM_OBJECTS]]
+#
+# The repository defaults to the current directory, and should be packed
+# ('git gc') to measure the pack reader.
+#
+
+import hashlib
+import os
+import subprocess
+import sys
+import time
+from binascii import unhexlify
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from rbtools.clients.gitobjects import Repository
+
+
+def get_git_dir(path):
+    git_dir = subprocess.Popen(['git', 'rev-parse', '--git-dir'], cwd=path,
+                               stdout=subprocess.PIPE).communicate()[0]
+
+    return os.path.abspath(os.path.join(path, git_dir.strip()))
+
+
+def get_object_ids(path, num_objects):
+    p = subprocess.Popen(['git', 'rev-list', '--all', '--objects'],
+                         cwd=path, stdout=subprocess.PIPE)
+    shas = []
+
+    for line in p.stdout:
+        shas.append(line.split()[0])
+
+        if len(shas) == num_objects:
+            break
+
+    p.stdout.close()
+    p.wait()
+
+    return shas
+
+
+def run_cat_file_batch(git_dir, shas):
+    p = subprocess.Popen(['git', '--git-dir=%s' % git_dir, 'cat-file',
+                          '--batch'],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    digest = hashlib.md5()
+
+    for sha in shas:
+        p.stdin.write(sha + '\n')
+        p.stdin.flush()
+        size = int(p.stdout.readline().split()[2])
+        digest.update(p.stdout.read(size + 1)[:-1])
+
+    p.stdin.close()
+    p.wait()
+
+    return digest.hexdigest()
+
+
+def run_native_read(git_dir, shas):
+    repository = Repository(git_dir)
+    digest = hashlib.md5()
+
+    for sha in shas:
+        digest.update(repository.store.read(sha)[1])
+
+    repository.close()
+
+    return digest.hexdigest()
+
+
+def run_cat_file_batch_check(git_dir, shas):
+    p = subprocess.Popen(['git', '--git-dir=%s' % git_dir, 'cat-file',
+                          '--batch-check=%(objectname)'],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    digest = hashlib.md5()
+
+    for sha in shas:
+        p.stdin.write(sha + '\n')
+        p.stdin.flush()
+        digest.update(p.stdout.readline().split()[0])
+
+    p.stdin.close()
+    p.wait()
+
+    return digest.hexdigest()
+
+
+def run_native_lookup(git_dir, shas):
+    repository = Repository(git_dir)
+    objects_dir = os.path.join(git_dir, 'objects')
+    packs = repository.store._get_packs()
+    digest = hashlib.md5()
+
+    for sha in shas:
+        binsha = unhexlify(sha)
+
+        for pack in packs:
+            if pack.find(binsha) is not None:
+                digest.update(sha)
+                break
+        else:
+            if os.path.exists(os.path.join(objects_dir, sha[:2], sha[2:])):
+                digest.update(sha)
+
+    repository.close()
+
+    return digest.hexdigest()
+
+
+def run_baseline(git_dir, shas):
+    return ''
+
+
+def measure(func, git_dir, shas):
+    """
+    Runs func in a child process, so that its peak memory use can be
+    measured on its own. Returns (seconds, peak RSS in KB, MD5 of the
+    output). The memory used by cat-file isn't included.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read_fd)
+        start = time.time()
+        digest = func(git_dir, shas)
+        elapsed = time.time() - start
+        os.write(write_fd, '%f %s' % (elapsed, digest or '-'))
+        os._exit(0)
+
+    os.close(write_fd)
+    output = os.read(read_fd, 1024)
+    os.close(read_fd)
+    rusage = os.wait4(pid, 0)[2]
+    elapsed, digest = output.split()
+
+    # ru_maxrss is in KB on Linux, but in bytes on Mac OS X.
+    maxrss = rusage.ru_maxrss
+
+    if sys.platform == 'darwin':
+        maxrss //= 1024
+
+    return float(elapsed), maxrss, digest
+
+
+def main():
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        path = '.'
+
+    if len(sys.argv) > 2:
+        num_objects = int(sys.argv[2])
+    else:
+        num_objects = 20000
+
+    git_dir = get_git_dir(path)
+    shas = get_object_ids(path, num_objects)
+    baseline = measure(run_baseline, git_dir, shas)
+    print 'Reading %d objects from %s' % (len(shas), git_dir)
+
+    for title, variants in (
+            ('Full reads', (('cat-file --batch', run_cat_file_batch),
+                            ('native', run_native_read))),
+            ('Lookups', (('cat-file --batch-check', run_cat_file_batch_check),
+                         ('native', run_native_lookup)))):
+        print '  %s:' % title
+        results = []
+
+        for name, func in variants:
+            elapsed, maxrss, digest = measure(func, git_dir, shas)
+            maxrss -= baseline[1]
+            results.append((elapsed, maxrss, digest))
+            print '    %-24s %7.2fs  %8d KB  %8d objects/s' % (
+                name, elapsed, maxrss, len(shas) / elapsed)
+
+        if results[0][2] != results[1][2]:
+            print '    Warning: the outputs differ!'
+
+        print '    %.1fx faster' % (results[0][0] / results[1][0])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+#
+# Compares the time and memory used by GitClient.convert_svn_diff against
+# the old string-concatenating make_svn_diff loop, converting a synthetic git
+# diff (100 MB by default) to svn diff format.
+#
+# git isn't run. The diff is written to a temporary file up front, and each
+# conversion reads it line by line, as make_svn_diff reads git's output
+# through execute_stream, so the input is never held in memory as a whole.
+#
+# Usage: git_svn_diff.py [SIZE_IN_MB]
+#
+
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from rbtools.clients.git import GitClient
+
+
+LINES_PER_FILE = 100
+SVN_REVISION = '1234'
+
+
+class Options(object):
+    pass
+
+
+def generate_diff(fp, size):
+    """Writes a 'git diff' of roughly size bytes to the file."""
+    total = 0
+    i = 0
+
+    while total < size:
+        filename = 'src/module%d/file%d.c' % (i % 100, i)
+
+        if i % 50 == 0:
+            file_lines = [
+                'diff --git %s %s\n' % (filename, filename),
+                'new file mode 100644\n',
+                'index 0000000..1234567\n',
+                '--- /dev/null\n',
+                '+++ %s\n' % filename,
+                '@@ -0,0 +1,%d @@\n' % (LINES_PER_FILE - 6),
+            ]
+            file_lines.extend(['+    added_line(%d, %d);\n' % (i, j)
+                               for j in xrange(LINES_PER_FILE - 6)])
+        elif i % 50 == 1:
+            file_lines = [
+                'diff --git %s.png %s.png\n' % (filename, filename),
+                'index 1234567..89abcde 100644\n',
+                'Binary files %s.png and %s.png differ\n'
+                % (filename, filename),
+            ]
+        else:
+            file_lines = [
+                'diff --git %s %s\n' % (filename, filename),
+                'index 1234567..89abcde 100644\n',
+                '--- %s\n' % filename,
+                '+++ %s\n' % filename,
+                '@@ -1,%d +1,%d @@\n' % (LINES_PER_FILE - 5,
+                                         LINES_PER_FILE - 5),
+            ]
+
+            for j in xrange(LINES_PER_FILE - 5):
+                if j % 10 == 0:
+                    file_lines.append('-    old_value = compute(%d, %d);\n'
+                                      % (i, j))
+                elif j % 10 == 1:
+                    file_lines.append('+    new_value = compute(%d, %d);\n'
+                                      % (i, j))
+                else:
+                    file_lines.append('     unchanged_line(%d, %d);\n'
+                                      % (i, j))
+
+        fp.writelines(file_lines)
+        total += sum([len(line) for line in file_lines])
+        i += 1
+
+
+def legacy_make_svn_diff(diff_lines, rev):
+    diff_data = ""
+    filename = ""
+    newfile = False
+
+    for line in diff_lines:
+        if line.startswith("diff "):
+            info = line.split(" ")
+            diff_data += "Index: %s\n" % info[2]
+            diff_data += "=" * 67
+            diff_data += "\n"
+        elif line.startswith("index "):
+            pass
+        elif line.strip() == "--- /dev/null":
+            newfile = True
+        elif line.startswith("--- "):
+            newfile = False
+            diff_data += "--- %s\t(revision %s)\n" % \
+                         (line[4:].strip(), rev)
+        elif line.startswith("+++ "):
+            filename = line[4:].strip()
+            if newfile:
+                diff_data += "--- %s\t(revision 0)\n" % filename
+                diff_data += "+++ %s\t(revision 0)\n" % filename
+            else:
+                diff_data += "+++ %s\t(working copy)\n" % filename
+        elif line.startswith("new file mode"):
+            pass
+        elif line.startswith("Binary files "):
+            diff_data += "Cannot display: file marked as a binary type.\n"
+            diff_data += "svn:mime-type = application/octet-stream\n"
+        else:
+            diff_data += line
+
+    return diff_data
+
+
+def run_legacy(client, diff_lines):
+    return legacy_make_svn_diff(diff_lines, SVN_REVISION)
+
+
+def run_convert_svn_diff(client, diff_lines):
+    return client.convert_svn_diff(diff_lines, SVN_REVISION)
+
+
+def run_baseline(client, diff_lines):
+    return ''
+
+
+def measure(func, diff_filename):
+    """
+    Runs func in a child process, so that its peak memory use can be
+    measured on its own. Returns (seconds, peak RSS in KB, MD5 of the
+    output, output length).
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read_fd)
+        client = GitClient(options=Options())
+        diff_fp = open(diff_filename, 'r')
+        start = time.time()
+        result = func(client, diff_fp)
+        elapsed = time.time() - start
+        diff_fp.close()
+        digest = hashlib.md5(result).hexdigest()
+        os.write(write_fd, '%f %s %d' % (elapsed, digest, len(result)))
+        os._exit(0)
+
+    os.close(write_fd)
+    output = os.read(read_fd, 1024)
+    os.close(read_fd)
+    rusage = os.wait4(pid, 0)[2]
+    elapsed, digest, length = output.split()
+
+    # ru_maxrss is in KB on Linux, but in bytes on Mac OS X.
+    maxrss = rusage.ru_maxrss
+
+    if sys.platform == 'darwin':
+        maxrss //= 1024
+
+    return float(elapsed), maxrss, digest, int(length)
+
+
+def main():
+    if len(sys.argv) > 1:
+        size = int(float(sys.argv[1]) * 1024 * 1024)
+    else:
+        size = 100 * 1024 * 1024
+
+    diff_fp = tempfile.NamedTemporaryFile()
+    generate_diff(diff_fp, size)
+    diff_fp.flush()
+
+    baseline = measure(run_baseline, diff_fp.name)
+    print 'Converting a %d MB git diff' % (size // (1024 * 1024))
+    print '  (the interpreter takes %d KB, which is subtracted)' % baseline[1]
+
+    results = []
+
+    for name, func in (('legacy loop', run_legacy),
+                       ('convert_svn_diff', run_convert_svn_diff)):
+        elapsed, maxrss, digest, length = measure(func, diff_fp.name)
+        maxrss -= baseline[1]
+        results.append((elapsed, maxrss, digest))
+        print '  %-16s %7.2fs  %8d KB  %6.1f MB/s' % (
+            name, elapsed, maxrss, length / elapsed / (1024 * 1024))
+
+    diff_fp.close()
+
+    if results[0][2] != results[1][2]:
+        print 'Warning: the outputs differ!'
+
+    print '  %.1fx faster, %+d KB peak RSS' % (results[0][0] / results[1][0],
+                                              results[1][1] - results[0][1])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+#
+# Compares the time and memory used by SVNClient.rewrite_diff against the
+# old list-based pipeline (handle_renames, then convert_to_absolute_paths),
+# on a synthetic diff.
+#
+# svn isn't run. Every file in the diff is given canned 'svn info' results
+# up front, so only the cost of rewriting the diff is measured.
+#
+# Usage: svn_diff.py [NUM_LINES]
+#
+
+import hashlib
+import os
+import sys
+import time
+import urllib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from rbtools.clients.svn import SVNClient
+
+
+LINES_PER_FILE = 100
+
+
+class Options(object):
+    repository_url = None
+
+
+def generate_diff(num_lines):
+    """Yields the lines of an 'svn diff' with about num_lines lines."""
+    for i in xrange(num_lines // LINES_PER_FILE):
+        filename = 'src/module%d/file%d.c' % (i % 100, i)
+        yield 'Index: %s\n' % filename
+        yield '=' * 67 + '\n'
+        yield '--- %s\t(revision 1234)\n' % filename
+        yield '+++ %s\t(working copy)\n' % filename
+        yield '@@ -1,%d +1,%d @@\n' % (LINES_PER_FILE - 5, LINES_PER_FILE - 5)
+
+        for j in xrange(LINES_PER_FILE - 5):
+            if j % 10 == 0:
+                yield '-    old_value = compute(%d, %d);\n' % (i, j)
+            elif j % 10 == 1:
+                yield '+    new_value = compute(%d, %d);\n' % (i, j)
+            else:
+                yield '     unchanged_line(%d, %d);\n' % (i, j)
+
+
+def make_client(num_lines):
+    client = SVNClient(options=Options())
+
+    for i in xrange(num_lines // LINES_PER_FILE):
+        filename = 'src/module%d/file%d.c' % (i % 100, i)
+        client._svn_info[os.path.normpath(filename)] = {
+            'URL': 'http://svn.example.com/repo/trunk/' + filename,
+            'Repository Root': 'http://svn.example.com/repo',
+        }
+
+    return client
+
+
+def legacy_handle_renames(client, diff_content):
+    result = []
+    from_line = ""
+
+    for line in diff_content:
+        if client.DIFF_ORIG_FILE_LINE_RE.match(line):
+            from_line = line
+            continue
+
+        if client.DIFF_NEW_FILE_LINE_RE.match(line):
+            to_file, _ = client.parse_filename_header(line[4:])
+            info = client.svn_info(to_file)
+
+            if info.has_key("Copied From URL"):
+                url = info["Copied From URL"]
+                root = info["Repository Root"]
+                from_file = urllib.unquote(url[len(root):])
+                result.append(from_line.replace(to_file, from_file))
+            else:
+                result.append(from_line)
+
+        result.append(line)
+
+    return result
+
+
+def legacy_convert_to_absolute_paths(client, diff_content):
+    result = []
+
+    for line in diff_content:
+        front = None
+
+        if (client.DIFF_NEW_FILE_LINE_RE.match(line)
+            or client.DIFF_ORIG_FILE_LINE_RE.match(line)
+            or line.startswith('Index: ')):
+            front, line = line.split(" ", 1)
+
+        if front:
+            if line.startswith('/'):
+                line = front + " " + line
+            else:
+                file, rest = client.parse_filename_header(line)
+                info = client.svn_info(file)
+                url = info["URL"]
+                root = info["Repository Root"]
+                path = urllib.unquote(url[len(root):])
+                line = front + " " + path + rest
+
+        result.append(line)
+
+    return result
+
+
+def run_legacy(client, diff_content):
+    diff = list(diff_content)
+    diff = legacy_handle_renames(client, diff)
+    diff = legacy_convert_to_absolute_paths(client, diff)
+
+    return ''.join(diff)
+
+
+def run_rewrite_diff(client, diff_content):
+    return client.rewrite_diff(diff_content)
+
+
+def run_baseline(client, diff_content):
+    # Just generate the diff, to measure the cost shared by both.
+    for line in diff_content:
+        pass
+
+    return ''
+
+
+def measure(func, num_lines):
+    """
+    Runs func in a child process, so that its peak memory use can be
+    measured on its own. Returns (seconds, peak RSS in KB, MD5 of the
+    output).
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read_fd)
+        client = make_client(num_lines)
+        start = time.time()
+        result = func(client, generate_diff(num_lines))
+        elapsed = time.time() - start
+        digest = hashlib.md5(result).hexdigest()
+        os.write(write_fd, '%f %s' % (elapsed, digest))
+        os._exit(0)
+
+    os.close(write_fd)
+    output = os.read(read_fd, 1024)
+    os.close(read_fd)
+    rusage = os.wait4(pid, 0)[2]
+    elapsed, digest = output.split()
+
+    # ru_maxrss is in KB on Linux, but in bytes on Mac OS X.
+    maxrss = rusage.ru_maxrss
+
+    if sys.platform == 'darwin':
+        maxrss //= 1024
+
+    return float(elapsed), maxrss, digest
+
+
+def main():
+    if len(sys.argv) > 1:
+        num_lines = int(sys.argv[1])
+    else:
+        num_lines = 500000
+
+    baseline = measure(run_baseline, num_lines)
+    print 'Rewriting a %d-line diff' % num_lines
+    print '  (generating it takes %.2fs and %d KB, which is subtracted)' % (
+        baseline[0], baseline[1])
+
+    results = []
+
+    for name, func in (('legacy pipeline', run_legacy),
+                       ('rewrite_diff', run_rewrite_diff)):
+        elapsed, maxrss, digest = measure(func, num_lines)
+        elapsed -= baseline[0]
+        maxrss -= baseline[1]
+        results.append((elapsed, maxrss, digest))
+        print '  %-16s %7.2fs  %8d KB' % (name, elapsed, maxrss)
+
+    if results[0][2] != results[1][2]:
+        print 'Warning: the outputs differ!'
+
+    print '  %.1fx faster, using %.1fx less memory' % (
+        results[0][0] / results[1][0], float(results[0][1]) / results[1][1])
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,37 @@
 import logging
+import os
 import sys
-
+import time
+from itertools import izip
+
+from rbtools.utils.cache import get_file_stamps, load_cache, save_cache
+from rbtools.utils.checks import check_install
+from rbtools.utils.concurrency import imap_parallel
+from rbtools.utils.diff import GNU_DIFF, diff_files
+from rbtools.utils.filesystem import walk_parents
 from rbtools.utils.process import die
 
 
 # The clients are lazy loaded via load_scmclients()
 SCMCLIENTS = None
 
+REPOSITORY_INFO_CACHE = 'repository-info'
+MAX_REPOSITORY_INFO_CACHE_ENTRIES = 50
+
 
 class SCMClient(object):
     """
     A base representation of an SCM tool for fetching repository information
     and generating diffs.
     """
+    # Commands used to check whether the tool is installed. These are probed
+    # concurrently by scan_usable_client before it calls get_repository_info,
+    # so they must be quick and must not depend on the working directory.
+    install_checks = []
+
+    # Attributes set by get_repository_info that need to be saved and
+    # restored along with cached repository information.
+    cached_attributes = []
 
     def __init__(self, user_config=None, configs=[], options=None):
         self._user_config = user_config
@@ -22,9 +41,46 @@ class SCMClient(object):
     def get_repository_info(self):
         return None
 
+    def get_repository_markers(self):
+        """
+        Returns the names of files or directories whose presence in the
+        current directory or one of its parents indicates a checkout for
+        this client.
+
+        If None is returned, checkouts can't be recognized from the
+        filesystem and scan_usable_client will always probe the client.
+        """
+        return None
+
+    def get_repository_cache_files(self, root):
+        """
+        Returns the files whose modification times decide whether cached
+        repository information for the checkout at root is still valid.
+
+        root is the directory where one of the client's repository markers
+        was found. If None is returned, the repository information isn't
+        cached.
+        """
+        return None
+
     def check_options(self):
         pass
 
+    def get_diff_engine(self):
+        """
+        Returns the engine used to diff pairs of files, as selected with
+        --diff-engine. This is one of the engines in rbtools.utils.diff.
+        """
+        return getattr(self._options, 'diff_engine', None) or GNU_DIFF
+
+    def _diff_files(self, old_file, new_file, show_function=False):
+        """
+        Returns the unified diff between two files as a list of lines,
+        using the client's diff engine.
+        """
+        return diff_files(old_file, new_file, self.get_diff_engine(),
+                          show_function)
+
     def scan_for_server(self, repository_info):
         """
         Scans the current directory on up to find a .reviewboard file
@@ -161,21 +217,165 @@ def load_scmclients(options):
     ]
 
 
+def _is_installed(tool):
+    """
+    Returns whether any of the client's install checks succeed. Clients
+    without install checks are always considered installed.
+    """
+    if not tool.install_checks:
+        return True
+
+    for command in tool.install_checks:
+        if check_install(command):
+            return True
+
+    return False
+
+
+def _find_marked_clients(clients):
+    """
+    Walks up from the current directory once, looking for the clients'
+    repository markers.
+
+    Returns a list of (tool, root) tuples for the clients whose markers were
+    found, where root is the closest directory containing one of them. Clients
+    that can't be recognized from the filesystem at all are included with a
+    root of None.
+    """
+    markers = [(tool, tool.get_repository_markers()) for tool in clients]
+    roots = {}
+
+    for tool, tool_markers in markers:
+        if tool_markers is None:
+            roots[tool] = None
+
+    for path in walk_parents(os.getcwd()):
+        for tool, tool_markers in markers:
+            if tool in roots:
+                continue
+
+            for marker in tool_markers:
+                if os.path.exists(os.path.join(path, marker)):
+                    roots[tool] = path
+                    break
+
+    return [(tool, roots[tool]) for tool in clients if tool in roots]
+
+
+def _get_repository_info(tool, root):
+    """
+    Returns the repository information from the client, using the on-disk
+    cache if the client supports it for the checkout at root.
+
+    Cache entries are keyed by the client, the working directory and the
+    options that affect the result, and are only used while the client's
+    cache files (such as .git/config) are unchanged.
+    """
+    if root:
+        cache_files = tool.get_repository_cache_files(root)
+    else:
+        cache_files = None
+
+    if cache_files is None:
+        return tool.get_repository_info()
+
+    options = tool.options
+    key = repr((tool.__class__.__name__, os.getcwd(),
+                getattr(options, 'repository_url', None),
+                getattr(options, 'tracking', None),
+                getattr(options, 'parent_branch', None)))
+    stamps = get_file_stamps(cache_files)
+    cache = load_cache(REPOSITORY_INFO_CACHE)
+    entry = cache.get(key)
+
+    if entry and entry['stamps'] == stamps:
+        logging.debug("Using cached repository info for %s" % root)
+
+        for attr, value in entry['state'].iteritems():
+            setattr(tool, attr, value)
+
+        if entry['cwd'] != os.getcwd():
+            os.chdir(entry['cwd'])
+
+        return entry['info']
+
+    repository_info = tool.get_repository_info()
+
+    if repository_info:
+        state = {}
+
+        for attr in tool.cached_attributes:
+            if hasattr(tool, attr):
+                state[attr] = getattr(tool, attr)
+
+        cache[key] = {
+            'stamps': stamps,
+            'info': repository_info,
+            'state': state,
+            'cwd': os.getcwd(),
+            'time': time.time(),
+        }
+
+        # Only keep the most recently used checkouts around.
+        if len(cache) > MAX_REPOSITORY_INFO_CACHE_ENTRIES:
+            keys = sorted(cache, key=lambda k: cache[k]['time'])
+            for old_key in keys[:-MAX_REPOSITORY_INFO_CACHE_ENTRIES]:
+                del cache[old_key]
+
+        save_cache(REPOSITORY_INFO_CACHE, cache)
+
+    return repository_info
+
+
+def _probe_clients(candidates):
+    """
+    Returns a (repository_info, tool) tuple for the first of the candidate
+    (tool, root) pairs that recognizes the current directory, or
+    (None, None).
+
+    The install checks for all clients run concurrently, but the clients are
+    still consulted in order, and the remaining probes are abandoned as soon
+    as one of them claims the working directory.
+    """
+    probes = imap_parallel(_is_installed,
+                           [tool for tool, root in candidates])
+
+    try:
+        for (tool, root), is_installed in izip(candidates, probes):
+            if is_installed:
+                repository_info = _get_repository_info(tool, root)
+
+                if repository_info:
+                    return repository_info, tool
+    finally:
+        probes.close()
+
+    return None, None
+
+
 def scan_usable_client(options):
     from rbtools.clients.perforce import PerforceClient
 
-    repository_info = None
-    tool = None
-
     if SCMCLIENTS is None:
         load_scmclients(options)
 
-    # Try to find the SCM Client we're going to be working with.
-    for tool in SCMCLIENTS:
-        repository_info = tool.get_repository_info()
-
-        if repository_info:
-            break
+    # Try to find the SCM Client we're going to be working with. Unless a
+    # repository URL was given, start with the clients whose markers (.git,
+    # .svn and so on) are present, and only fall back on probing the rest
+    # if none of them worked out.
+    if options.repository_url:
+        candidates = [(tool, None) for tool in SCMCLIENTS]
+    else:
+        candidates = _find_marked_clients(SCMCLIENTS)
+
+    repository_info, tool = _probe_clients(candidates)
+
+    if not repository_info and len(candidates) < len(SCMCLIENTS):
+        logging.debug("No marked client matched. Probing the rest.")
+        probed = [candidate for candidate, root in candidates]
+        repository_info, tool = _probe_clients(
+            [(client, None) for client in SCMCLIENTS
+             if client not in probed])
 
     if not repository_info:
         if options.repository_url:
@@ -2,11 +2,11 @@ import logging
 import os
 import sys
 
-from rbtools.api.errors import APIError
 from rbtools.clients import SCMClient, RepositoryInfo
 from rbtools.utils.checks import check_gnu_diff, check_install
+from rbtools.utils.diff import GNU_DIFF
 from rbtools.utils.filesystem import make_tempfile
-from rbtools.utils.process import die, execute
+from rbtools.utils.process import die, execute, execute_stream
 
 # This specific import is necessary to handle the paths for
 # cygwin enabled machines.
@@ -23,11 +23,24 @@ class ClearCaseClient(SCMClient):
     information and generates compatible diffs.
     This client assumes that cygwin is installed on windows.
     """
+    install_checks = ['cleartool help']
     viewtype = None
 
     def __init__(self, **kwargs):
         super(ClearCaseClient, self).__init__(**kwargs)
 
+    def get_repository_markers(self):
+        # Snapshot views have a view.dat at their root. Dynamic views have
+        # nothing of the sort, but on Unix they're either reached through
+        # /view or set with 'cleartool setview'. There's no telling on
+        # Windows, where they're usually mapped to a drive.
+        if (sys.platform.startswith('win') or
+            'CLEARCASE_ROOT' in os.environ or
+            os.getcwd().startswith('/view/')):
+            return None
+
+        return ['view.dat']
+
     def get_repository_info(self):
         """Returns information on the Clear Case repository.
 
@@ -44,7 +57,8 @@ class ClearCaseClient(SCMClient):
 
         # Now that we know it's ClearCase, make sure we have GNU diff installed,
         # and error out if we don't.
-        check_gnu_diff()
+        if self.get_diff_engine() == GNU_DIFF:
+            check_gnu_diff()
 
         property_lines = execute(["cleartool", "lsview", "-full", "-properties",
                                   "-cview"], split_lines=True)
@@ -169,10 +183,11 @@ class ClearCaseClient(SCMClient):
             for s in sorted(os.listdir(path))
         ])
 
-    def _construct_changeset(self, output):
+    def _construct_changeset(self, lines):
         return [
-            info.split('\t')
-            for info in output.strip().split('\n')
+            line.rstrip('\n').split('\t')
+            for line in lines
+            if line.strip()
         ]
 
     def get_checkedout_changeset(self):
@@ -181,10 +196,9 @@ class ClearCaseClient(SCMClient):
         This function returns: kind of element, path to file,
         previews and current file version.
         """
-        changeset = []
         # We ignore return code 1 in order to
         # omit files that Clear Case can't read.
-        output = execute([
+        changeset = self._construct_changeset(execute_stream([
             "cleartool",
             "lscheckout",
             "-all",
@@ -193,10 +207,7 @@ class ClearCaseClient(SCMClient):
             "-fmt",
             r"%En\t%PVn\t%Vn\n"],
             extra_ignore_errors=(1,),
-            with_errors=False)
-
-        if output:
-            changeset = self._construct_changeset(output)
+            with_errors=False))
 
         return self._sanitize_checkedout_changeset(changeset)
 
@@ -206,8 +217,6 @@ class ClearCaseClient(SCMClient):
         This takes into account the changes on the branch owned by the
         current user in all vobs of the current view.
         """
-        changeset = []
-
         # We ignore return code 1 in order to
         # omit files that Clear Case can't read.
         if sys.platform.startswith('win'):
@@ -215,7 +224,7 @@ class ClearCaseClient(SCMClient):
         else:
             CLEARCASE_XPN = '$CLEARCASE_XPN'
 
-        output = execute([
+        changeset = self._construct_changeset(execute_stream([
             "cleartool",
             "find",
             "-all",
@@ -226,10 +235,7 @@ class ClearCaseClient(SCMClient):
             r'"%En\t%PVn\t%Vn\n" ' \
             + CLEARCASE_XPN],
             extra_ignore_errors=(1,),
-            with_errors=False)
-
-        if output:
-            changeset = self._construct_changeset(output)
+            with_errors=False))
 
         return self._sanitize_branch_changeset(changeset)
 
@@ -254,25 +260,8 @@ class ClearCaseClient(SCMClient):
         return (self.do_diff(changeset)[0], None)
 
     def diff_files(self, old_file, new_file):
-        """Return unified diff for file.
-
-        Most effective and reliable way is use gnu diff.
-        """
-        diff_cmd = ["diff", "-uN", old_file, new_file]
-        dl = execute(diff_cmd, extra_ignore_errors=(1, 2),
-                     translate_newlines=False)
-
-        # If the input file has ^M characters at end of line, lets ignore them.
-        dl = dl.replace('\r\r\n', '\r\n')
-        dl = dl.splitlines(True)
-
-        # Special handling for the output of the diff tool on binary files:
-        #     diff outputs "Files a and b differ"
-        # and the code below expects the output to start with
-        #     "Binary files "
-        if (len(dl) == 1 and
-            dl[0].startswith('Files %s and %s differ' % (old_file, new_file))):
-            dl = ['Binary files %s and %s differ\n' % (old_file, new_file)]
+        """Return unified diff for file."""
+        dl = self._diff_files(old_file, new_file)
 
         # We need oids of files to translate them to paths on reviewboard
         # repository.
@@ -302,11 +291,7 @@ class ClearCaseClient(SCMClient):
         old_tmp = make_tempfile(content=old_content)
         new_tmp = make_tempfile(content=new_content)
 
-        diff_cmd = ["diff", "-uN", old_tmp, new_tmp]
-        dl = execute(diff_cmd,
-                     extra_ignore_errors=(1, 2),
-                     translate_newlines=False,
-                     split_lines=True)
+        dl = self._diff_files(old_tmp, new_tmp)
 
         # Replacing temporary filenames to
         # real directory names and add ids
@@ -367,16 +352,8 @@ class ClearCaseRepositoryInfo(RepositoryInfo):
         uuid = self._get_vobs_uuid(self.vobstag)
         logging.debug("Repository's %s uuid is %r" % (self.vobstag, uuid))
 
-        repositories = server.get_repositories()
-        for repository in repositories:
-            if repository['tool'] != 'ClearCase':
-                continue
-
-            info = self._get_repository_info(server, repository)
-
-            if not info or uuid != info['uuid']:
-                continue
-
+        for repository, info in server.find_repositories_by_uuid('ClearCase',
+                                                                 uuid):
             logging.debug('Matching repository uuid:%s with path:%s' % (uuid,
                           info['repopath']))
             return ClearCaseRepositoryInfo(info['repopath'],
@@ -400,15 +377,3 @@ class ClearCaseRepositoryInfo(RepositoryInfo):
         for line  in property_lines:
             if line.startswith('Vob family uuid:'):
                 return  line.split(' ')[-1].rstrip()
-
-    def _get_repository_info(self, server, repository):
-        try:
-            return server.get_repository_info(repository['id'])
-        except APIError as e:
-            # If the server couldn't fetch the repository info, it will return
-            # code 210. Ignore those.
-            # Other more serious errors should still be raised, though.
-            if e.error_code == 210:
-                return None
-
-            raise e
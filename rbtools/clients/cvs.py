@@ -12,9 +12,14 @@ class CVSClient(SCMClient):
     A wrapper around the cvs tool that fetches repository
     information and generates compatible diffs.
     """
+    install_checks = ['cvs']
+
     def __init__(self, **kwargs):
         super(CVSClient, self).__init__(**kwargs)
 
+    def get_repository_markers(self):
+        return [os.path.join("CVS", "Root")]
+
     def get_repository_info(self):
         if not check_install("cvs"):
             return None
@@ -1,11 +1,44 @@
+import logging
 import os
 import re
+import string
 import sys
+import tempfile
 
 from rbtools.clients import SCMClient, RepositoryInfo
+from rbtools.clients.gitobjects import CatFileObjectStore, GitObjectError, \
+                                      Repository
 from rbtools.clients.svn import SVNClient, SVNRepositoryInfo
 from rbtools.utils.checks import check_install
-from rbtools.utils.process import die, execute
+from rbtools.utils.process import die, execute, execute_stream
+
+
+# Run git for everything.
+GIT_SUBPROCESS = 'git'
+
+# Read merge bases, logs and diffs between commits from the repository
+# directly, running git only for what the native reader doesn't support.
+GIT_NATIVE = 'native'
+
+GIT_BACKENDS = (GIT_SUBPROCESS, GIT_NATIVE)
+
+# The characters str.strip() removes, for spotting padded header lines.
+_WHITESPACE = frozenset(string.whitespace)
+
+# The diff settings that don't change the output of a diff between two
+# commits, or that the native backend handles itself.
+_NATIVE_DIFF_CONFIG = frozenset([
+    'diff.renames',
+    'diff.renamelimit',
+    'diff.tool',
+    'diff.guitool',
+])
+
+# The log formats the native backend can produce.
+_NATIVE_LOG_FORMATS = ('%s', '%s%n%n%b')
+
+# The line git-svn adds to the messages of commits it imports from svn.
+_GIT_SVN_ID_RE = re.compile(r'^\s*git-svn-id:\s+(.*)@(\d+)\s([a-f\d\-]+)$')
 
 
 class GitClient(SCMClient):
@@ -14,11 +47,114 @@ class GitClient(SCMClient):
     compatible diffs. This will attempt to generate a diff suitable for the
     remote repository, whether git, SVN or Perforce.
     """
+    install_checks = ['git --help']
+    # The config itself isn't cached, since it can come from files (system,
+    # XDG and included configs) that the cache isn't invalidated by.
+    cached_attributes = ['git', 'bare', 'head_ref', 'type', 'upstream_branch',
+                         '_git_dir']
+
+    if sys.platform.startswith('win'):
+        install_checks.append('git.cmd --help')
+
     def __init__(self, **kwargs):
         super(GitClient, self).__init__(**kwargs)
         # Store the 'correct' way to invoke git, just plain old 'git' by
         # default.
         self.git = 'git'
+        self._git_config = None
+        self._git_dir = None
+        self._repository = None
+        self._cat_file_repository = None
+
+    def get_repository_markers(self):
+        if 'GIT_DIR' in os.environ:
+            # The repository could be anywhere, so leave it to git.
+            return None
+
+        # HEAD catches bare repositories.
+        return ['.git', 'HEAD']
+
+    def get_repository_cache_files(self, root):
+        git_dir = os.path.join(root, '.git')
+
+        # Bare repositories and worktrees aren't worth the trouble, and
+        # git-svn's tracking branch depends on the history, not just the
+        # config.
+        if (not os.path.isdir(git_dir) or
+            os.path.isdir(os.path.join(git_dir, 'svn'))):
+            return None
+
+        return [
+            os.path.join(git_dir, 'config'),
+            os.path.join(git_dir, 'HEAD'),
+            os.path.expanduser(os.path.join('~', '.gitconfig')),
+        ]
+
+    def get_config(self, key, default=''):
+        """
+        Returns the value of a git config variable, or default if it isn't
+        set.
+
+        The whole config is read with a single 'git config --list' the
+        first time this is called, and every later lookup is served from
+        memory.
+        """
+        if self._git_config is None:
+            self._git_config = self._load_config()
+
+        return self._git_config.get(self._normalize_config_key(key), default)
+
+    def _load_config(self):
+        """
+        Returns a dictionary of all git config variables. Where a variable
+        is set more than once, the last value wins, as with
+        'git config --get'.
+        """
+        data = execute([self.git, 'config', '--list', '-z'],
+                       ignore_errors=True, translate_newlines=False,
+                       with_errors=False)
+        config = {}
+
+        # Each entry is the key and value separated by a newline. Boolean
+        # variables set without a value have no newline.
+        for entry in data.split('\0'):
+            if entry:
+                key, _, value = entry.partition('\n')
+                config[self._normalize_config_key(key)] = value
+
+        return config
+
+    def _normalize_config_key(self, key):
+        # Section and variable names are case-insensitive, and git lists
+        # them in lowercase. Subsection names are case-sensitive.
+        section, _, rest = key.partition('.')
+        subsection, _, name = rest.rpartition('.')
+
+        if subsection:
+            return '%s.%s.%s' % (section.lower(), subsection, name.lower())
+        else:
+            return '%s.%s' % (section.lower(), name.lower())
+
+    def _read_head_ref(self, git_dir):
+        """
+        Returns the ref HEAD points to, or '' if it's detached, reading
+        HEAD directly rather than running 'git symbolic-ref'.
+        """
+        try:
+            fp = open(os.path.join(git_dir, 'HEAD'), 'r')
+
+            try:
+                head = fp.read().strip()
+            finally:
+                fp.close()
+        except IOError:
+            return execute([self.git, 'symbolic-ref', '-q', 'HEAD'],
+                           ignore_errors=True).strip()
+
+        if head.startswith('ref: '):
+            return head[5:].strip()
+
+        return ''
 
     def _strip_heads_prefix(self, ref):
         """ Strips prefix from ref name, if possible """
@@ -40,17 +176,18 @@ class GitClient(SCMClient):
 
         if git_dir.startswith("fatal:") or not os.path.isdir(git_dir):
             return None
-        self.bare = execute([self.git, "config",
-                             "core.bare"]).strip() == 'true'
+
+        # Everything else is looked up in the config, which is read once.
+        self._git_config = None
+        self._git_dir = os.path.abspath(git_dir)
+        self.bare = self.get_config('core.bare').strip() == 'true'
+        self.head_ref = self._read_head_ref(git_dir)
 
         # post-review in directories other than the top level of
         # of a work-tree would result in broken diffs on the server
         if not self.bare:
             os.chdir(os.path.dirname(os.path.abspath(git_dir)))
 
-        self.head_ref = execute([self.git, 'symbolic-ref', '-q',
-                                 'HEAD']).strip()
-
         # We know we have something we can work with. Let's find out
         # what it is. We'll try SVN first, but only if there's a .git/svn
         # directory. Otherwise, it may attempt to create one and scan
@@ -104,9 +241,7 @@ class GitClient(SCMClient):
                                   ignore_errors=True)
                 version_parts = re.search('version (\d+)\.(\d+)\.(\d+)',
                                           version)
-                svn_remote = execute([self.git, "config", "--get",
-                                      "svn-remote.svn.url"],
-                                      ignore_errors=True)
+                svn_remote = self.get_config('svn-remote.svn.url')
 
                 if (version_parts and
                     not self.is_valid_version((int(version_parts.group(1)),
@@ -123,12 +258,8 @@ class GitClient(SCMClient):
         # Nope, it's git then.
         # Check for a tracking branch and determine merge-base
         short_head = self._strip_heads_prefix(self.head_ref)
-        merge = execute([self.git, 'config', '--get',
-                         'branch.%s.merge' % short_head],
-                        ignore_errors=True).strip()
-        remote = execute([self.git, 'config', '--get',
-                          'branch.%s.remote' % short_head],
-                         ignore_errors=True).strip()
+        merge = self.get_config('branch.%s.merge' % short_head).strip()
+        remote = self.get_config('branch.%s.remote' % short_head).strip()
 
         merge = self._strip_heads_prefix(merge)
         self.upstream_branch = ''
@@ -171,9 +302,7 @@ class GitClient(SCMClient):
                            default_upstream_branch or
                            'origin/master')
         upstream_remote = upstream_branch.split('/')[0]
-        origin_url = execute([self.git, "config", "--get",
-                              "remote.%s.url" % upstream_remote],
-                              ignore_errors=True).rstrip("\n")
+        origin_url = self.get_config('remote.%s.url' % upstream_remote)
         return (upstream_branch, origin_url)
 
     def is_valid_version(self, actual, expected):
@@ -197,8 +326,7 @@ class GitClient(SCMClient):
             return server_url
 
         # TODO: Maybe support a server per remote later? Is that useful?
-        url = execute([self.git, "config", "--get", "reviewboard.url"],
-                      ignore_errors=True).strip()
+        url = self.get_config('reviewboard.url').strip()
         if url:
             return url
 
@@ -219,9 +347,7 @@ class GitClient(SCMClient):
         """
         parent_branch = self._options.parent_branch
 
-        self.merge_base = execute([self.git, "merge-base",
-                                   self.upstream_branch,
-                                   self.head_ref]).strip()
+        self.merge_base = self._get_merge_base()
 
         if parent_branch:
             diff_lines = self.make_diff(parent_branch)
@@ -231,15 +357,12 @@ class GitClient(SCMClient):
             parent_diff_lines = None
 
         if self._options.guess_summary and not self._options.summary:
-            s = execute([self.git, "log", "--pretty=format:%s", "HEAD^.."],
-                              ignore_errors=True)
+            s = self._get_log("%s", "HEAD^..")
             self._options.summary = s.replace('\n', ' ').strip()
 
         if self._options.guess_description and not self._options.description:
-            self._options.description = execute(
-                [self.git, "log", "--pretty=format:%s%n%n%b",
-                 (parent_branch or self.merge_base) + ".."],
-                ignore_errors=True).strip()
+            self._options.description = self._get_log(
+                "%s%n%n%b", (parent_branch or self.merge_base) + "..").strip()
 
         return (diff_lines, parent_diff_lines)
 
@@ -253,81 +376,253 @@ class GitClient(SCMClient):
             rev_range = ancestor
 
         if self.type == "svn":
-            diff_lines = execute([self.git, "diff", "--no-color",
-                                  "--no-prefix", "--no-ext-diff", "-r", "-u",
-                                  rev_range],
-                                 split_lines=True)
+            diff_lines = execute_stream([self.git, "diff", "--no-color",
+                                         "--no-prefix", "--no-ext-diff", "-r",
+                                         "-u", rev_range])
             return self.make_svn_diff(ancestor, diff_lines)
         elif self.type == "git":
+            if commit:
+                diff = self._run_native(self._make_native_diff, ancestor,
+                                        commit)
+
+                if diff is not None:
+                    return diff
+
             return execute([self.git, "diff", "--no-color", "--full-index",
                             "--no-ext-diff", rev_range])
 
         return None
 
+    def _get_merge_base(self):
+        """Returns the merge base of the upstream branch and HEAD."""
+        merge_base = self._run_native(self._get_native_merge_base)
+
+        if merge_base is None:
+            merge_base = execute([self.git, "merge-base",
+                                  self.upstream_branch,
+                                  self.head_ref]).strip()
+
+        return merge_base
+
+    def _get_log(self, pretty_format, rev_range):
+        """
+        Returns the log of the commits in a range ("A.." or "A..B"), as
+        'git log --pretty=format:<pretty_format>' formats it.
+        """
+        log = None
+
+        if pretty_format in _NATIVE_LOG_FORMATS:
+            log = self._run_native(self._get_native_log, pretty_format,
+                                   rev_range, use_cat_file=True)
+
+        if log is None:
+            log = execute([self.git, "log", "--pretty=format:" + pretty_format,
+                           rev_range], ignore_errors=True)
+
+        return log
+
+    def _run_native(self, func, *args, **kwargs):
+        """
+        Calls func with a Repository for reading objects without running a
+        git command each time. Returns None if there isn't one, or if it
+        doesn't support what's needed, in which case git should be run
+        instead.
+
+        With the native backend, objects are read from the repository
+        directly. Otherwise, if use_cat_file is True, they're read through
+        a persistent 'git cat-file --batch', shared by every call.
+        """
+        use_cat_file = kwargs.get('use_cat_file', False)
+
+        if not self._git_dir:
+            return None
+
+        try:
+            if getattr(self._options, 'git_backend', None) == GIT_NATIVE:
+                if self._repository is None:
+                    self._repository = Repository(self._git_dir)
+
+                repository = self._repository
+            elif use_cat_file:
+                if self._cat_file_repository is None:
+                    self._cat_file_repository = Repository(
+                        self._git_dir, CatFileObjectStore(self.git))
+
+                repository = self._cat_file_repository
+            else:
+                return None
+
+            return func(repository, *args)
+        except GitObjectError, e:
+            logging.debug("Running git, since the objects can't be read: %s"
+                          % e)
+            return None
+
+    def _get_native_merge_base(self, repository):
+        return repository.merge_base(repository.resolve(self.upstream_branch),
+                                     repository.resolve(self.head_ref))
+
+    def _get_native_log(self, repository, pretty_format, rev_range):
+        if self.get_config('i18n.logoutputencoding'):
+            raise GitObjectError('i18n.logOutputEncoding is not supported')
+
+        exclude, include = rev_range.split('..', 1)
+        commits = repository.log(repository.resolve(include or 'HEAD'),
+                                 repository.resolve(exclude or 'HEAD'))
+        entries = []
+
+        for commit in commits:
+            if commit.encoding and commit.encoding.lower() not in ('utf-8',
+                                                                   'utf8'):
+                raise GitObjectError('Commit %s is in %s' % (commit.sha,
+                                                             commit.encoding))
+
+            entry = commit.get_subject()
+
+            if pretty_format == '%s%n%n%b':
+                entry += '\n\n' + commit.get_body()
+
+            entries.append(entry)
+
+        return '\n'.join(entries)
+
+    def _find_svn_rev(self, repository, rev):
+        """
+        Returns the svn revision a commit was imported from, as
+        'git svn find-rev' does, from the last git-svn-id line in its
+        message.
+        """
+        commit = repository.get_commit(repository.resolve(rev))
+        m = None
+
+        for line in commit.message.splitlines():
+            if line.startswith('git-svn-id: '):
+                m = _GIT_SVN_ID_RE.match(line)
+
+        if not m:
+            raise GitObjectError('%s was not imported from svn' % rev)
+
+        return m.group(2)
+
+    def _make_native_diff(self, repository, ancestor, commit):
+        detect_renames = (self.get_config('diff.renames').lower() not in
+                          ('false', 'no', 'off', '0'))
+
+        for key in self._git_config:
+            if ((key.startswith('diff.') and key not in _NATIVE_DIFF_CONFIG) or
+                key == 'core.attributesfile'):
+                raise GitObjectError('%s is not supported' % key)
+
+        if os.path.exists(os.path.join(self._git_dir, 'info', 'attributes')):
+            raise GitObjectError('info/attributes is not supported')
+
+        return repository.diff(repository.resolve(ancestor),
+                               repository.resolve(commit), detect_renames)
+
     def make_svn_diff(self, parent_branch, diff_lines):
         """
         Formats the output of git diff such that it's in a form that
         svn diff would generate. This is needed so the SVNTool in Review
         Board can properly parse this diff.
         """
-        rev = execute([self.git, "svn", "find-rev", parent_branch]).strip()
+        rev = self._run_native(self._find_svn_rev, parent_branch,
+                               use_cat_file=True)
+
+        if rev is None:
+            rev = execute([self.git, "svn", "find-rev", parent_branch]).strip()
 
         if not rev:
             return None
 
-        diff_data = ""
-        filename = ""
+        return self.convert_svn_diff(diff_lines, rev)
+
+    def convert_svn_diff(self, diff_lines, rev):
+        """
+        Returns a git diff against the given Subversion revision, converted
+        to svn diff format.
+
+        The converted pieces are written to a temporary file as they're
+        produced and read back as one string, so that, with the lines
+        streamed in from git, only the finished diff is held in memory.
+        """
+        fp = tempfile.TemporaryFile()
+
+        try:
+            fp.writelines(self.iter_svn_diff(diff_lines, rev))
+            fp.seek(0)
+
+            return fp.read()
+        finally:
+            fp.close()
+
+    def iter_svn_diff(self, diff_lines, rev):
+        """
+        Converts the lines of a git diff against the given Subversion
+        revision to svn diff format, yielding the result in pieces.
+
+        The diff is converted as it's read, so it never has to be held in
+        memory as a whole. Lines are dispatched on their first character,
+        so the hunk lines that make up most of a diff need only one or two
+        checks.
+        """
         newfile = False
 
         for line in diff_lines:
-            if line.startswith("diff "):
+            c = line[:1]
+
+            if c == "+":
+                if line.startswith("+++ "):
+                    filename = line[4:].strip()
+                    if newfile:
+                        yield "--- %s\t(revision 0)\n" % filename
+                        yield "+++ %s\t(revision 0)\n" % filename
+                    else:
+                        # We already printed the "--- " line.
+                        yield "+++ %s\t(working copy)\n" % filename
+                else:
+                    yield line
+            elif c == "-":
+                if not line.startswith("--- "):
+                    yield line
+                elif line.strip() == "--- /dev/null":
+                    # New file
+                    newfile = True
+                else:
+                    newfile = False
+                    yield "--- %s\t(revision %s)\n" % (line[4:].strip(),
+                                                        rev)
+            elif c in _WHITESPACE:
+                # Context lines. Like any other line, these are dropped if
+                # they're a "--- /dev/null" padded with whitespace.
+                if line.strip() == "--- /dev/null":
+                    newfile = True
+                else:
+                    yield line
+            elif c == "d" and line.startswith("diff "):
                 # Grab the filename and then filter this out.
                 # This will be in the format of:
                 #
                 # diff --git a/path/to/file b/path/to/file
                 info = line.split(" ")
-                diff_data += "Index: %s\n" % info[2]
-                diff_data += "=" * 67
-                diff_data += "\n"
-            elif line.startswith("index "):
-                # Filter this out.
+                yield "Index: %s\n%s\n" % (info[2], "=" * 67)
+            elif ((c == "i" and line.startswith("index ")) or
+                  (c == "n" and line.startswith("new file mode"))):
+                # Filter these out.
                 pass
-            elif line.strip() == "--- /dev/null":
-                # New file
-                newfile = True
-            elif line.startswith("--- "):
-                newfile = False
-                diff_data += "--- %s\t(revision %s)\n" % \
-                             (line[4:].strip(), rev)
-            elif line.startswith("+++ "):
-                filename = line[4:].strip()
-                if newfile:
-                    diff_data += "--- %s\t(revision 0)\n" % filename
-                    diff_data += "+++ %s\t(revision 0)\n" % filename
-                else:
-                    # We already printed the "--- " line.
-                    diff_data += "+++ %s\t(working copy)\n" % filename
-            elif line.startswith("new file mode"):
-                # Filter this out.
-                pass
-            elif line.startswith("Binary files "):
+            elif c == "B" and line.startswith("Binary files "):
                 # Add the following so that we know binary files were
                 # added/changed.
-                diff_data += "Cannot display: file marked as a binary type.\n"
-                diff_data += "svn:mime-type = application/octet-stream\n"
+                yield ("Cannot display: file marked as a binary type.\n"
+                       "svn:mime-type = application/octet-stream\n")
             else:
-                diff_data += line
-
-        return diff_data
+                yield line
 
     def diff_between_revisions(self, revision_range, args, repository_info):
         """Perform a diff between two arbitrary revisions"""
 
         # Make a parent diff to the first of the revisions so that we
         # never end up with broken patches:
-        self.merge_base = execute([self.git, "merge-base",
-                                   self.upstream_branch,
-                                   self.head_ref]).strip()
+        self.merge_base = self._get_merge_base()
 
         if ":" not in revision_range:
             # only one revision is specified
@@ -343,16 +638,13 @@ class GitClient(SCMClient):
                                                    revision_range)
 
             if self._options.guess_summary and not self._options.summary:
-                s = execute([self.git, "log", "--pretty=format:%s",
-                             revision_range + ".."], ignore_errors=True)
+                s = self._get_log("%s", revision_range + "..")
                 self._options.summary = s.replace('\n', ' ').strip()
 
             if (self._options.guess_description and
                 not self._options.description):
-                self._options.description = execute(
-                    [self.git, "log", "--pretty=format:%s%n%n%b",
-                     revision_range + ".."],
-                    ignore_errors=True).strip()
+                self._options.description = self._get_log(
+                    "%s%n%n%b", revision_range + "..").strip()
 
             return (self.make_diff(revision_range), parent_diff_lines)
         else:
@@ -367,15 +659,12 @@ class GitClient(SCMClient):
                 parent_diff_lines = self.make_diff(self.merge_base, r1)
 
             if self._options.guess_summary and not self._options.summary:
-                s = execute([self.git, "log", "--pretty=format:%s",
-                             "%s..%s" % (r1, r2)], ignore_errors=True)
+                s = self._get_log("%s", "%s..%s" % (r1, r2))
                 self._options.summary = s.replace('\n', ' ').strip()
 
             if (self._options.guess_description and
                 not self._options.description):
-                self._options.description = execute(
-                    [self.git, "log", "--pretty=format:%s%n%n%b",
-                     "%s..%s" % (r1, r2)],
-                    ignore_errors=True).strip()
+                self._options.description = self._get_log(
+                    "%s%n%n%b", "%s..%s" % (r1, r2)).strip()
 
             return (self.make_diff(r1, r2), parent_diff_lines)
@@ -0,0 +1,842 @@
+import heapq
+import os
+import re
+import zlib
+from binascii import hexlify, unhexlify
+
+from rbtools.clients.gitpack import GitObjectError, PackFile, PackIndex
+from rbtools.utils.diff import diff_text
+from rbtools.utils.process import BatchProcess
+
+
+NULL_SHA1 = '0' * 40
+
+# git only looks at the start of a file when deciding whether it's binary.
+_BINARY_CHECK_SIZE = 8000
+
+# The longest function heading git puts in a hunk header.
+_FUNCTION_WIDTH = 80
+
+_SHA1_RE = re.compile(r'^[0-9a-f]{40}$')
+_REV_RE = re.compile(r'^(?P<name>[^^~]+)(?P<suffix>(?:[\^~]\d*)*)$')
+_REV_SUFFIX_RE = re.compile(r'([\^~])(\d*)')
+
+# Flags used when walking history.
+_PARENT1 = 1
+_PARENT2 = 2
+_STALE = 4
+_RESULT = 8
+_UNINTERESTING = 16
+
+
+class Commit(object):
+    """A parsed commit object."""
+    def __init__(self, sha, data):
+        self.sha = sha
+        self.tree = None
+        self.parents = []
+        self.date = 0
+        self.encoding = None
+
+        headers, _, self.message = data.partition('\n\n')
+
+        for line in headers.split('\n'):
+            if line.startswith(' '):
+                # A continuation of a multi-line header, such as gpgsig.
+                continue
+
+            key, _, value = line.partition(' ')
+
+            if key == 'tree':
+                self.tree = value
+            elif key == 'parent':
+                self.parents.append(value)
+            elif key == 'committer':
+                try:
+                    self.date = int(value.rsplit(' ', 2)[1])
+                except (IndexError, ValueError):
+                    raise GitObjectError('Invalid committer in commit %s'
+                                         % sha)
+            elif key == 'encoding':
+                self.encoding = value
+
+    def get_subject(self):
+        """Returns the subject, as git log's %s placeholder formats it."""
+        return ' '.join(self._split_message()[0])
+
+    def get_body(self):
+        """Returns the body, as git log's %b placeholder formats it."""
+        return self._split_message()[1]
+
+    def _split_message(self):
+        lines = self.message.splitlines(True)
+        i = 0
+
+        while i < len(lines) and not lines[i].strip():
+            i += 1
+
+        subject = []
+
+        while i < len(lines) and lines[i].strip():
+            subject.append(lines[i].rstrip())
+            i += 1
+
+        while i < len(lines) and not lines[i].strip():
+            i += 1
+
+        return subject, ''.join(lines[i:])
+
+
+class ObjectStore(object):
+    """
+    Reads objects from a repository's object directory, whether they're
+    loose or packed, along with any alternate object directories.
+    """
+    def __init__(self, objects_dir):
+        self.objects_dir = objects_dir
+        self._packs = None
+        self._alternates = None
+
+    def close(self):
+        for pack in self._packs or []:
+            pack.close()
+
+        for alternate in self._alternates or []:
+            alternate.close()
+
+    def read(self, sha):
+        """Returns the type and contents of the object with the given ID."""
+        if not _SHA1_RE.match(sha):
+            raise GitObjectError('Invalid object ID %s' % sha)
+
+        return self.read_binsha(unhexlify(sha))
+
+    def read_binsha(self, binsha):
+        """Returns the type and contents of an object, by its binary ID."""
+        result = self._read_local(binsha)
+
+        if result is None:
+            for alternate in self._get_alternates():
+                result = alternate._read_local(binsha)
+
+                if result is not None:
+                    break
+
+        if result is None:
+            raise GitObjectError('Object %s not found' % hexlify(binsha))
+
+        return result
+
+    def _read_local(self, binsha):
+        # Like git, look in the packs first, since that's where most objects
+        # are in any repository large enough for lookups to matter.
+        for pack in self._get_packs():
+            offset = pack.find(binsha)
+
+            if offset is not None:
+                return pack.read(offset, self)
+
+        sha = hexlify(binsha)
+        path = os.path.join(self.objects_dir, sha[:2], sha[2:])
+
+        try:
+            fp = open(path, 'rb')
+        except IOError:
+            return None
+
+        try:
+            try:
+                data = zlib.decompress(fp.read())
+            except zlib.error, e:
+                raise GitObjectError('Corrupt object %s: %s' % (sha, e))
+        finally:
+            fp.close()
+
+        header, _, data = data.partition('\0')
+
+        return header.split(' ')[0], data
+
+    def _get_packs(self):
+        if self._packs is None:
+            pack_dir = os.path.join(self.objects_dir, 'pack')
+            self._packs = []
+
+            if os.path.isdir(pack_dir):
+                for filename in sorted(os.listdir(pack_dir)):
+                    if filename.endswith('.idx'):
+                        base = os.path.join(pack_dir, filename[:-4])
+
+                        if os.path.exists(base + '.pack'):
+                            self._packs.append(
+                                PackFile(base + '.pack',
+                                         PackIndex(base + '.idx')))
+
+        return self._packs
+
+    def _get_alternates(self):
+        if self._alternates is None:
+            self._alternates = []
+            filename = os.path.join(self.objects_dir, 'info', 'alternates')
+
+            if os.path.exists(filename):
+                fp = open(filename, 'r')
+
+                try:
+                    for line in fp:
+                        line = line.strip()
+
+                        if line and not line.startswith('#'):
+                            path = os.path.join(self.objects_dir, line)
+                            self._alternates.append(ObjectStore(path))
+                finally:
+                    fp.close()
+
+        return self._alternates
+
+
+class CatFileObjectStore(object):
+    """
+    Reads objects through a long-running 'git cat-file --batch', for when
+    they aren't to be read from the repository directly. Each object costs
+    a round trip over a pipe, rather than a new git process.
+    """
+    def __init__(self, git='git'):
+        self._process = BatchProcess([git, 'cat-file', '--batch'])
+
+    def close(self):
+        self._process.close()
+
+    def read(self, sha):
+        """
+        Returns the type and contents of an object. Any object name that
+        cat-file understands may be given.
+        """
+        if not sha or sha.split() != [sha]:
+            raise GitObjectError('Invalid object name %r' % sha)
+
+        try:
+            return self._process.request(sha + '\n', self._read_response)
+        except IOError, e:
+            raise GitObjectError(str(e))
+
+    def read_binsha(self, binsha):
+        """Returns the type and contents of an object, by its binary ID."""
+        return self.read(hexlify(binsha))
+
+    def _read_response(self, process):
+        # Each object comes back as "<sha> <type> <size>", then the contents
+        # and a newline. Unknown objects get a "<name> missing" line.
+        header = process.read_line().split()
+
+        if len(header) != 3:
+            raise GitObjectError(' '.join(header))
+
+        return header[1], process.read_exactly(int(header[2]) + 1)[:-1]
+
+
+class Repository(object):
+    """
+    Reads refs, commits and trees from a git repository without running git,
+    and computes merge bases, logs and diffs from them.
+
+    Objects are read from the object directory, or through the given store,
+    such as a CatFileObjectStore. Anything that isn't supported raises
+    GitObjectError, so that callers can fall back to running git.
+    """
+    def __init__(self, git_dir, store=None):
+        self.git_dir = git_dir
+
+        for name in ('commondir', 'shallow', os.path.join('info', 'grafts')):
+            # Worktrees keep their refs elsewhere, and shallow clones and
+            # grafts change what the parents of a commit are.
+            if os.path.exists(os.path.join(git_dir, name)):
+                raise GitObjectError('Repositories using %s are not '
+                                     'supported' % name)
+
+        for name in ('GIT_OBJECT_DIRECTORY', 'GIT_ALTERNATE_OBJECT_DIRECTORIES',
+                     'GIT_REPLACE_REF_BASE'):
+            if name in os.environ:
+                raise GitObjectError('%s is not supported' % name)
+
+        if store is None:
+            store = ObjectStore(os.path.join(git_dir, 'objects'))
+
+        self.store = store
+        self._packed_refs = None
+        self._commits = {}
+
+        if self._has_replace_refs():
+            raise GitObjectError('Replacement objects are not supported')
+
+    def close(self):
+        self.store.close()
+
+    def resolve(self, rev):
+        """
+        Returns the ID of the commit a revision refers to.
+
+        Object IDs, ref names (resolved the way git does for short names),
+        and any number of ^, ^N, ~ and ~N suffixes are supported.
+        """
+        m = _REV_RE.match(rev)
+
+        if not m or ':' in rev or '@{' in rev or '{' in rev:
+            raise GitObjectError('Unsupported revision %s' % rev)
+
+        sha = self._peel(self._resolve_name(m.group('name')))
+
+        for op, num in _REV_SUFFIX_RE.findall(m.group('suffix')):
+            if num:
+                n = int(num)
+            else:
+                n = 1
+
+            if op == '^':
+                if n == 0:
+                    continue
+
+                parents = self.get_commit(sha).parents
+
+                if n > len(parents):
+                    raise GitObjectError('%s has no parent %d' % (sha, n))
+
+                sha = parents[n - 1]
+            else:
+                for i in xrange(n):
+                    parents = self.get_commit(sha).parents
+
+                    if not parents:
+                        raise GitObjectError('%s has no parent' % sha)
+
+                    sha = parents[0]
+
+        return sha
+
+    def read_ref(self, refname, depth=0):
+        """Returns the object ID a ref points to, or None if it's not set."""
+        if (depth > 5 or '..' in refname or refname.startswith('/') or
+            '\\' in refname):
+            raise GitObjectError('Unsupported ref %s' % refname)
+
+        path = os.path.join(self.git_dir, refname)
+
+        if os.path.isfile(path):
+            fp = open(path, 'r')
+
+            try:
+                value = fp.read().strip()
+            finally:
+                fp.close()
+
+            if value.startswith('ref: '):
+                return self.read_ref(value[5:].strip(), depth + 1)
+            elif _SHA1_RE.match(value):
+                return value
+            else:
+                raise GitObjectError('Invalid ref %s' % refname)
+
+        return self._get_packed_refs().get(refname)
+
+    def get_commit(self, sha):
+        """Returns the parsed commit with the given ID."""
+        commit = self._commits.get(sha)
+
+        if commit is None:
+            obj_type, data = self.store.read(sha)
+
+            if obj_type != 'commit':
+                raise GitObjectError('%s is a %s, not a commit'
+                                     % (sha, obj_type))
+
+            commit = Commit(sha, data)
+            self._commits[sha] = commit
+
+        return commit
+
+    def read_tree(self, sha):
+        """Returns the entries of a tree, as (mode, name, ID) tuples."""
+        obj_type, data = self.store.read(sha)
+
+        if obj_type != 'tree':
+            raise GitObjectError('%s is a %s, not a tree' % (sha, obj_type))
+
+        entries = []
+        i = 0
+
+        while i < len(data):
+            space = data.index(' ', i)
+            nul = data.index('\0', space)
+            entries.append((data[i:space], data[space + 1:nul],
+                            hexlify(data[nul + 1:nul + 21])))
+            i = nul + 21
+
+        return entries
+
+    def read_blob(self, sha):
+        """Returns the contents of a blob."""
+        obj_type, data = self.store.read(sha)
+
+        if obj_type != 'blob':
+            raise GitObjectError('%s is a %s, not a blob' % (sha, obj_type))
+
+        return data
+
+    def merge_base(self, sha1, sha2):
+        """
+        Returns the best common ancestor of two commits, as
+        'git merge-base' does.
+
+        This is the same walk git does, painting ancestors of each commit in
+        commit date order until only common ancestors are left, then
+        dropping any that are ancestors of the others. If there's more than
+        one best common ancestor, GitObjectError is raised, since which one
+        git picks depends on details of its implementation.
+        """
+        if sha1 == sha2:
+            return sha1
+
+        results = self._remove_redundant(
+            self._paint_down_to_common(sha1, [sha2])[0])
+
+        if not results:
+            raise GitObjectError('%s and %s have no common ancestor'
+                                 % (sha1, sha2))
+        elif len(results) > 1:
+            raise GitObjectError('%s and %s have more than one merge base'
+                                 % (sha1, sha2))
+
+        return results[0]
+
+    def log(self, include, exclude):
+        """
+        Returns the commits reachable from include but not from exclude, in
+        the order 'git log exclude..include' lists them.
+        """
+        flags = {}
+        queue = _CommitQueue(self, flags, _UNINTERESTING)
+        queue.add_flags(exclude, _UNINTERESTING)
+        queue.push(include)
+        queue.push(exclude)
+        seen = set([include, exclude])
+        processed = set()
+        results = []
+
+        # Like git, carry on for a few commits after only uninteresting ones
+        # are left, in case commit dates are skewed.
+        slop = 5
+
+        while len(queue):
+            if not queue.pending:
+                slop -= 1
+
+                if slop < 0:
+                    break
+            else:
+                slop = 5
+
+            commit = queue.pop()
+            processed.add(commit.sha)
+
+            if flags[commit.sha] & _UNINTERESTING:
+                self._mark_uninteresting(commit, queue, processed)
+            else:
+                results.append(commit)
+
+            for parent in commit.parents:
+                if parent not in seen:
+                    seen.add(parent)
+
+                    if flags[commit.sha] & _UNINTERESTING:
+                        queue.add_flags(parent, _UNINTERESTING)
+
+                    queue.push(parent)
+
+        return [commit for commit in results
+                if not flags[commit.sha] & _UNINTERESTING]
+
+    def diff_trees(self, old_tree, new_tree, path=''):
+        """
+        Returns the differences between two trees, in the order git lists
+        them, as (path, old_mode, old_sha, new_mode, new_sha) tuples. The
+        mode and ID are None on the side where a file doesn't exist.
+        """
+        if old_tree:
+            old_entries = self.read_tree(old_tree)
+        else:
+            old_entries = []
+
+        if new_tree:
+            new_entries = self.read_tree(new_tree)
+        else:
+            new_entries = []
+
+        for mode, name, sha in old_entries + new_entries:
+            if name == '.gitattributes':
+                raise GitObjectError('.gitattributes files are not supported')
+            elif mode == '160000':
+                raise GitObjectError('Submodules are not supported')
+
+        old_entries = [(_get_tree_order_key(entry), entry)
+                       for entry in old_entries]
+        new_entries = [(_get_tree_order_key(entry), entry)
+                       for entry in new_entries]
+        changes = []
+        i = 0
+        j = 0
+
+        while i < len(old_entries) or j < len(new_entries):
+            if (j == len(new_entries) or
+                (i < len(old_entries) and
+                 old_entries[i][0] < new_entries[j][0])):
+                old = old_entries[i][1]
+                new = None
+                i += 1
+            elif (i == len(old_entries) or
+                  new_entries[j][0] < old_entries[i][0]):
+                old = None
+                new = new_entries[j][1]
+                j += 1
+            else:
+                old = old_entries[i][1]
+                new = new_entries[j][1]
+                i += 1
+                j += 1
+
+                if old == new:
+                    continue
+
+            entry = old or new
+            entry_path = path + entry[1]
+
+            if entry[0] == '40000':
+                changes.extend(self.diff_trees(old and old[2], new and new[2],
+                                               entry_path + '/'))
+            elif old and new:
+                old_mode = _canonicalize_mode(old[0])
+                new_mode = _canonicalize_mode(new[0])
+
+                if (old_mode == '120000') != (new_mode == '120000'):
+                    raise GitObjectError('Changes between files and '
+                                         'symlinks are not supported')
+
+                changes.append((entry_path, old_mode, old[2], new_mode,
+                                new[2]))
+            elif old:
+                changes.append((entry_path, _canonicalize_mode(old[0]),
+                                old[2], None, None))
+            else:
+                changes.append((entry_path, None, None,
+                                _canonicalize_mode(new[0]), new[2]))
+
+        return changes
+
+    def diff(self, old_commit, new_commit, detect_renames=True):
+        """
+        Returns the differences between two commits as a string, formatted
+        the way 'git diff --full-index' formats them.
+
+        git looks for renames by default. If the diff adds some files and
+        deletes others, and detect_renames is True, GitObjectError is raised,
+        since renames aren't detected here.
+
+        The hunks come from rbtools.utils.diff's builtin engine, a port of
+        GNU diff's algorithm, rather than from git's xdiff. Where a change
+        can be aligned more than one way, they occasionally differ from
+        git's, but they always describe the same change.
+        """
+        changes = self.diff_trees(self.get_commit(old_commit).tree,
+                                  self.get_commit(new_commit).tree)
+
+        if (detect_renames and
+            [change for change in changes if change[2] is None] and
+            [change for change in changes if change[4] is None]):
+            raise GitObjectError('Diffs that may contain renames are not '
+                                 'supported')
+
+        result = []
+
+        for change in changes:
+            result.extend(self._format_change(*change))
+
+        return ''.join(result)
+
+    def _format_change(self, path, old_mode, old_sha, new_mode, new_sha):
+        for c in path:
+            if c < ' ' or c in '"\\\x7f' or c >= '\x80':
+                raise GitObjectError('Paths that git would quote are not '
+                                     'supported')
+
+        lines = ['diff --git a/%s b/%s\n' % (path, path)]
+
+        if old_sha is None:
+            lines.append('new file mode %s\n' % new_mode)
+            lines.append('index %s..%s\n' % (NULL_SHA1, new_sha))
+            old_data = ''
+            old_label = '/dev/null'
+        else:
+            old_data = self.read_blob(old_sha)
+            old_label = 'a/' + path
+
+        if new_sha is None:
+            lines.append('deleted file mode %s\n' % old_mode)
+            lines.append('index %s..%s\n' % (old_sha, NULL_SHA1))
+            new_data = ''
+            new_label = '/dev/null'
+        else:
+            new_data = self.read_blob(new_sha)
+            new_label = 'b/' + path
+
+        if old_sha is not None and new_sha is not None:
+            if old_mode != new_mode:
+                lines.append('old mode %s\n' % old_mode)
+                lines.append('new mode %s\n' % new_mode)
+
+                if old_sha == new_sha:
+                    return lines
+
+                lines.append('index %s..%s\n' % (old_sha, new_sha))
+            else:
+                lines.append('index %s..%s %s\n' % (old_sha, new_sha,
+                                                    new_mode))
+
+        if ('\0' in old_data[:_BINARY_CHECK_SIZE] or
+            '\0' in new_data[:_BINARY_CHECK_SIZE]):
+            lines.append('Binary files %s and %s differ\n'
+                         % (old_label, new_label))
+        else:
+            # git marks names containing spaces with a trailing tab.
+            if ' ' in path:
+                if old_sha is not None:
+                    old_label += '\t'
+
+                if new_sha is not None:
+                    new_label += '\t'
+
+            lines.extend(diff_text(old_data, new_data, old_label, new_label,
+                                   show_function=True,
+                                   function_width=_FUNCTION_WIDTH))
+
+        return lines
+
+    def _resolve_name(self, name):
+        if _SHA1_RE.match(name):
+            return name
+
+        # These are the rules git uses to find a ref from a short name.
+        for refname in (name,
+                        'refs/%s' % name,
+                        'refs/tags/%s' % name,
+                        'refs/heads/%s' % name,
+                        'refs/remotes/%s' % name,
+                        'refs/remotes/%s/HEAD' % name):
+            if refname == name and not (name == 'HEAD' or
+                                        name.startswith('refs/')):
+                continue
+
+            sha = self.read_ref(refname)
+
+            if sha:
+                return sha
+
+        raise GitObjectError('Unknown revision %s' % name)
+
+    def _peel(self, sha):
+        """Follows annotated tags to the commit they point to."""
+        for i in xrange(10):
+            obj_type, data = self.store.read(sha)
+
+            if obj_type == 'commit':
+                return sha
+            elif obj_type != 'tag':
+                raise GitObjectError('%s is a %s, not a commit'
+                                     % (sha, obj_type))
+
+            sha = data.split('\n', 1)[0].split(' ', 1)[1]
+
+        raise GitObjectError('Too many levels of tags at %s' % sha)
+
+    def _get_packed_refs(self):
+        if self._packed_refs is None:
+            self._packed_refs = {}
+            filename = os.path.join(self.git_dir, 'packed-refs')
+
+            if os.path.exists(filename):
+                fp = open(filename, 'r')
+
+                try:
+                    for line in fp:
+                        if line.startswith('#') or line.startswith('^'):
+                            continue
+
+                        parts = line.rstrip('\n').split(' ', 1)
+
+                        if len(parts) == 2:
+                            self._packed_refs[parts[1]] = parts[0]
+                finally:
+                    fp.close()
+
+        return self._packed_refs
+
+    def _has_replace_refs(self):
+        replace_dir = os.path.join(self.git_dir, 'refs', 'replace')
+
+        if os.path.isdir(replace_dir) and os.listdir(replace_dir):
+            return True
+
+        for refname in self._get_packed_refs():
+            if refname.startswith('refs/replace/'):
+                return True
+
+        return False
+
+    def _paint_down_to_common(self, one, twos):
+        """
+        Walks back from one and twos in commit date order, marking the
+        ancestors of one with _PARENT1 and those of twos with _PARENT2,
+        until only common ancestors are left to walk. Returns the common
+        ancestors found that weren't walked past, and the flags.
+        """
+        flags = {}
+        queue = _CommitQueue(self, flags, _STALE)
+        queue.add_flags(one, _PARENT1)
+        queue.push(one)
+
+        for two in twos:
+            queue.add_flags(two, _PARENT2)
+            queue.push(two)
+
+        results = []
+
+        while queue.pending:
+            commit = queue.pop()
+            commit_flags = flags[commit.sha] & (_PARENT1 | _PARENT2 | _STALE)
+
+            if commit_flags == _PARENT1 | _PARENT2:
+                if not flags[commit.sha] & _RESULT:
+                    queue.add_flags(commit.sha, _RESULT)
+                    results.append(commit.sha)
+
+                commit_flags |= _STALE
+
+            for parent in commit.parents:
+                if flags.get(parent, 0) & commit_flags != commit_flags:
+                    queue.add_flags(parent, commit_flags)
+                    queue.push(parent)
+
+        return [sha for sha in results if not flags[sha] & _STALE], flags
+
+    def _remove_redundant(self, shas):
+        """
+        Removes the commits that are ancestors of others in the list, as
+        git does with merge base candidates.
+        """
+        redundant = set()
+
+        for sha in shas:
+            if sha in redundant:
+                continue
+
+            others = [other for other in shas
+                      if other != sha and other not in redundant]
+
+            if not others:
+                break
+
+            flags = self._paint_down_to_common(sha, others)[1]
+
+            if flags[sha] & _PARENT2:
+                # It can be reached from one of the others.
+                redundant.add(sha)
+
+            for other in others:
+                if flags[other] & _PARENT1:
+                    redundant.add(other)
+
+        return [sha for sha in shas if sha not in redundant]
+
+    def _mark_uninteresting(self, commit, queue, processed):
+        """
+        Marks the ancestors of an uninteresting commit as uninteresting,
+        including those that have already been walked past.
+        """
+        flags = queue.flags
+        stack = [commit]
+
+        while stack:
+            commit = stack.pop()
+
+            for parent in commit.parents:
+                if not flags.get(parent, 0) & _UNINTERESTING:
+                    queue.add_flags(parent, _UNINTERESTING)
+
+                    if parent in processed:
+                        stack.append(self.get_commit(parent))
+
+
+class _CommitQueue(object):
+    """
+    A queue of commits, newest first by commit date. Commits with the same
+    date come out in the order they were added, as in git.
+
+    The queue also keeps the flags for the walk, and a count of the queued
+    commits that have none of done_flags set, so that the walk can tell
+    when only finished commits are left without scanning the queue. Flags
+    must be set through add_flags() for the count to stay right.
+    """
+    def __init__(self, repository, flags, done_flags):
+        self.flags = flags
+        self.pending = 0
+        self._repository = repository
+        self._done_flags = done_flags
+        self._queued = {}
+        self._heap = []
+        self._counter = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, sha):
+        commit = self._repository.get_commit(sha)
+        heapq.heappush(self._heap, (-commit.date, self._counter, commit))
+        self._counter += 1
+        self._queued[sha] = self._queued.get(sha, 0) + 1
+
+        if not self.flags.setdefault(sha, 0) & self._done_flags:
+            self.pending += 1
+
+    def pop(self):
+        commit = heapq.heappop(self._heap)[2]
+        self._queued[commit.sha] -= 1
+
+        if not self.flags[commit.sha] & self._done_flags:
+            self.pending -= 1
+
+        return commit
+
+    def add_flags(self, sha, new_flags):
+        old_flags = self.flags.get(sha, 0)
+        self.flags[sha] = old_flags | new_flags
+
+        if (not old_flags & self._done_flags and
+            new_flags & self._done_flags):
+            self.pending -= self._queued.get(sha, 0)
+
+
+def _get_tree_order_key(entry):
+    # git sorts trees as though their names ended with a slash.
+    if entry[0] == '40000':
+        return entry[1] + '/'
+
+    return entry[1]
+
+
+def _canonicalize_mode(mode):
+    # Old versions of git recorded other permissions for regular files,
+    # but git only ever shows 644 or 755.
+    if mode.startswith('100'):
+        if int(mode, 8) & 0111:
+            return '100755'
+
+        return '100644'
+
+    return mode
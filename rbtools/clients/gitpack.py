@@ -0,0 +1,361 @@
+import mmap
+import struct
+import zlib
+
+
+# The object types, as numbered in pack files.
+PACK_OBJECT_TYPES = {
+    1: 'commit',
+    2: 'tree',
+    3: 'blob',
+    4: 'tag',
+}
+OFS_DELTA = 6
+REF_DELTA = 7
+
+# The most compressed data handed to zlib at once when inflating an object.
+# Objects are inflated straight out of the mapped pack, so this only bounds
+# how far past the end of an object zlib may be given.
+_CHUNK_SIZE = 64 * 1024
+
+# Resolved delta bases are kept around, up to this many bytes in total, so
+# that objects sharing a delta chain don't each resolve it from scratch.
+_MAX_DELTA_CACHE_SIZE = 16 * 1024 * 1024
+
+_IDX_V2_SIGNATURE = '\377tOc'
+
+
+class GitObjectError(Exception):
+    """
+    Raised when something can't be read from the repository natively, either
+    because it doesn't exist or because it relies on a feature the native
+    reader doesn't support. Callers fall back to running git.
+    """
+    pass
+
+
+class PackIndex(object):
+    """
+    The index of a pack file, mapping object IDs to offsets in the pack.
+    Both version 1 and version 2 indexes are supported.
+
+    The index is memory-mapped rather than read, so a lookup only touches
+    the pages of the fanout table and the handful of IDs the binary search
+    compares against, and the pages are shared with git and with any other
+    process reading the same pack.
+    """
+    def __init__(self, filename):
+        self._map = _map_file(filename)
+        data = self._map
+
+        if len(data) < 1032:
+            self.close()
+            raise GitObjectError('%s is too short to be a pack index'
+                                 % filename)
+
+        if data[:4] == _IDX_V2_SIGNATURE:
+            version = struct.unpack_from('>I', data, 4)[0]
+
+            if version != 2:
+                self.close()
+                raise GitObjectError('Unsupported pack index version %d in '
+                                     '%s' % (version, filename))
+
+            self._fanout = struct.unpack_from('>256I', data, 8)
+            self._count = self._fanout[255]
+            self._shas_start = 1032
+            self._sha_stride = 20
+            self._offsets_start = 1032 + self._count * 24
+            self._large_offsets_start = self._offsets_start + self._count * 4
+            self._version = 2
+        else:
+            self._fanout = struct.unpack_from('>256I', data, 0)
+            self._count = self._fanout[255]
+
+            # Each entry is a 4 byte offset followed by the ID.
+            self._shas_start = 1028
+            self._sha_stride = 24
+            self._version = 1
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        self._map.close()
+
+    def find(self, binsha):
+        """Returns the offset of the object in the pack, or None."""
+        first_byte = ord(binsha[0])
+
+        if first_byte:
+            lo = self._fanout[first_byte - 1]
+        else:
+            lo = 0
+
+        hi = self._fanout[first_byte]
+        data = self._map
+        start = self._shas_start
+        stride = self._sha_stride
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = start + mid * stride
+            mid_sha = data[pos:pos + 20]
+
+            if mid_sha < binsha:
+                lo = mid + 1
+            elif mid_sha > binsha:
+                hi = mid
+            else:
+                return self._get_offset(mid)
+
+        return None
+
+    def _get_offset(self, i):
+        data = self._map
+
+        if self._version == 1:
+            return struct.unpack_from('>I', data, 1024 + i * 24)[0]
+
+        offset = struct.unpack_from('>I', data, self._offsets_start + i * 4)[0]
+
+        if offset & 0x80000000:
+            # The offset is in the table of large offsets.
+            offset = struct.unpack_from(
+                '>Q', data,
+                self._large_offsets_start + (offset & 0x7fffffff) * 8)[0]
+
+        return offset
+
+
+class PackFile(object):
+    """
+    A memory-mapped pack file, from which objects are read by their offset.
+    """
+    def __init__(self, filename, index):
+        self.index = index
+        self._map = _map_file(filename)
+        self._delta_cache = {}
+        self._delta_cache_size = 0
+
+        if self._map[:4] != 'PACK':
+            self.close()
+            raise GitObjectError('%s is not a pack file' % filename)
+
+    def close(self):
+        self._map.close()
+        self.index.close()
+
+    def find(self, binsha):
+        """Returns the offset of an object in this pack, or None."""
+        return self.index.find(binsha)
+
+    def read(self, offset, store):
+        """
+        Returns the type and contents of the object at the offset, resolving
+        any chain of deltas. Bases referred to by ID are read from the store.
+        """
+        chain = []
+
+        while True:
+            if offset in self._delta_cache:
+                obj_type, data = self._delta_cache[offset]
+                break
+
+            obj_type, base, data = self._read_entry(offset)
+
+            if obj_type == OFS_DELTA:
+                chain.append((offset, data))
+                offset = base
+            elif obj_type == REF_DELTA:
+                chain.append((offset, data))
+                obj_type, data = store.read_binsha(base)
+                break
+            elif obj_type in PACK_OBJECT_TYPES:
+                obj_type = PACK_OBJECT_TYPES[obj_type]
+                break
+            else:
+                raise GitObjectError('Unknown object type %d in pack'
+                                     % obj_type)
+
+        if chain:
+            self._cache_delta_base(offset, obj_type, data)
+
+            for offset, delta in reversed(chain):
+                data = apply_delta(data, delta)
+                self._cache_delta_base(offset, obj_type, data)
+
+        return obj_type, data
+
+    def _read_entry(self, offset):
+        data = self._map
+
+        try:
+            c = ord(data[offset])
+            obj_type = (c >> 4) & 7
+            size = c & 15
+            shift = 4
+            i = offset + 1
+
+            while c & 0x80:
+                c = ord(data[i])
+                i += 1
+                size |= (c & 0x7f) << shift
+                shift += 7
+
+            base = None
+
+            if obj_type == OFS_DELTA:
+                c = ord(data[i])
+                i += 1
+                base_offset = c & 0x7f
+
+                while c & 0x80:
+                    c = ord(data[i])
+                    i += 1
+                    base_offset = ((base_offset + 1) << 7) | (c & 0x7f)
+
+                base = offset - base_offset
+            elif obj_type == REF_DELTA:
+                base = data[i:i + 20]
+                i += 20
+        except IndexError:
+            raise GitObjectError('Truncated pack entry at offset %d' % offset)
+
+        return obj_type, base, self._inflate(i, size)
+
+    def _inflate(self, pos, size):
+        data = self._map
+        end = len(data)
+        decompressor = zlib.decompressobj()
+        chunks = []
+        total = 0
+
+        try:
+            while (total < size or not chunks) and pos < end:
+                length = min(_CHUNK_SIZE, end - pos)
+                chunk = decompressor.decompress(buffer(data, pos, length))
+                chunks.append(chunk)
+                total += len(chunk)
+                pos += length
+
+                if decompressor.unused_data:
+                    break
+        except zlib.error, e:
+            raise GitObjectError('Corrupt object in pack: %s' % e)
+
+        result = ''.join(chunks)
+
+        if len(result) != size:
+            raise GitObjectError('Corrupt object in pack at offset %d' % pos)
+
+        return result
+
+    def _cache_delta_base(self, offset, obj_type, data):
+        if self._delta_cache_size + len(data) > _MAX_DELTA_CACHE_SIZE:
+            self._delta_cache.clear()
+            self._delta_cache_size = 0
+
+            if len(data) > _MAX_DELTA_CACHE_SIZE:
+                return
+
+        if offset not in self._delta_cache:
+            self._delta_cache[offset] = (obj_type, data)
+            self._delta_cache_size += len(data)
+
+
+def apply_delta(base, delta):
+    """Applies a git delta to the base object, returning the result."""
+    base_size, i = _read_delta_size(delta, 0)
+    result_size, i = _read_delta_size(delta, i)
+
+    if base_size != len(base):
+        raise GitObjectError('Delta does not match its base')
+
+    result = []
+    delta_len = len(delta)
+
+    while i < delta_len:
+        c = ord(delta[i])
+        i += 1
+
+        if c & 0x80:
+            # Copy a range of the base. The flags say which bytes of the
+            # offset and size follow. This is unrolled, as it's the
+            # innermost loop when reading deltified objects.
+            offset = 0
+            size = 0
+
+            if c & 0x01:
+                offset = ord(delta[i])
+                i += 1
+
+            if c & 0x02:
+                offset |= ord(delta[i]) << 8
+                i += 1
+
+            if c & 0x04:
+                offset |= ord(delta[i]) << 16
+                i += 1
+
+            if c & 0x08:
+                offset |= ord(delta[i]) << 24
+                i += 1
+
+            if c & 0x10:
+                size = ord(delta[i])
+                i += 1
+
+            if c & 0x20:
+                size |= ord(delta[i]) << 8
+                i += 1
+
+            if c & 0x40:
+                size |= ord(delta[i]) << 16
+                i += 1
+
+            if size == 0:
+                size = 0x10000
+
+            result.append(base[offset:offset + size])
+        elif c:
+            # Insert new data.
+            result.append(delta[i:i + c])
+            i += c
+        else:
+            raise GitObjectError('Invalid delta')
+
+    result = ''.join(result)
+
+    if len(result) != result_size:
+        raise GitObjectError('Delta produced the wrong size')
+
+    return result
+
+
+def _read_delta_size(delta, i):
+    size = 0
+    shift = 0
+
+    while True:
+        c = ord(delta[i])
+        i += 1
+        size |= (c & 0x7f) << shift
+        shift += 7
+
+        if not c & 0x80:
+            return size, i
+
+
+def _map_file(filename):
+    fp = open(filename, 'rb')
+
+    try:
+        try:
+            return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError), e:
+            # Empty files can't be mapped, and 32-bit systems can't map
+            # very large ones.
+            raise GitObjectError('Unable to map %s: %s' % (filename, e))
+    finally:
+        fp.close()
@@ -13,6 +13,8 @@ class MercurialClient(SCMClient):
     A wrapper around the hg Mercurial tool that fetches repository
     information and generates compatible diffs.
     """
+    install_checks = ['hg --help']
+    cached_attributes = ['hgrc', '_type', '_hg_root', '_remote_path']
 
     def __init__(self, **kwargs):
         super(MercurialClient, self).__init__(**kwargs)
@@ -33,6 +35,16 @@ class MercurialClient(SCMClient):
         self._remote_path_candidates = ['reviewboard', 'origin', 'parent',
                                         'default']
 
+    def get_repository_markers(self):
+        return ['.hg']
+
+    def get_repository_cache_files(self, root):
+        return [
+            os.path.join(root, '.hg', 'hgrc'),
+            os.path.expanduser(os.path.join('~', '.hgrc')),
+            os.path.expanduser(os.path.join('~', 'mercurial.ini')),
+        ]
+
     def get_repository_info(self):
         if not check_install('hg --help'):
             return None
@@ -3,12 +3,13 @@ import marshal
 import os
 import re
 import socket
-import stat
 import subprocess
 import sys
 
 from rbtools.clients import SCMClient, RepositoryInfo
 from rbtools.utils.checks import check_gnu_diff, check_install
+from rbtools.utils.concurrency import DEFAULT_MAX_WORKERS, imap_parallel
+from rbtools.utils.diff import GNU_DIFF
 from rbtools.utils.filesystem import make_tempfile
 from rbtools.utils.process import die, execute
 
@@ -18,12 +19,36 @@ class PerforceClient(SCMClient):
     A wrapper around the p4 Perforce tool that fetches repository information
     and generates compatible diffs.
     """
+    install_checks = ['p4 help']
+    cached_attributes = ['p4d_version']
+
     DATE_RE = re.compile(r'(\w+)\s+(\w+)\s+(\d+)\s+(\d\d:\d\d:\d\d)\s+'
                           '(\d\d\d\d)')
 
     def __init__(self, **kwargs):
         super(PerforceClient, self).__init__(**kwargs)
 
+    def get_repository_markers(self):
+        # Workspaces can only be recognized if they use P4CONFIG files.
+        # Otherwise the settings may come from the environment or 'p4 set'.
+        if 'P4CONFIG' in os.environ:
+            return [os.environ['P4CONFIG']]
+
+        return None
+
+    def get_repository_cache_files(self, root):
+        # Settings from the environment take precedence over the P4CONFIG
+        # file, and we can't tell when those change.
+        if 'P4PORT' in os.environ or 'P4CLIENT' in os.environ:
+            return None
+
+        return [
+            os.path.join(root, os.environ['P4CONFIG']),
+            os.environ.get('P4ENVIRO',
+                           os.path.expanduser(os.path.join('~',
+                                                           '.p4enviro'))),
+        ]
+
     def get_repository_info(self):
         if not check_install('p4 help'):
             return None
@@ -57,7 +82,8 @@ class PerforceClient(SCMClient):
 
         # Now that we know it's Perforce, make sure we have GNU diff
         # installed, and error out if we don't.
-        check_gnu_diff()
+        if self.get_diff_engine() == GNU_DIFF:
+            check_gnu_diff()
 
         return RepositoryInfo(path=repository_path, supports_changesets=True)
 
@@ -177,9 +203,6 @@ class PerforceClient(SCMClient):
                                       r'(?P<revision2>,[#@][^,]+)?$')
 
         empty_filename = make_tempfile()
-        tmp_diff_from_filename = make_tempfile()
-        tmp_diff_to_filename = make_tempfile()
-
         diff_lines = []
 
         for path in args:
@@ -225,56 +248,59 @@ class PerforceClient(SCMClient):
                         except KeyError:
                             files[record['depotFile']] = [None, record]
 
-            old_file = new_file = empty_filename
-            changetype_short = None
+            # Work out what changed in each file, so that all of the
+            # revisions needed can be fetched in one go.
+            changes = []
 
             for depot_path, (first_record, second_record) in files.items():
-                old_file = new_file = empty_filename
                 if first_record is None:
-                    self._write_file(depot_path + '#' + second_record['rev'],
-                                     tmp_diff_to_filename)
-                    new_file = tmp_diff_to_filename
-                    changetype_short = 'A'
-                    base_revision = 0
+                    new_depot_path = depot_path + '#' + second_record['rev']
+                    changes.append((depot_path, None, new_depot_path, 'A', 0))
                 elif second_record is None:
-                    self._write_file(depot_path + '#' + first_record['rev'],
-                                     tmp_diff_from_filename)
-                    old_file = tmp_diff_from_filename
-                    changetype_short = 'D'
-                    base_revision = int(first_record['rev'])
+                    old_depot_path = depot_path + '#' + first_record['rev']
+                    changes.append((depot_path, old_depot_path, None, 'D',
+                                    int(first_record['rev'])))
                 elif first_record['rev'] == second_record['rev']:
                     # We when we know the revisions are the same, we don't need
                     # to do any diffing. This speeds up large revision-range
                     # diffs quite a bit.
                     continue
                 else:
-                    self._write_file(depot_path + '#' + first_record['rev'],
-                                     tmp_diff_from_filename)
-                    self._write_file(depot_path + '#' + second_record['rev'],
-                                     tmp_diff_to_filename)
-                    new_file = tmp_diff_to_filename
-                    old_file = tmp_diff_from_filename
-                    changetype_short = 'M'
-                    base_revision = int(first_record['rev'])
+                    old_depot_path = depot_path + '#' + first_record['rev']
+                    new_depot_path = depot_path + '#' + second_record['rev']
+                    changes.append((depot_path, old_depot_path,
+                                    new_depot_path, 'M',
+                                    int(first_record['rev'])))
+
+            tmpfiles = self._write_files(
+                [change[1] for change in changes if change[1]] +
+                [change[2] for change in changes if change[2]])
+
+            for (depot_path, old_depot_path, new_depot_path,
+                 changetype_short, base_revision) in changes:
+                old_file = tmpfiles.get(old_depot_path, empty_filename)
+                new_file = tmpfiles.get(new_depot_path, empty_filename)
 
                 dl = self._do_diff(old_file, new_file, depot_path,
                                    base_revision, changetype_short,
                                    ignore_unmodified=True)
                 diff_lines += dl
 
+                self._remove_files(tmpfiles, old_depot_path, new_depot_path)
+
         os.unlink(empty_filename)
-        os.unlink(tmp_diff_from_filename)
-        os.unlink(tmp_diff_to_filename)
         return (''.join(diff_lines), None)
 
-    def _run_p4(self, command):
+    def _run_p4(self, command, ignore_errors=False):
         """Execute a perforce command using the python marshal API.
 
         - command: A list of strings of the command to execute.
+        - ignore_errors: If True, error records are returned along with the
+          rest of the output instead of aborting.
 
         The return type depends on the command being run.
         """
-        command = ['p4', '-G'] + command
+        command = self._p4_command(command)
         p = subprocess.Popen(command, stdout=subprocess.PIPE)
         result = []
         has_error = False
@@ -291,7 +317,7 @@ class PerforceClient(SCMClient):
 
         rc = p.wait()
 
-        if rc or has_error:
+        if rc or (has_error and not ignore_errors):
             for record in result:
                 if 'data' in record:
                     print record['data']
@@ -299,6 +325,19 @@ class PerforceClient(SCMClient):
 
         return result
 
+    def _p4_command(self, command):
+        """
+        Returns the full command line for a 'p4 -G' command, passing the
+        password along if one was given. diff() also sets P4PASSWD, but not
+        every command runs after it.
+        """
+        p4_command = ['p4', '-G']
+
+        if self._options.p4_passwd:
+            p4_command.extend(['-P', self._options.p4_passwd])
+
+        return p4_command + command
+
     def sanitize_changenum(self, changenum):
         """
         Return a "sanitized" change number for submission to the Review Board
@@ -317,20 +356,26 @@ class PerforceClient(SCMClient):
             v = self.p4d_version
 
             if v[0] < 2002 or (v[0] == "2002" and v[1] < 2):
-                describeCmd = ["p4"]
+                description = self._describe_changelist(changenum)
 
-                if self._options.p4_passwd:
-                    describeCmd.append("-P")
-                    describeCmd.append(self._options.p4_passwd)
+                if description['status'] == 'pending':
+                    return None
 
-                describeCmd = describeCmd + ["describe", "-s", changenum]
+        return changenum
 
-                description = execute(describeCmd, split_lines=True)
+    def _describe_changelist(self, changenum):
+        """
+        Returns the 'p4 describe -s' record for a changelist, which holds its
+        status along with the depot path, revision and action of each of its
+        files. Dies if the changelist doesn't exist.
+        """
+        records = self._run_p4(['describe', '-s', str(changenum)],
+                               ignore_errors=True)
 
-                if '*pending*' in description[0]:
-                    return None
+        if not records or records[0].get('code') != 'stat':
+            die("CLN %s does not exist." % changenum)
 
-        return changenum
+        return records[0]
 
     def _changenum_diff(self, changenum):
         """
@@ -347,27 +392,11 @@ class PerforceClient(SCMClient):
 
         logging.info("Generating diff for changenum %s" % changenum)
 
-        description = []
-
         if changenum == "default":
             cl_is_pending = True
         else:
-            describeCmd = ["p4"]
-
-            if self._options.p4_passwd:
-                describeCmd.append("-P")
-                describeCmd.append(self._options.p4_passwd)
-
-            describeCmd = describeCmd + ["describe", "-s", changenum]
-
-            description = execute(describeCmd, split_lines=True)
-
-            if re.search("no such changelist", description[0]):
-                die("CLN %s does not exist." % changenum)
-
-            # Some P4 wrappers are addding an extra line before the description
-            if '*pending*' in description[0] or '*pending*' in description[1]:
-                cl_is_pending = True
+            description = self._describe_changelist(changenum)
+            cl_is_pending = description['status'] == 'pending'
 
         v = self.p4d_version
 
@@ -376,61 +405,42 @@ class PerforceClient(SCMClient):
             # Pre-2002.2 doesn't give file list in pending changelists,
             # or we don't have a description for a default changeset,
             # so we have to get it a different way.
-            info = execute(["p4", "opened", "-c", str(changenum)],
-                           split_lines=True)
-
-            if (len(info) == 1 and
-                info[0].startswith("File(s) not opened on this client.")):
-                die("Couldn't find any affected files for this change.")
-
-            for line in info:
-                data = line.split(" ")
-                description.append("... %s %s" % (data[0], data[2]))
-
+            files = [
+                (record['depotFile'], record['rev'], record['action'])
+                for record in self._run_p4(['opened', '-c', str(changenum)],
+                                           ignore_errors=True)
+                if 'depotFile' in record
+            ]
         else:
-            # Get the file list
-            for line_num, line in enumerate(description):
-                if 'Affected files ...' in line:
-                    break
-            else:
-                # Got to the end of all the description lines and didn't find
-                # what we were looking for.
-                die("Couldn't find any affected files for this change.")
-
-            description = description[line_num + 2:]
+            # The files are numbered depotFile0, rev0, action0 and so on.
+            files = []
+            i = 0
 
-        diff_lines = []
+            while 'depotFile%d' % i in description:
+                files.append((description['depotFile%d' % i],
+                              description['rev%d' % i],
+                              description['action%d' % i]))
+                i += 1
 
-        empty_filename = make_tempfile()
-        tmp_diff_from_filename = make_tempfile()
-        tmp_diff_to_filename = make_tempfile()
+        if not files:
+            die("Couldn't find any affected files for this change.")
 
-        for line in description:
-            line = line.strip()
-            if not line:
-                continue
+        # Work out what changed in each file first, so that all of the depot
+        # revisions needed can be fetched in one go.
+        changes = []
 
-            m = re.search(r'\.\.\. ([^#]+)#(\d+) '
-                          r'(add|edit|delete|integrate|branch|move/add'
-                          r'|move/delete)',
-                          line)
-            if not m:
-                die("Unsupported line from p4 opened: %s" % line)
-
-            depot_path = m.group(1)
-            base_revision = int(m.group(2))
+        for depot_path, revision, changetype in files:
+            base_revision = int(revision)
             if not cl_is_pending:
                 # If the changelist is pending our base revision is the one
                 # that's currently in the depot. If we're not pending the base
                 # revision is actually the revision prior to this one.
                 base_revision -= 1
 
-            changetype = m.group(3)
-
-            logging.debug('Processing %s of %s' % (changetype, depot_path))
-
-            old_file = new_file = empty_filename
+            # For pending changelists, the new version of the file is the
+            # one in the client workspace.
             old_depot_path = new_depot_path = None
+            use_local_file = False
             changetype_short = None
 
             if changetype in ['edit', 'integrate']:
@@ -440,46 +450,72 @@ class PerforceClient(SCMClient):
                 # We have an old file, get p4 to take this old version from the
                 # depot and put it into a plain old temp file for us
                 old_depot_path = "%s#%s" % (depot_path, base_revision)
-                self._write_file(old_depot_path, tmp_diff_from_filename)
-                old_file = tmp_diff_from_filename
 
                 # Also print out the new file into a tmpfile
                 if cl_is_pending:
-                    new_file = self._depot_to_local(depot_path)
+                    use_local_file = True
                 else:
                     new_depot_path = "%s#%s" % (depot_path, new_revision)
-                    self._write_file(new_depot_path, tmp_diff_to_filename)
-                    new_file = tmp_diff_to_filename
 
                 changetype_short = "M"
             elif changetype in ['add', 'branch', 'move/add']:
                 # We have a new file, get p4 to put this new file into a pretty
                 # temp file for us. No old file to worry about here.
                 if cl_is_pending:
-                    new_file = self._depot_to_local(depot_path)
+                    use_local_file = True
                 else:
                     new_depot_path = "%s#%s" % (depot_path, 1)
-                    self._write_file(new_depot_path, tmp_diff_to_filename)
-                    new_file = tmp_diff_to_filename
                 changetype_short = "A"
             elif changetype in ['delete', 'move/delete']:
                 # We've deleted a file, get p4 to put the deleted file into a
                 # temp file for us. The new file remains the empty file.
                 old_depot_path = "%s#%s" % (depot_path, base_revision)
-                self._write_file(old_depot_path, tmp_diff_from_filename)
-                old_file = tmp_diff_from_filename
                 changetype_short = "D"
             else:
                 die("Unknown change type '%s' for %s" % (changetype,
                                                          depot_path))
 
-            dl = self._do_diff(old_file, new_file, depot_path, base_revision,
-                               changetype_short)
+            changes.append((depot_path, base_revision, changetype,
+                            changetype_short, old_depot_path, new_depot_path,
+                            use_local_file))
+
+        tmpfiles = self._write_files(
+            [change[4] for change in changes if change[4]] +
+            [change[5] for change in changes if change[5]])
+        local_paths = self._depot_to_local(
+            [change[0] for change in changes if change[6]])
+
+        empty_filename = make_tempfile()
+
+        def diff_change(change):
+            (depot_path, base_revision, changetype, changetype_short,
+             old_depot_path, new_depot_path, use_local_file) = change
+            logging.debug('Processing %s of %s' % (changetype, depot_path))
+
+            old_file = tmpfiles.get(old_depot_path, empty_filename)
+
+            if use_local_file:
+                new_file = local_paths[depot_path]
+            else:
+                new_file = tmpfiles.get(new_depot_path, empty_filename)
+
+            try:
+                return self._do_diff(old_file, new_file, depot_path,
+                                     base_revision, changetype_short)
+            finally:
+                self._remove_files(tmpfiles, old_depot_path, new_depot_path)
+
+        # Each file has its own temp files, so they can be diffed
+        # concurrently. The results come back in the order of the
+        # changelist's files.
+        diff_lines = []
+        diff_jobs = getattr(self._options, 'diff_jobs', None)
+
+        for dl in imap_parallel(diff_change, changes,
+                                diff_jobs or DEFAULT_MAX_WORKERS):
             diff_lines += dl
 
         os.unlink(empty_filename)
-        os.unlink(tmp_diff_from_filename)
-        os.unlink(tmp_diff_to_filename)
         return (''.join(diff_lines), None)
 
     def _do_diff(self, old_file, new_file, depot_path, base_revision,
@@ -498,17 +534,7 @@ class PerforceClient(SCMClient):
 
         Returns a list of strings of diff lines.
         """
-        if hasattr(os, 'uname') and os.uname()[0] == 'SunOS':
-            diff_cmd = ["gdiff", "-urNp", old_file, new_file]
-        else:
-            diff_cmd = ["diff", "-urNp", old_file, new_file]
-        # Diff returns "1" if differences were found.
-        dl = execute(diff_cmd, extra_ignore_errors=(1, 2),
-                     translate_newlines=False)
-
-        # If the input file has ^M characters at end of line, lets ignore them.
-        dl = dl.replace('\r\r\n', '\r\n')
-        dl = dl.splitlines(True)
+        dl = self._diff_files(old_file, new_file, show_function=True)
 
         cwd = os.getcwd()
         if depot_path.startswith(cwd):
@@ -516,15 +542,6 @@ class PerforceClient(SCMClient):
         else:
             local_path = depot_path
 
-        # Special handling for the output of the diff tool on binary files:
-        #     diff outputs "Files a and b differ"
-        # and the code below expects the output to start with
-        #     "Binary files "
-        if (len(dl) == 1 and
-            dl[0].startswith('Files %s and %s differ' %
-                            (old_file, new_file))):
-            dl = ['Binary files %s and %s differ\n' % (old_file, new_file)]
-
         if dl == [] or dl[0].startswith("Binary files "):
             if dl == []:
                 if ignore_unmodified:
@@ -579,26 +596,128 @@ class PerforceClient(SCMClient):
 
         return dl
 
-    def _write_file(self, depot_path, tmpfile):
+    def _write_files(self, depot_paths):
         """
-        Grabs a file from Perforce and writes it to a temp file. p4 print sets
-        the file readonly and that causes a later call to unlink fail. So we
-        make the file read/write.
+        Grabs a list of file revisions from Perforce and writes each one to
+        its own temp file, using a single 'p4 print' call.
+
+        Returns a dictionary mapping each depot path (including its revision)
+        to the temp file holding its contents.
         """
-        logging.debug('Writing "%s" to "%s"' % (depot_path, tmpfile))
-        execute(["p4", "print", "-o", tmpfile, "-q", depot_path])
-        os.chmod(tmpfile, stat.S_IREAD | stat.S_IWRITE)
+        tmpfiles = {}
+        depot_paths = list(set(depot_paths))
+
+        if depot_paths:
+            self._print_files(depot_paths, tmpfiles)
 
-    def _depot_to_local(self, depot_path):
+        for depot_path in depot_paths:
+            if depot_path not in tmpfiles:
+                die('Unable to fetch %s from Perforce.' % depot_path)
+
+        return tmpfiles
+
+    def _print_files(self, depot_paths, tmpfiles):
         """
-        Given a path in the depot return the path on the local filesystem to
-        the same file.  If there are multiple results, take only the last
-        result from the where command.
+        Runs a single 'p4 -G print' for the given file revisions, splitting
+        the marshalled output into temp files that are added to tmpfiles.
+
+        The file revisions are passed through an argument file, as with
+        _depot_to_local, so the command line stays short however many there
+        are. The output is a 'stat' record for each file, followed by any
+        number of records holding chunks of its contents.
         """
-        where_output = self._run_p4(['where', depot_path])
+        args_file = make_tempfile('\n'.join(depot_paths) + '\n')
+        command = self._p4_command(['-x', args_file, 'print'])
+        logging.debug('Running %s' % subprocess.list2cmdline(command))
+        errors = []
+        fp = None
 
         try:
-            return where_output[-1]['path']
-        except:
-            # XXX: This breaks on filenames with spaces.
-            return where_output[-1]['data'].split(' ')[2].strip()
+            p = subprocess.Popen(command, stdout=subprocess.PIPE)
+
+            while 1:
+                try:
+                    record = marshal.load(p.stdout)
+                except EOFError:
+                    break
+
+                code = record.get('code', None)
+
+                if code == 'stat':
+                    if fp:
+                        fp.close()
+
+                    depot_path = '%s#%s' % (record['depotFile'], record['rev'])
+                    tmpfile = make_tempfile()
+                    tmpfiles[depot_path] = tmpfile
+                    fp = open(tmpfile, 'wb')
+                elif code == 'error':
+                    errors.append(record['data'])
+                elif fp and 'data' in record:
+                    data = record['data']
+
+                    # 'p4 print -o' writes text files with the local line
+                    # endings, so do the same.
+                    if code == 'text' and os.linesep != '\n':
+                        data = data.replace('\n', os.linesep)
+
+                    fp.write(data)
+
+            rc = p.wait()
+        finally:
+            if fp:
+                fp.close()
+
+            os.unlink(args_file)
+
+        if rc or errors:
+            for error in errors:
+                print error
+            die('Failed to execute command: %s\n' % (command,))
+
+    def _remove_files(self, tmpfiles, *depot_paths):
+        """Removes the temp files fetched for the given depot paths."""
+        for depot_path in depot_paths:
+            tmpfile = tmpfiles.pop(depot_path, None)
+
+            if tmpfile:
+                os.unlink(tmpfile)
+
+    def _depot_to_local(self, depot_paths):
+        """
+        Given a list of paths in the depot, returns a dictionary mapping each
+        one to the path on the local filesystem to the same file. If there are
+        multiple results for a path, take only the last result from the where
+        command.
+
+        The paths are passed to a single 'p4 where' call through an argument
+        file, so there's no limit on how many can be looked up at once.
+        """
+        if not depot_paths:
+            return {}
+
+        args_file = make_tempfile('\n'.join(depot_paths) + '\n')
+
+        try:
+            where_output = self._run_p4(['-x', args_file, 'where'])
+        finally:
+            os.unlink(args_file)
+
+        local_paths = {}
+
+        for record in where_output:
+            if 'unmap' in record:
+                # An exclusion from the client view.
+                continue
+            elif 'path' in record:
+                local_paths[record['depotFile']] = record['path']
+            elif 'data' in record:
+                # XXX: This breaks on filenames with spaces.
+                data = record['data'].split(' ')
+                local_paths[data[0]] = data[2].strip()
+
+        for depot_path in depot_paths:
+            if depot_path not in local_paths:
+                die("Couldn't find %s in the client view." % depot_path)
+
+        return local_paths
@@ -13,9 +13,16 @@ class PlasticClient(SCMClient):
     A wrapper around the cm Plastic tool that fetches repository
     information and generates compatible diffs
     """
+    install_checks = ['cm version']
+
     def __init__(self, **kwargs):
         super(PlasticClient, self).__init__(**kwargs)
 
+    def get_repository_markers(self):
+        # Older workspaces keep their metadata at the top level rather than
+        # in a .plastic directory.
+        return ['.plastic', 'plastic.selector', 'plastic.wktree']
+
     def get_repository_info(self):
         if not check_install('cm version'):
             return None
@@ -307,22 +314,7 @@ class PlasticClient(SCMClient):
         if filename.startswith(self.workspacedir):
             filename = filename[len(self.workspacedir):]
 
-        diff_cmd = ["diff", "-urN", old_file, new_file]
-        # Diff returns "1" if differences were found.
-        dl = execute(diff_cmd, extra_ignore_errors=(1,2),
-                     translate_newlines = False)
-
-        # If the input file has ^M characters at end of line, lets ignore them.
-        dl = dl.replace('\r\r\n', '\r\n')
-        dl = dl.splitlines(True)
-
-        # Special handling for the output of the diff tool on binary files:
-        #     diff outputs "Files a and b differ"
-        # and the code below expects the output to start with
-        #     "Binary files "
-        if (len(dl) == 1 and
-            dl[0].startswith('Files %s and %s differ' % (old_file, new_file))):
-            dl = ['Binary files %s and %s differ\n' % (old_file, new_file)]
+        dl = self._diff_files(old_file, new_file)
 
         if dl == [] or dl[0].startswith("Binary files "):
             if dl == []:
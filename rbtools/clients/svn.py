@@ -2,15 +2,18 @@ import os
 import re
 import sys
 import urllib
+from xml.etree import ElementTree
+from xml.parsers.expat import ExpatError
 
-from rbtools.api.errors import APIError
 from rbtools.clients import SCMClient, RepositoryInfo
 from rbtools.utils.checks import check_gnu_diff, check_install
-from rbtools.utils.filesystem import walk_parents
-from rbtools.utils.process import execute
+from rbtools.utils.filesystem import make_tempfile, walk_parents
+from rbtools.utils.process import execute, execute_stream
 
 
 class SVNClient(SCMClient):
+    install_checks = ['svn help']
+
     # Match the diff control lines generated by 'svn diff'.
     DIFF_ORIG_FILE_LINE_RE = re.compile(r'^---\s+.*\s+\(.*\)')
     DIFF_NEW_FILE_LINE_RE = re.compile(r'^\+\+\+\s+.*\s+\(.*\)')
@@ -23,6 +26,30 @@ class SVNClient(SCMClient):
     def __init__(self, **kwargs):
         super(SVNClient, self).__init__(**kwargs)
 
+        # The results of 'svn info', keyed by normalized path.
+        self._svn_info = {}
+
+    def get_repository_markers(self):
+        # _svn is used on Windows when SVN_ASP_DOT_NET_HACK is set.
+        return ['.svn', '_svn']
+
+    def get_repository_cache_files(self, root):
+        if self._options.repository_url:
+            return None
+
+        admin_dir = os.path.join(root, '.svn')
+
+        if not os.path.isdir(admin_dir):
+            admin_dir = os.path.join(root, '_svn')
+
+        # Subversion 1.7 and up keep a single wc.db at the top of the
+        # working copy. Older versions have an entries file in every
+        # directory.
+        return [
+            os.path.join(admin_dir, 'wc.db'),
+            os.path.join(admin_dir, 'entries'),
+        ]
+
     def get_repository_info(self):
         if not check_install('svn help'):
             return None
@@ -158,106 +185,209 @@ class SVNClient(SCMClient):
         Performs the actual diff operation, handling renames and converting
         paths to absolute.
         """
-        diff = execute(cmd, split_lines=True)
-        diff = self.handle_renames(diff)
-        diff = self.convert_to_absolute_paths(diff, repository_info)
+        return self.rewrite_diff(execute_stream(cmd), repository_info)
 
-        return ''.join(diff)
+    def rewrite_diff(self, diff_content, repository_info=None):
+        """
+        Fixes up the file headers of the output of svn diff, returning the
+        resulting diff as a string.
 
-    def handle_renames(self, diff_content):
+        Each line is looked at once, as it's read. Only the file headers
+        need rewriting, so the lines in between are joined into larger
+        strings as they're read, and the headers are rewritten once the
+        files they name have all been looked up.
+        """
+        parts = []
+        lines = []
+        index_parts = []
+        new_file_parts = []
+
+        def add_part(line):
+            if lines:
+                parts.append(''.join(lines))
+                del lines[:]
+
+            parts.append(line)
+
+            return len(parts) - 1
+
+        for line in diff_content:
+            # Checking the start of the line first saves running the
+            # regexes on all of the lines in between the headers.
+            if line.startswith('Index: '):
+                index_parts.append(add_part(line))
+            elif line.startswith('--- '):
+                # This may be the start of a file's header, which we won't
+                # know until we see the next line.
+                add_part(line)
+            elif (line.startswith('+++ ') and parts and not lines and
+                  parts[-1].startswith('--- ') and
+                  self.DIFF_NEW_FILE_LINE_RE.match(line) and
+                  self.DIFF_ORIG_FILE_LINE_RE.match(parts[-1])):
+                new_file_parts.append(add_part(line))
+            else:
+                lines.append(line)
+
+        parts.append(''.join(lines))
+
+        if not self._options.repository_url:
+            # Look up every file in the diff at once, rather than running
+            # 'svn info' for each header line.
+            filenames = [self._get_header_filename(parts[i])
+                         for i in index_parts + new_file_parts]
+            self.prefetch_svn_info([filename for filename in filenames
+                                    if filename])
+
+        for i in index_parts:
+            parts[i] = self.convert_to_absolute_path(parts[i],
+                                                     repository_info)
+
+        # Each '+++' line follows the '---' line for the same file.
+        for i in new_file_parts:
+            parts[i - 1] = self.convert_to_absolute_path(
+                self.handle_rename(parts[i - 1], parts[i]), repository_info)
+            parts[i] = self.convert_to_absolute_path(parts[i],
+                                                     repository_info)
+
+        return ''.join(parts)
+
+    def handle_rename(self, from_line, to_line):
         """
         The output of svn diff is incorrect when the file in question came
         into being via svn mv/cp. Although the patch for these files are
         relative to its parent, the diff header doesn't reflect this.
-        This function fixes the relevant section headers of the patch to
-        portray this relationship.
+        Given the '---' and '+++' lines of a file's header, this returns the
+        '---' line fixed up to portray this relationship.
         """
-
         # svn diff against a repository URL on two revisions appears to
         # handle moved files properly, so only adjust the diff file names
         # if they were created using a working copy.
         if self._options.repository_url:
-            return diff_content
+            return from_line
 
-        result = []
-
-        from_line = ""
-        for line in diff_content:
-            if self.DIFF_ORIG_FILE_LINE_RE.match(line):
-                from_line = line
-                continue
-
-            # This is where we decide how mangle the previous '--- '
-            if self.DIFF_NEW_FILE_LINE_RE.match(line):
-                to_file, _ = self.parse_filename_header(line[4:])
-                info       = self.svn_info(to_file)
-                if info.has_key("Copied From URL"):
-                    url       = info["Copied From URL"]
-                    root      = info["Repository Root"]
-                    from_file = urllib.unquote(url[len(root):])
-                    result.append(from_line.replace(to_file, from_file))
-                else:
-                    result.append(from_line) #as is, no copy performed
-
-            # We only mangle '---' lines. All others get added straight to
-            # the output.
-            result.append(line)
+        to_file, _ = self.parse_filename_header(to_line[4:])
+        info = self.svn_info(to_file)
 
-        return result
+        if info.has_key("Copied From URL"):
+            url = info["Copied From URL"]
+            root = info["Repository Root"]
+            from_file = urllib.unquote(url[len(root):])
+            return from_line.replace(to_file, from_file)
+        else:
+            return from_line # as is, no copy performed
 
-    def convert_to_absolute_paths(self, diff_content, repository_info):
+    def convert_to_absolute_path(self, line, repository_info):
         """
-        Converts relative paths in a diff output to absolute paths.
-        This handles paths that have been svn switched to other parts of the
-        repository.
+        Converts the relative path in an 'Index:', '---' or '+++' line to
+        an absolute path. This handles paths that have been svn switched to
+        other parts of the repository.
         """
+        front, line = line.split(" ", 1)
 
-        result = []
+        if line.startswith('/'): #already absolute
+            return front + " " + line
 
-        for line in diff_content:
-            front = None
-            if (self.DIFF_NEW_FILE_LINE_RE.match(line)
-                or self.DIFF_ORIG_FILE_LINE_RE.match(line)
-                or line.startswith('Index: ')):
-                front, line = line.split(" ", 1)
-
-            if front:
-                if line.startswith('/'): #already absolute
-                    line = front + " " + line
-                else:
-                    # filename and rest of line (usually the revision
-                    # component)
-                    file, rest = self.parse_filename_header(line)
-
-                    # If working with a diff generated outside of a working
-                    # copy, then file paths are already absolute, so just
-                    # add initial slash.
-                    if self._options.repository_url:
-                        path = urllib.unquote(
-                            "%s/%s" % (repository_info.base_path, file))
-                    else:
-                        info = self.svn_info(file)
-                        url  = info["URL"]
-                        root = info["Repository Root"]
-                        path = urllib.unquote(url[len(root):])
-
-                    line = front + " " + path + rest
-
-            result.append(line)
+        # filename and rest of line (usually the revision component)
+        file, rest = self.parse_filename_header(line)
 
-        return result
+        # If working with a diff generated outside of a working copy, then
+        # file paths are already absolute, so just add initial slash.
+        if self._options.repository_url:
+            path = urllib.unquote("%s/%s" % (repository_info.base_path, file))
+        else:
+            info = self.svn_info(file)
+            url  = info["URL"]
+            root = info["Repository Root"]
+            path = urllib.unquote(url[len(root):])
+
+        return front + " " + path + rest
+
+    def _get_header_filename(self, line):
+        """
+        Returns the relative path named in an 'Index:', '---' or '+++' line,
+        or None if the path is already absolute.
+        """
+        line = line.split(" ", 1)[1]
+
+        if line.startswith('/'):
+            return None
+
+        return self.parse_filename_header(line)[0]
 
     def svn_info(self, path):
-        """Return a dict which is the result of 'svn info' at a given path."""
-        svninfo = {}
-        for info in execute(["svn", "info", path],
-                            split_lines=True):
-            parts = info.strip().split(": ", 1)
-            if len(parts) == 2:
-                key, value = parts
-                svninfo[key] = value
+        """
+        Return a dict which is the result of 'svn info' at a given path.
+
+        Results are remembered for the rest of the run. prefetch_svn_info can
+        be used to look up many paths with a single 'svn info' call first.
+        """
+        key = os.path.normpath(path)
+
+        if key not in self._svn_info:
+            self._svn_info.update(self._run_svn_info([path]))
+
+        return self._svn_info[key]
+
+    def prefetch_svn_info(self, paths):
+        """
+        Looks up the 'svn info' for all of the given paths with one call,
+        for later use by svn_info. Paths that can't be looked up are skipped,
+        and will fail when passed to svn_info.
+        """
+        paths = [path for path in set(paths)
+                 if os.path.normpath(path) not in self._svn_info]
+
+        if paths:
+            self._svn_info.update(self._run_svn_info(paths,
+                                                     ignore_errors=True))
+
+    def _run_svn_info(self, paths, ignore_errors=False):
+        """
+        Runs 'svn info --xml' on the given paths, returning a dict mapping
+        each normalized path to its info. The info uses the same keys as
+        the plain 'svn info' output.
+        """
+        # Pass the paths in a file so there's no limit on how many there are.
+        targets_file = make_tempfile('\n'.join(paths) + '\n')
+
+        # Any errors are only worth showing if we're going to die on them.
+        # Otherwise they'd just get in the way of parsing the XML.
+        try:
+            data = execute(["svn", "info", "--xml", "--targets", targets_file],
+                           ignore_errors=ignore_errors,
+                           with_errors=not ignore_errors)
+        finally:
+            os.unlink(targets_file)
 
-        return svninfo
+        try:
+            root = ElementTree.fromstring(data)
+        except (ExpatError, SyntaxError):
+            # svn may not get as far as writing the whole document if some
+            # of the paths couldn't be found.
+            return {}
+
+        result = {}
+
+        for entry in root.findall('entry'):
+            svninfo = {}
+
+            for key, value in (
+                ('Path', entry.get('path')),
+                ('Node Kind', entry.get('kind')),
+                ('Revision', entry.get('revision')),
+                ('URL', entry.findtext('url')),
+                ('Repository Root', entry.findtext('repository/root')),
+                ('Repository UUID', entry.findtext('repository/uuid')),
+                ('Copied From URL', entry.findtext('wc-info/copy-from-url')),
+                ('Copied From Rev', entry.findtext('wc-info/copy-from-rev'))):
+                if value is not None:
+                    # svn writes UTF-8, which is also what it uses for the
+                    # paths in diffs.
+                    svninfo[key] = value.encode('utf-8')
+
+            result[os.path.normpath(svninfo['Path'])] = svninfo
+
+        return result
 
     # Adapted from server code parser.py
     def parse_filename_header(self, s):
@@ -303,17 +433,8 @@ class SVNRepositoryInfo(RepositoryInfo):
         repositories use the same path, you'll get back self, otherwise you'll
         get a different SVNRepositoryInfo object (with a different path).
         """
-        repositories = server.get_repositories()
-
-        for repository in repositories:
-            if repository['tool'] != 'Subversion':
-                continue
-
-            info = self._get_repository_info(server, repository)
-
-            if not info or self.uuid != info['uuid']:
-                continue
-
+        for repository, info in server.find_repositories_by_uuid('Subversion',
+                                                                 self.uuid):
             repos_base_path = info['url'][len(info['root_url']):]
             relpath = self._get_relative_path(self.base_path, repos_base_path)
             if relpath:
@@ -323,18 +444,6 @@ class SVNRepositoryInfo(RepositoryInfo):
         # self and hope for the best.
         return self
 
-    def _get_repository_info(self, server, repository):
-        try:
-            return server.get_repository_info(repository['id'])
-        except APIError as e:
-            # If the server couldn't fetch the repository info, it will return
-            # code 210. Ignore those.
-            # Other more serious errors should still be raised, though.
-            if e.error_code == 210:
-                return None
-
-            raise e
-
     def _get_relative_path(self, path, root):
         pathdirs = self._split_on_slash(path)
         rootdirs = self._split_on_slash(root)
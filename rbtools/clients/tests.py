@@ -1,17 +1,24 @@
+import marshal
 import os
 import re
+import subprocess
 import sys
 import time
+from binascii import unhexlify
 from nose import SkipTest
 from nose.tools import raises
 from random import randint
+from tempfile import TemporaryFile
 from textwrap import dedent
 
-from rbtools.clients import RepositoryInfo
+from rbtools.clients import RepositoryInfo, _find_marked_clients, \
+                            _get_repository_info
+from rbtools.clients import git, gitobjects, gitpack, svn
+from rbtools.clients.cvs import CVSClient
 from rbtools.clients.git import GitClient
 from rbtools.clients.mercurial import MercurialClient
 from rbtools.clients.perforce import PerforceClient
-from rbtools.clients.svn import SVNRepositoryInfo
+from rbtools.clients.svn import SVNClient, SVNRepositoryInfo
 from rbtools.tests import OptionsStub
 from rbtools.utils.filesystem import load_config_files
 from rbtools.utils.process import execute
@@ -23,6 +30,27 @@ class SCMClientTests(RBTestBase):
         self.options = OptionsStub()
 
 
+class ScanUsableClientTests(SCMClientTests):
+    def test_find_marked_clients(self):
+        """Testing _find_marked_clients"""
+        root = self.chdir_tmp()
+        os.mkdir('.svn')
+        os.mkdir('subdir')
+        os.chdir('subdir')
+
+        clients = [
+            CVSClient(options=self.options),
+            GitClient(options=self.options),
+            PerforceClient(options=self.options),
+            SVNClient(options=self.options),
+        ]
+
+        # Perforce can't be recognized from the filesystem, so it's always
+        # included.
+        self.assertEqual(_find_marked_clients(clients),
+                         [(clients[2], None), (clients[3], root)])
+
+
 class GitClientTests(SCMClientTests):
     TESTSERVER = "http://127.0.0.1:8080"
 
@@ -49,6 +77,23 @@ class GitClientTests(SCMClientTests):
         self._gitcmd(['add', file])
         self._gitcmd(['commit', '-m', msg])
 
+    def _record_commands(self):
+        """
+        Records the git subcommand of each command run through execute by
+        GitClient, until the end of the test. Returns the list they're
+        recorded in.
+        """
+        commands = []
+
+        def execute_logged(command, *args, **kwargs):
+            commands.append(command[1])
+            return execute(command, *args, **kwargs)
+
+        git.execute = execute_logged
+        self.addCleanup(setattr, git, 'execute', execute)
+
+        return commands
+
     def setUp(self):
         super(GitClientTests, self).setUp()
 
@@ -83,6 +128,32 @@ class GitClientTests(SCMClientTests):
         self.assertTrue(ri.supports_parent_diffs)
         self.assertFalse(ri.supports_changesets)
 
+    def test_get_repository_info_cached(self):
+        """Test GitClient get_repository_info with the on-disk cache"""
+        ri = _get_repository_info(self.client, self.clone_dir)
+
+        def fail():
+            self.fail('get_repository_info should not have been called')
+
+        client = GitClient(options=self.options)
+        client.get_repository_info = fail
+        cached_ri = _get_repository_info(client, self.clone_dir)
+        self.assertEqual(cached_ri.path, ri.path)
+        self.assertEqual(client.head_ref, self.client.head_ref)
+        self.assertEqual(client.upstream_branch, self.client.upstream_branch)
+
+        # The config is read again when it's needed, rather than cached.
+        self.assertEqual(client._git_config, None)
+        self._gitcmd(['config', 'reviewboard.url', self.TESTSERVER])
+        self.assertEqual(client.get_config('reviewboard.url'), self.TESTSERVER)
+
+        # Changing the config invalidates the cache.
+        config = os.path.join(self.clone_dir, '.git', 'config')
+        os.utime(config, (0, 0))
+        client = GitClient(options=self.options)
+        self.assertEqual(_get_repository_info(client, self.clone_dir).path,
+                         ri.path)
+
     def test_scan_for_server_simple(self):
         """Test GitClient scan_for_server, simple case"""
         ri = self.client.get_repository_info()
@@ -108,6 +179,258 @@ class GitClientTests(SCMClientTests):
 
         self.assertEqual(self.client.scan_for_server(ri), self.TESTSERVER)
 
+    def test_get_repository_info_commands(self):
+        """Test GitClient get_repository_info running only two commands"""
+        self._gitcmd(['config', 'Branch.master.Remote', 'origin'])
+        self._gitcmd(['config', 'Reviewboard.URL', self.TESTSERVER])
+        commands = self._record_commands()
+        ri = self.client.get_repository_info()
+        server = self.client.scan_for_server(ri)
+
+        self.assertEqual(commands, ['rev-parse', 'config'])
+        self.assertEqual(server, self.TESTSERVER)
+        self.assertEqual(self.client.head_ref, 'refs/heads/master')
+        self.assertEqual(self.client.upstream_branch, 'origin/master')
+        self.assertEqual(self.client.get_config('remote.origin.url'),
+                         self.git_dir)
+        self.assertEqual(self.client.get_config('BRANCH.master.merge'),
+                         'refs/heads/master')
+        self.assertEqual(self.client.get_config('branch.MASTER.merge'), '')
+
+    def test_iter_svn_diff(self):
+        """Test GitClient converting a git diff to svn diff format"""
+        diff_lines = [
+            'diff --git foo.txt foo.txt\n',
+            'index 634b3e8..5e98e9540 100644\n',
+            '--- foo.txt\n',
+            '+++ foo.txt\n',
+            '@@ -1,2 +1,2 @@\n',
+            ' ARMA virumque cano, Troiae qui primus ab oris\n',
+            '-Italiam, fato profugus, Laviniaque venit\n',
+            '+ITALIAM, FATO PROFUGUS, LAVINIAQUE VENIT\n',
+            'diff --git bar.txt bar.txt\n',
+            'new file mode 100644\n',
+            'index 0000000..e69de29\n',
+            '--- /dev/null\n',
+            '+++ bar.txt\n',
+            '@@ -0,0 +1 @@\n',
+            '+litora, multum ille et terris iactatus et alto\n',
+            'diff --git baz.png baz.png\n',
+            'index 1234567..89abcde 100644\n',
+            'Binary files baz.png and baz.png differ\n',
+        ]
+
+        svn_diff = self.client.convert_svn_diff(iter(diff_lines), '12')
+        self.assertEqual(
+            ''.join(self.client.iter_svn_diff(diff_lines, '12')), svn_diff)
+        self.assertEqual(
+            svn_diff,
+            'Index: foo.txt\n' +
+            '=' * 67 + '\n'
+            '--- foo.txt\t(revision 12)\n'
+            '+++ foo.txt\t(working copy)\n'
+            '@@ -1,2 +1,2 @@\n'
+            ' ARMA virumque cano, Troiae qui primus ab oris\n'
+            '-Italiam, fato profugus, Laviniaque venit\n'
+            '+ITALIAM, FATO PROFUGUS, LAVINIAQUE VENIT\n'
+            'Index: bar.txt\n' +
+            '=' * 67 + '\n'
+            '--- bar.txt\t(revision 0)\n'
+            '+++ bar.txt\t(revision 0)\n'
+            '@@ -0,0 +1 @@\n'
+            '+litora, multum ille et terris iactatus et alto\n'
+            'Index: baz.png\n' +
+            '=' * 67 + '\n'
+            'Cannot display: file marked as a binary type.\n'
+            'svn:mime-type = application/octet-stream\n')
+
+    def test_native_read_objects(self):
+        """Test reading loose and packed git objects natively"""
+        self._git_add_file_commit('foo.txt', FOO1, 'delete and modify stuff')
+        self._gitcmd(['gc', '-q'])
+        self._git_add_file_commit('foo.txt', FOO2, 'commit 2')
+        repository = gitobjects.Repository(
+            os.path.join(self.clone_dir, '.git'))
+
+        for line in self._gitcmd(['rev-list', '--all', '--objects'],
+                                 split_lines=True):
+            sha = line.split()[0]
+            obj_type = self._gitcmd(['cat-file', '-t', sha]).strip()
+            self.assertEqual(repository.store.read(sha),
+                             (obj_type,
+                              self._gitcmd(['cat-file', obj_type, sha],
+                                           translate_newlines=False)))
+
+        for rev in ('HEAD', 'HEAD^', 'master~2', 'origin/master'):
+            self.assertEqual(repository.resolve(rev),
+                             self._gitcmd(['rev-parse', rev]).strip())
+
+        self.assertRaises(gitobjects.GitObjectError, repository.resolve,
+                          'HEAD~3')
+
+    def test_pack_index_versions(self):
+        """Test looking up objects in version 1 and 2 pack indexes"""
+        self._git_add_file_commit('foo.txt', FOO1, 'delete and modify stuff')
+        self._gitcmd(['gc', '-q'])
+        pack_dir = os.path.join(self.clone_dir, '.git', 'objects', 'pack')
+        pack = [os.path.join(pack_dir, filename)
+                for filename in os.listdir(pack_dir)
+                if filename.endswith('.pack')][0]
+        idx_v1 = os.path.join(self.clone_dir, 'v1.idx')
+        self._gitcmd(['-c', 'pack.indexVersion=1', 'index-pack', '-o',
+                      idx_v1, pack])
+
+        index_v1 = gitpack.PackIndex(idx_v1)
+        index_v2 = gitpack.PackIndex(pack[:-5] + '.idx')
+        shas = [line.split()[0]
+                for line in self._gitcmd(['rev-list', '--all', '--objects'],
+                                         split_lines=True)]
+
+        self.assertEqual(len(index_v1), len(shas))
+        self.assertEqual(index_v1._version, 1)
+        self.assertEqual(index_v2._version, 2)
+
+        for sha in shas:
+            offset = index_v2.find(unhexlify(sha))
+            self.assertTrue(offset > 0)
+            self.assertEqual(index_v1.find(unhexlify(sha)), offset)
+
+        self.assertEqual(index_v2.find(unhexlify('0' * 40)), None)
+        self.assertEqual(index_v2.find(unhexlify('f' * 40)), None)
+        index_v1.close()
+        index_v2.close()
+
+    def test_native_merge_base_redundant(self):
+        """Test that native merge bases drop ancestors of other candidates"""
+        tree = self._gitcmd(['write-tree']).strip()
+
+        def commit_tree(date, *parents):
+            command = ['commit-tree', tree, '-m', str(date)]
+
+            for parent in parents:
+                command.extend(['-p', parent])
+
+            date = '%d +0000' % date
+
+            return self._gitcmd(command, env={
+                'GIT_AUTHOR_DATE': date,
+                'GIT_COMMITTER_DATE': date,
+            }).strip()
+
+        # The clock skew on the middle commit stops the walk before the
+        # root is found to be an ancestor of the other common ancestor.
+        root = commit_tree(1000000300)
+        skewed = commit_tree(1000000050, root)
+        base = commit_tree(1000000100, skewed)
+        one = commit_tree(1000000400, base, root)
+        two = commit_tree(1000000500, base, root)
+
+        repository = gitobjects.Repository(
+            os.path.join(self.clone_dir, '.git'))
+        self.assertEqual(
+            sorted(repository._paint_down_to_common(one, [two])[0]),
+            sorted([root, base]))
+        self.assertEqual(repository.merge_base(one, two), base)
+        self.assertEqual(
+            self._gitcmd(['merge-base', '--all', one, two]).strip(), base)
+
+        # Criss-cross merges have two best merge bases.
+        other = commit_tree(1000000200, root)
+        cross1 = commit_tree(1000000600, base, other)
+        cross2 = commit_tree(1000000700, other, base)
+        self.assertRaises(gitobjects.GitObjectError, repository.merge_base,
+                          cross1, cross2)
+
+    def test_diff_native(self):
+        """Test GitClient diff with the native backend"""
+        self._gitcmd(['config', 'diff.renames', 'false'])
+        self._git_add_file_commit('bar.txt', FOO2, 'add bar')
+        self._git_add_file_commit('bin.dat', '\0\1\2', 'add binary')
+        self._git_add_file_commit('run.sh', FOO3, 'add script')
+        self._gitcmd(['update-ref', 'refs/remotes/origin/master', 'HEAD'])
+        self._gitcmd(['gc', '-q'])
+
+        self._git_add_file_commit('foo.txt', FOO1, 'delete and modify stuff')
+        self._git_add_file_commit('empty.txt', '', 'add empty file')
+        self._git_add_file_commit('bin.dat', '\0\3', 'change binary')
+        self._gitcmd(['rm', '-q', 'bar.txt'])
+        self._gitcmd(['commit', '-m', 'remove bar\n\nIt was unused.'])
+        os.chmod('run.sh', 0755)
+        self._gitcmd(['commit', '-a', '-m', 'make run.sh executable'])
+
+        self.options.guess_summary = True
+        self.options.guess_description = True
+        self.options.summary = None
+        self.options.description = None
+        self.client.get_repository_info()
+        expected = self.client.diff(None)
+        expected_summary = self.options.summary
+        expected_description = self.options.description
+
+        self.options.summary = None
+        self.options.description = None
+        self.options.git_backend = git.GIT_NATIVE
+        client = GitClient(options=self.options)
+        client.get_repository_info()
+        commands = self._record_commands()
+        self.assertEqual(client.diff(None), expected)
+
+        self.assertEqual(commands, [])
+        self.assertEqual(self.options.summary, expected_summary)
+        self.assertEqual(self.options.description, expected_description)
+        self.assertTrue('deleted file mode' in expected[0])
+        self.assertTrue('Binary files' in expected[0])
+
+    def test_diff_guess_with_cat_file(self):
+        """Test GitClient guessing the summary through git cat-file"""
+        self._git_add_file_commit('foo.txt', FOO1, 'delete and modify stuff')
+        self._gitcmd(['commit', '--allow-empty', '-m',
+                      'second commit\n\nWith a body.\n'])
+        self.client.get_repository_info()
+        self.options.guess_summary = True
+        self.options.guess_description = True
+        self.options.summary = None
+        self.options.description = None
+        commands = self._record_commands()
+        self.client.diff(None)
+
+        self.assertEqual(commands, ['merge-base', 'diff'])
+        self.assertEqual(self.options.summary, 'second commit')
+        self.assertEqual(
+            self.options.description,
+            self._gitcmd(['log', '--pretty=format:%s%n%n%b',
+                          self.client.merge_base + '..']).strip())
+
+    def test_make_svn_diff_find_rev(self):
+        """Test GitClient finding the svn revision through git cat-file"""
+        self._gitcmd(['commit', '--allow-empty', '-m',
+                      'imported\n\n'
+                      'git-svn-id: http://svn.example.com/repo/trunk@42 '
+                      '0f5d0a2c-5c5b-4b4f-8b8a-0f5d0a2c5c5b\n'])
+        self.client.get_repository_info()
+        commands = self._record_commands()
+        diff = self.client.make_svn_diff('HEAD', [
+            'diff --git foo.txt foo.txt\n',
+            '--- foo.txt\n',
+            '+++ foo.txt\n',
+        ])
+
+        self.assertEqual(commands, [])
+        self.assertTrue('--- foo.txt\t(revision 42)\n' in diff)
+
+    def test_diff_native_fallback(self):
+        """Test GitClient diff with the native backend falling back to git"""
+        self._git_add_file_commit('foo.txt', FOO1, 'delete and modify stuff')
+        self._git_add_file_commit('.gitattributes', '*.txt diff\n',
+                                  'add attributes')
+        self.client.get_repository_info()
+        expected = self.client.diff(None)
+
+        self.options.git_backend = git.GIT_NATIVE
+        client = GitClient(options=self.options)
+        client.get_repository_info()
+        self.assertEqual(client.diff(None), expected)
+
     def test_diff_simple(self):
         """Test GitClient simple diff case"""
         diff = "diff --git a/foo.txt b/foo.txt\n" \
@@ -698,11 +1021,242 @@ class SVNClientTests(SCMClientTests):
             info._get_relative_path('/trunk/myproject', '/trunk/myproject'),
             '/')
 
+    def test_diff_svn_info(self):
+        """Testing SVNClient.do_diff looking up all files with one svn info"""
+        diff = [
+            'Index: foo.txt\n',
+            '=' * 67 + '\n',
+            '--- foo.txt\t(revision 1)\n',
+            '+++ foo.txt\t(working copy)\n',
+            '@@ -1 +1 @@\n',
+            '--- not a header (really)\n',
+            '+new\n',
+            'Index: bar.txt\n',
+            '=' * 67 + '\n',
+            '--- bar.txt\t(revision 0)\n',
+            '+++ bar.txt\t(working copy)\n',
+        ]
+        info = dedent("""\
+            <?xml version="1.0" encoding="UTF-8"?>
+            <info>
+            <entry kind="file" path="foo.txt" revision="1">
+            <url>file:///repo/trunk/foo.txt</url>
+            <repository><root>file:///repo</root></repository>
+            </entry>
+            <entry kind="file" path="bar.txt" revision="0">
+            <url>file:///repo/trunk/bar.txt</url>
+            <repository><root>file:///repo</root></repository>
+            <wc-info>
+            <copy-from-url>file:///repo/trunk/baz.txt</copy-from-url>
+            </wc-info>
+            </entry>
+            </info>
+            """)
+        info_calls = []
+
+        def execute(command, *args, **kwargs):
+            info_calls.append(command)
+            return info
+
+        saved_execute = svn.execute
+        saved_execute_stream = svn.execute_stream
+        svn.execute = execute
+        svn.execute_stream = lambda command: iter(diff)
+
+        try:
+            client = SVNClient(options=self.options)
+            result = client.do_diff(['svn', 'diff'])
+        finally:
+            svn.execute = saved_execute
+            svn.execute_stream = saved_execute_stream
+
+        self.assertEqual(len(info_calls), 1)
+        self.assertEqual(result.splitlines(), [
+            'Index: /trunk/foo.txt',
+            '=' * 67,
+            '--- /trunk/foo.txt\t(revision 1)',
+            '+++ /trunk/foo.txt\t(working copy)',
+            '@@ -1 +1 @@',
+            '--- not a header (really)',
+            '+new',
+            'Index: /trunk/bar.txt',
+            '=' * 67,
+            '--- /trunk/baz.txt\t(revision 0)',
+            '+++ /trunk/bar.txt\t(working copy)',
+        ])
+
 
 class PerforceClientTests(SCMClientTests):
     def setUp(self):
         super(PerforceClientTests, self).setUp()
 
+    def test_write_files(self):
+        """Testing PerforceClient._write_files splitting 'p4 print' output"""
+        records = [
+            {'code': 'stat', 'depotFile': '//depot/foo', 'rev': '3'},
+            {'code': 'text', 'data': 'foo\n'},
+            {'code': 'text', 'data': 'bar\n'},
+            {'code': 'stat', 'depotFile': '//depot/empty', 'rev': '1'},
+            {'code': 'stat', 'depotFile': '//depot/bin', 'rev': '2'},
+            {'code': 'binary', 'data': '\x00\x01'},
+        ]
+        client = PerforceClient(options=self.options)
+        self._fake_p4(records)
+
+        try:
+            tmpfiles = client._write_files(['//depot/foo#3', '//depot/empty#1',
+                                            '//depot/bin#2'])
+        finally:
+            self._restore_p4()
+
+        # The revisions are passed in an argument file, not on the command
+        # line.
+        self.assertEqual(len(self.p4_commands), 1)
+        command = self.p4_commands[0]
+        self.assertEqual(command[:3], ['p4', '-G', '-x'])
+        self.assertEqual(command[4], 'print')
+        self.assertEqual(sorted(command[5:]),
+                         ['//depot/bin#2', '//depot/empty#1', '//depot/foo#3'])
+        self.assertFalse(os.path.exists(command[3]))
+
+        self.assertEqual(open(tmpfiles['//depot/foo#3']).read(),
+                         'foo%sbar%s' % (os.linesep, os.linesep))
+        self.assertEqual(open(tmpfiles['//depot/empty#1']).read(), '')
+        self.assertEqual(open(tmpfiles['//depot/bin#2'], 'rb').read(),
+                         '\x00\x01')
+
+    def test_changenum_diff_order(self):
+        """Testing PerforceClient._changenum_diff keeping the file order"""
+        depot_paths = ['//depot/%d' % i for i in xrange(10)]
+        client = PerforceClient(options=self.options)
+        client.p4d_version = (2010, 1)
+        client._write_files = lambda depot_paths: {}
+        client._depot_to_local = lambda depot_paths: dict(
+            (depot_path, depot_path) for depot_path in depot_paths)
+
+        def do_diff(old_file, new_file, depot_path, base_revision,
+                    changetype_short):
+            # Make the earlier files finish last.
+            time.sleep(0.01 * (10 - depot_paths.index(depot_path)))
+            return ['%s\n' % depot_path]
+
+        def run_p4(command, ignore_errors=False):
+            self.assertEqual(command, ['opened', '-c', 'default'])
+            return [{'code': 'stat', 'depotFile': depot_path, 'rev': '1',
+                     'action': 'edit'}
+                    for depot_path in depot_paths]
+
+        client._do_diff = do_diff
+        client._run_p4 = run_p4
+        diff, parent_diff = client._changenum_diff('default')
+
+        self.assertEqual(diff, ''.join(['%s\n' % depot_path
+                                        for depot_path in depot_paths]))
+
+    def test_changenum_diff_describe(self):
+        """Testing PerforceClient._changenum_diff with 'p4 describe' records"""
+        client = PerforceClient(options=self.options)
+        client.p4d_version = (2010, 1)
+        client._write_files = lambda depot_paths: dict(
+            (depot_path, depot_path) for depot_path in depot_paths)
+        client._remove_files = lambda *args: None
+        client._do_diff = lambda *args: ['%s %s %s %s %s\n' % args]
+        self._fake_p4([{
+            'code': 'stat',
+            'change': '12',
+            'status': 'submitted',
+            'depotFile0': '//depot/foo',
+            'rev0': '3',
+            'action0': 'edit',
+            'depotFile1': '//depot/bar',
+            'rev1': '1',
+            'action1': 'add',
+        }])
+
+        try:
+            diff, parent_diff = client._changenum_diff('12')
+        finally:
+            self._restore_p4()
+
+        lines = diff.splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0],
+                         '//depot/foo#2 //depot/foo#3 //depot/foo 2 M')
+        self.assertTrue(lines[1].endswith(' //depot/bar#1 //depot/bar 0 A'))
+
+    def test_describe_changelist_password(self):
+        """Testing PerforceClient passing the password to 'p4 describe'"""
+        self.options.p4_passwd = 'secret'
+        client = PerforceClient(options=self.options)
+        client.p4d_version = (2001, 1)
+        self._fake_p4([{'code': 'stat', 'change': '12',
+                        'status': 'pending'}])
+
+        try:
+            self.assertEqual(client.sanitize_changenum('12'), None)
+        finally:
+            self._restore_p4()
+
+        self.assertEqual(self.p4_commands, [
+            ['p4', '-G', '-P', 'secret', 'describe', '-s', '12'],
+        ])
+
+    def test_depot_to_local(self):
+        """Testing PerforceClient._depot_to_local with one 'p4 where' call"""
+        records = [
+            {'code': 'stat', 'depotFile': '//depot/foo',
+             'clientFile': '//client/foo', 'path': '/src/foo'},
+            {'code': 'stat', 'depotFile': '//depot/bar', 'unmap': '',
+             'clientFile': '//client/bar', 'path': '/src/bar'},
+            {'code': 'stat', 'depotFile': '//depot/bar',
+             'clientFile': '//client/bar', 'path': '/src/other/bar'},
+        ]
+        client = PerforceClient(options=self.options)
+        self._fake_p4(records)
+
+        try:
+            local_paths = client._depot_to_local(['//depot/foo',
+                                                  '//depot/bar'])
+        finally:
+            self._restore_p4()
+
+        self.assertEqual(local_paths, {
+            '//depot/foo': '/src/foo',
+            '//depot/bar': '/src/other/bar',
+        })
+
+    def _fake_p4(self, records):
+        """Makes the next p4 -G call return the given records."""
+        # marshal.load() only works on real files.
+        stdout = TemporaryFile()
+
+        for record in records:
+            marshal.dump(record, stdout, 0)
+
+        stdout.seek(0)
+        commands = self.p4_commands = []
+
+        class FakePopen(object):
+            def __init__(self, command, *args, **kwargs):
+                self.stdout = stdout
+
+                if '-x' in command:
+                    # Record the arguments from the file, which is removed
+                    # once the command has run.
+                    args_file = command[command.index('-x') + 1]
+                    command = command + open(args_file).read().splitlines()
+
+                commands.append(command)
+
+            def wait(self):
+                return 0
+
+        self._saved_popen = subprocess.Popen
+        subprocess.Popen = FakePopen
+
+    def _restore_p4(self):
+        subprocess.Popen = self._saved_popen
+
     @raises(SystemExit)
     def test_error_on_revision_range(self):
         """Testing that passing a revision_range causes the client to exit."""
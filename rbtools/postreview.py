@@ -2,21 +2,30 @@
 import base64
 import cookielib
 import getpass
-import mimetools
 import os
 import re
+import shutil
 import sys
+import threading
+import time
 import urllib2
 from optparse import OptionParser
 from pkg_resources import parse_version
-from urlparse import urljoin, urlparse
+from urllib import urlencode
+from urlparse import parse_qs, urljoin, urlparse, urlsplit, urlunsplit
 
 from rbtools import get_package_version, get_version_string
 from rbtools.api.errors import APIError
 from rbtools.clients import scan_usable_client
+from rbtools.clients.git import GIT_BACKENDS, GIT_SUBPROCESS
 from rbtools.clients.perforce import PerforceClient
 from rbtools.clients.plastic import PlasticClient
+from rbtools.utils.cache import load_cache, save_cache
+from rbtools.utils.concurrency import DEFAULT_MAX_WORKERS, imap_parallel
+from rbtools.utils.diff import DIFF_ENGINES, GNU_DIFF
 from rbtools.utils.filesystem import get_config_value, load_config_files
+from rbtools.utils.http import ConnectionPool, MultipartBody, \
+                               build_keepalive_handlers
 from rbtools.utils.process import die
 
 try:
@@ -102,6 +111,27 @@ configs = []
 ADD_REPOSITORY_DOCS_URL = \
     'http://www.reviewboard.org/docs/manual/dev/admin/management/repositories/'
 
+# The API root and server info resources are cached on disk. Entries are
+# used as-is for API_CACHE_TTL seconds, and revalidated after that.
+API_CACHE = 'api-resources'
+API_CACHE_TTL = 24 * 60 * 60
+MAX_API_CACHE_ENTRIES = 50
+
+# The repository list and the info for each repository are cached on disk
+# too. After REPOSITORY_CACHE_TTL seconds, or when a lookup misses, the list
+# is fetched again, but only new or changed repositories have their info
+# fetched again.
+REPOSITORY_CACHE = 'repositories'
+REPOSITORY_CACHE_TTL = 24 * 60 * 60
+MAX_REPOSITORY_CACHE_ENTRIES = 20
+
+# urllib2's auth handlers keep state between requests (retry counts, digest
+# nonce counts) that isn't safe to share between threads, and the password
+# manager may prompt. Requests made in parallel handle authentication
+# challenges one at a time. This is re-entrant, since retrying a request
+# can lead to another challenge on the same thread.
+_auth_lock = threading.RLock()
+
 
 class HTTPRequest(urllib2.Request):
     def __init__(self, url, body='', headers={}, method="PUT"):
@@ -183,6 +213,15 @@ class ReviewBoardHTTPBasicAuthHandler(urllib2.HTTPBasicAuthHandler):
         self._retried = False
         self._lasturl = ""
 
+    def http_error_401(self, *args, **kwargs):
+        _auth_lock.acquire()
+
+        try:
+            return urllib2.HTTPBasicAuthHandler.http_error_401(self, *args,
+                                                               **kwargs)
+        finally:
+            _auth_lock.release()
+
     def retry_http_basic_auth(self, *args, **kwargs):
         if self._lasturl != args[0]:
             self._retried = False
@@ -203,6 +242,18 @@ class ReviewBoardHTTPBasicAuthHandler(urllib2.HTTPBasicAuthHandler):
             return None
 
 
+class ReviewBoardHTTPDigestAuthHandler(urllib2.HTTPDigestAuthHandler):
+    """Digest Auth handler that handles one challenge at a time."""
+    def http_error_401(self, *args, **kwargs):
+        _auth_lock.acquire()
+
+        try:
+            return urllib2.HTTPDigestAuthHandler.http_error_401(self, *args,
+                                                                **kwargs)
+        finally:
+            _auth_lock.release()
+
+
 class ReviewBoardHTTPPasswordMgr(urllib2.HTTPPasswordMgr):
     """
     Adds HTTP authentication support for URLs.
@@ -244,6 +295,31 @@ class ReviewBoardHTTPPasswordMgr(urllib2.HTTPPasswordMgr):
             return urllib2.HTTPPasswordMgr.find_user_password(self, realm, uri)
 
 
+class RepositoryIndex(object):
+    """
+    The repositories on a Review Board server, along with the info for
+    those that it was fetched for, indexed by tool and UUID.
+    """
+    def __init__(self, repositories, infos, refreshed):
+        self.repositories = repositories
+        self.refreshed = refreshed
+        self._uuids = {}
+
+        for repository in repositories:
+            info = infos.get(repository['id'])
+
+            if info and 'uuid' in info:
+                key = (repository['tool'], info['uuid'])
+                self._uuids.setdefault(key, []).append((repository, info))
+
+    def get_by_uuid(self, tool, uuid):
+        """
+        Returns the repositories using the given tool with the given UUID,
+        as a list of (repository, info) tuples.
+        """
+        return self._uuids.get((tool, uuid), [])
+
+
 class ReviewBoardServer(object):
     """
     An instance of a Review Board server.
@@ -258,6 +334,7 @@ class ReviewBoardServer(object):
         self.deprecated_api = False
         self.cookie_file = cookie_file
         self.cookie_jar  = cookielib.MozillaCookieJar(self.cookie_file)
+        self._cookie_lock = threading.Lock()
 
         if self.cookie_file:
             try:
@@ -271,23 +348,29 @@ class ReviewBoardServer(object):
                                                          options.username,
                                                          options.password)
         basic_auth_handler  = ReviewBoardHTTPBasicAuthHandler(password_mgr)
-        digest_auth_handler = urllib2.HTTPDigestAuthHandler(password_mgr)
+        digest_auth_handler = ReviewBoardHTTPDigestAuthHandler(password_mgr)
         self.preset_auth_handler = PresetHTTPAuthHandler(self.url, password_mgr)
         http_error_processor = ReviewBoardHTTPErrorProcessor()
 
-        opener = urllib2.build_opener(cookie_handler,
-                                      basic_auth_handler,
-                                      digest_auth_handler,
-                                      self.preset_auth_handler,
-                                      http_error_processor)
+        # Every API call in a run goes to the same server, so keep the
+        # connections open and reuse them rather than reconnecting each time.
+        self.connection_pool = ConnectionPool()
+
+        opener = urllib2.build_opener(
+            cookie_handler,
+            basic_auth_handler,
+            digest_auth_handler,
+            self.preset_auth_handler,
+            http_error_processor,
+            *build_keepalive_handlers(self.connection_pool))
         opener.addheaders = [('User-agent', 'RBTools/' + get_package_version())]
         urllib2.install_opener(opener)
 
     def check_api_version(self):
         """Checks the API version on the server to determine which to use."""
         try:
-            root_resource = self.api_get('api/')
-            rsp = self.api_get(root_resource['links']['info']['href'])
+            root_resource = self.api_get_cached('api/')
+            rsp = self.api_get_cached(root_resource['links']['info']['href'])
 
             self.rb_version = rsp['info']['product']['package_version']
 
@@ -412,15 +495,13 @@ class ReviewBoardServer(object):
         # If repository_path is a list, find a name in the list that's
         # registered on the server.
         if isinstance(self.info.path, list):
-            repositories = self.get_repositories()
+            index = self.get_repository_index()
 
-            debug("Repositories on Server: %s" % repositories)
-            debug("Server Aliases: %s" % self.info.path)
+            if not self._find_repository_path(index) and not index.refreshed:
+                index = self.get_repository_index(refresh=True)
+                self._find_repository_path(index)
 
-            for repository in repositories:
-                if repository['path'] in self.info.path:
-                    self.info.path = repository['path']
-                    break
+            repositories = index.repositories
 
             if isinstance(self.info.path, list):
                 sys.stderr.write('\n')
@@ -506,6 +587,21 @@ class ReviewBoardServer(object):
 
         return rsp['review_request']
 
+    def _find_repository_path(self, index):
+        """
+        Sets the repository path to the first of the candidate paths that's
+        registered on the server. Returns whether one was found.
+        """
+        debug("Repositories on Server: %s" % index.repositories)
+        debug("Server Aliases: %s" % self.info.path)
+
+        for repository in index.repositories:
+            if repository['path'] in self.info.path:
+                self.info.path = repository['path']
+                return True
+
+        return False
+
     def update_review_request_from_changenum(self, changenum, review_request):
         if self.deprecated_api:
             self.api_post(
@@ -520,19 +616,28 @@ class ReviewBoardServer(object):
         """
         Sets a field in a review request to the specified value.
         """
+        self.set_review_request_fields(review_request, {field: value})
+
+    def set_review_request_fields(self, review_request, fields):
+        """
+        Sets several fields in a review request at once.
+
+        The new API's draft resource takes all of the fields in a single PUT.
+        The deprecated API is sent one request per field.
+        """
         rid = review_request['id']
 
-        debug("Attempting to set field '%s' to '%s' for review request '%s'" %
-              (field, value, rid))
+        for field, value in fields.iteritems():
+            debug("Attempting to set field '%s' to '%s' for review request "
+                  "'%s'" % (field, value, rid))
 
         if self.deprecated_api:
-            self.api_post('api/json/reviewrequests/%s/draft/set/' % rid, {
-                field: value,
-            })
+            for field, value in fields.iteritems():
+                self.api_post('api/json/reviewrequests/%s/draft/set/' % rid, {
+                    field: value,
+                })
         else:
-            self.api_put(review_request['links']['draft']['href'], {
-                field: value,
-            })
+            self.api_put(review_request['links']['draft']['href'], fields)
 
     def get_review_request(self, rid):
         """
@@ -551,21 +656,80 @@ class ReviewBoardServer(object):
     def get_repositories(self):
         """
         Returns the list of repositories on this server.
+
+        The pages of the list are fetched in parallel where possible. Pages
+        are located by offset, so if repositories are added or removed in
+        the meantime, entries can shift between pages. Any repository that
+        then shows up twice is only returned once. A repository shifted
+        into a page that was already fetched is missed, as it would be when
+        fetching the pages one at a time.
         """
         if self.deprecated_api:
             rsp = self.api_get('api/json/repositories/')
-            repositories = rsp['repositories']
-        else:
-            rsp = self.api_get(
-                self.root_resource['links']['repositories']['href'])
-            repositories = rsp['repositories']
-
-            while 'next' in rsp['links']:
-                rsp = self.api_get(rsp['links']['next']['href'])
-                repositories.extend(rsp['repositories'])
+            return rsp['repositories']
+
+        # The first page is fetched on its own, so that any authentication
+        # happens before the requests for the other pages are made at once.
+        rsp = self.api_get(
+            self.root_resource['links']['repositories']['href'])
+        pages = [rsp['repositories']]
+
+        if 'next' in rsp['links']:
+            # Fetch the rest of the pages at once, if we can work out where
+            # they are.
+            page_urls = self._get_page_urls(rsp)
+
+            if page_urls:
+                for rsp in imap_parallel(self.api_get, page_urls):
+                    pages.append(rsp['repositories'])
+
+        # The last page links on if the list grew past the pages worked out
+        # from the first one's total_results.
+        while 'next' in rsp['links']:
+            rsp = self.api_get(rsp['links']['next']['href'])
+            pages.append(rsp['repositories'])
+
+        repositories = []
+        seen_ids = set()
+
+        for page in pages:
+            for repository in page:
+                if repository['id'] not in seen_ids:
+                    seen_ids.add(repository['id'])
+                    repositories.append(repository)
 
         return repositories
 
+    def _get_page_urls(self, rsp):
+        """
+        Returns the URLs of the remaining pages of a list resource, based on
+        the first page's total_results and the start and max-results in its
+        'next' link. An empty list is returned if these aren't available.
+        """
+        next_url = rsp['links']['next']['href']
+        scheme, netloc, path, query, fragment = urlsplit(next_url)
+        args = parse_qs(query)
+
+        try:
+            total_results = int(rsp['total_results'])
+            start = int(args['start'][0])
+            max_results = int(args['max-results'][0])
+        except (KeyError, ValueError):
+            return []
+
+        if max_results <= 0:
+            return []
+
+        page_urls = []
+
+        for page_start in xrange(start, total_results, max_results):
+            args['start'] = [str(page_start)]
+            page_urls.append(urlunsplit((scheme, netloc, path,
+                                         urlencode(args, doseq=True),
+                                         fragment)))
+
+        return page_urls
+
     def get_repository_info(self, rid):
         """
         Returns detailed information about a specific repository.
@@ -582,6 +746,138 @@ class ReviewBoardServer(object):
 
         return rsp['info']
 
+    def get_repository_index(self, refresh=False):
+        """
+        Returns a RepositoryIndex of the repositories on this server, along
+        with any repository info that's in the on-disk cache.
+
+        The repository list comes from the cache, unless it's out of date or
+        refresh is True.
+        """
+        entry, refreshed = self._load_repository_cache(refresh)
+
+        return self._make_repository_index(entry, refreshed)
+
+    def find_repositories_by_uuid(self, tool, uuid):
+        """
+        Yields the repositories using the given tool whose info has the
+        given UUID, as (repository, info) tuples.
+
+        Matches in the cached repository info come first. The info for the
+        remaining repositories is then fetched concurrently, and matches are
+        yielded as they're found. Callers can stop iterating once they've
+        found the repository they want, and the rest won't be fetched.
+
+        If nothing matches, the repository list is refreshed in case the
+        repository was added recently, and the search is repeated.
+        """
+        found = False
+
+        for refresh in (False, True):
+            entry, refreshed = self._load_repository_cache(refresh)
+            index = self._make_repository_index(entry, refreshed)
+
+            for match in index.get_by_uuid(tool, uuid):
+                found = True
+                yield match
+
+            missing = [repository for repository in entry['repositories']
+                       if (repository['tool'] == tool and
+                           repository['id'] not in entry['infos'])]
+            results = imap_parallel(self._fetch_repository_info, missing,
+                                    DEFAULT_MAX_WORKERS, ordered=False)
+
+            try:
+                for repository, info in results:
+                    entry['infos'][repository['id']] = \
+                        (self._get_repository_stamp(repository), info)
+
+                    if info and info.get('uuid') == uuid:
+                        found = True
+                        yield repository, info
+            finally:
+                results.close()
+
+                if missing:
+                    self._save_repository_cache(entry)
+
+            if found or refreshed:
+                return
+
+    def _load_repository_cache(self, refresh):
+        """
+        Returns the cache entry for this server's repositories, and whether
+        the repository list was just fetched.
+        """
+        entry = load_cache(REPOSITORY_CACHE).get(self.url)
+
+        if (not refresh and entry and
+            time.time() - entry['time'] < REPOSITORY_CACHE_TTL):
+            debug('Using the cached repository list')
+            return entry, False
+
+        if entry:
+            old_infos = entry['infos']
+        else:
+            old_infos = {}
+
+        repositories = self.get_repositories()
+        infos = {}
+
+        # Keep the info for repositories that haven't changed. Those the
+        # server couldn't fetch info for are tried again.
+        for repository in repositories:
+            old_info = old_infos.get(repository['id'])
+
+            if (old_info and old_info[1] is not None and
+                old_info[0] == self._get_repository_stamp(repository)):
+                infos[repository['id']] = old_info
+
+        entry = {
+            'repositories': repositories,
+            'infos': infos,
+            'time': time.time(),
+        }
+        self._save_repository_cache(entry)
+
+        return entry, True
+
+    def _save_repository_cache(self, entry):
+        cache = load_cache(REPOSITORY_CACHE)
+        cache[self.url] = entry
+
+        if len(cache) > MAX_REPOSITORY_CACHE_ENTRIES:
+            keys = sorted(cache, key=lambda k: cache[k]['time'])
+
+            for old_key in keys[:-MAX_REPOSITORY_CACHE_ENTRIES]:
+                del cache[old_key]
+
+        save_cache(REPOSITORY_CACHE, cache)
+
+    def _make_repository_index(self, entry, refreshed):
+        infos = dict((rid, info)
+                     for rid, (stamp, info) in entry['infos'].iteritems())
+
+        return RepositoryIndex(entry['repositories'], infos, refreshed)
+
+    def _fetch_repository_info(self, repository):
+        return repository, self._get_repository_info_or_none(repository['id'])
+
+    def _get_repository_stamp(self, repository):
+        return (repository['tool'], repository['path'])
+
+    def _get_repository_info_or_none(self, rid):
+        try:
+            return self.get_repository_info(rid)
+        except APIError, e:
+            # If the server couldn't fetch the repository info, it will return
+            # code 210. Ignore those.
+            # Other more serious errors should still be raised, though.
+            if e.error_code == 210:
+                return None
+
+            raise e
+
     def save_draft(self, review_request):
         """
         Saves a draft of a review request.
@@ -596,11 +892,18 @@ class ReviewBoardServer(object):
 
         debug("Review request draft saved")
 
-    def upload_diff(self, review_request, diff_content, parent_diff_content):
+    def upload_diff(self, review_request, diff_content, parent_diff_content,
+                    diff_path=None):
         """
         Uploads a diff to a Review Board server.
+
+        If diff_path is given, the diff is streamed from that file rather
+        than taken from diff_content.
         """
-        debug("Uploading diff, size: %d" % len(diff_content))
+        if diff_path:
+            debug("Uploading diff, size: %d" % os.path.getsize(diff_path))
+        else:
+            debug("Uploading diff, size: %d" % len(diff_content))
 
         if parent_diff_content:
             debug("Uploading parent diff, size: %d" % len(parent_diff_content))
@@ -611,10 +914,16 @@ class ReviewBoardServer(object):
         if self.info.base_path:
             fields['basedir'] = self.info.base_path
 
-        files['path'] = {
-            'filename': 'diff',
-            'content': diff_content
-        }
+        if diff_path:
+            files['path'] = {
+                'filename': 'diff',
+                'filepath': diff_path
+            }
+        else:
+            files['path'] = {
+                'filename': 'diff',
+                'content': diff_content
+            }
 
         if parent_diff_content:
             files['parent_diff_path'] = {
@@ -706,12 +1015,105 @@ class ReviewBoardServer(object):
         url = self._make_url(path)
         rsp = urllib2.urlopen(url).read()
 
+        self._save_cookies()
+        return rsp
+
+    def http_get_conditional(self, path, etag=None):
+        """
+        Performs an HTTP GET on the specified path, storing any cookies that
+        were set.
+
+        If an ETag is given, the resource is only fetched if it has changed.
+        Returns a tuple of the response body and ETag, where the body is None
+        if the resource hasn't changed.
+        """
+        debug('HTTP GETting %s' % path)
+
+        url = self._make_url(path)
+        headers = {}
+
+        if etag:
+            headers['If-None-Match'] = etag
+
+        try:
+            rsp = urllib2.urlopen(urllib2.Request(url, headers=headers))
+            data = rsp.read()
+            etag = rsp.info().getheader('ETag')
+        except urllib2.HTTPError, e:
+            if e.code != 304:
+                raise
+
+            data = None
+
+        self._save_cookies()
+
+        return data, etag
+
+    def api_get_cached(self, path):
+        """
+        Performs an API call using HTTP GET at the specified path, using the
+        on-disk cache of API resources.
+
+        A cached resource is used without contacting the server until it's
+        API_CACHE_TTL seconds old. After that, it's revalidated using its
+        ETag, so it's only downloaded again if it has changed.
+        """
+        url = self._make_url(path)
+        cache = load_cache(API_CACHE)
+        entry = cache.get(url)
+
+        if entry and time.time() - entry['time'] < API_CACHE_TTL:
+            debug('Using the cached copy of %s' % url)
+            return self.process_json(entry['data'])
+
+        if entry:
+            etag = entry['etag']
+        else:
+            etag = None
+
         try:
-            self.cookie_jar.save(self.cookie_file)
-        except IOError, e:
-            debug('Failed to write cookie file: %s' % e)
+            data, etag = self.http_get_conditional(path, etag)
+        except urllib2.HTTPError, e:
+            self.process_error(e.code, e.read())
+
+        if data is None:
+            debug('The cached copy of %s is still valid' % url)
+            data = entry['data']
+
+        # Errors are raised here, before they can be cached.
+        rsp = self.process_json(data)
+
+        cache[url] = {
+            'data': data,
+            'etag': etag,
+            'time': time.time(),
+        }
+
+        if len(cache) > MAX_API_CACHE_ENTRIES:
+            keys = sorted(cache, key=lambda k: cache[k]['time'])
+
+            for old_key in keys[:-MAX_API_CACHE_ENTRIES]:
+                del cache[old_key]
+
+        save_cache(API_CACHE, cache)
+
         return rsp
 
+    def _save_cookies(self):
+        """
+        Saves the cookie jar to the cookie file. Requests may be made from
+        several threads at once, so only one of them writes it at a time.
+        """
+        self._cookie_lock.acquire()
+
+        try:
+            try:
+                self.cookie_jar.save(self.cookie_file)
+            except IOError, e:
+                debug('Failed to write cookie file: %s' % e)
+        finally:
+            self._cookie_lock.release()
+
     def _make_url(self, path):
         """Given a path on the server returns a full http:// style url"""
         if path.startswith('http'):
@@ -753,31 +1155,31 @@ class ReviewBoardServer(object):
         url = self._make_url(path)
         debug('HTTP POSTing to %s: %s' % (url, debug_fields))
 
-        content_type, body = self._encode_multipart_formdata(fields, files)
+        body = MultipartBody(fields, files)
         headers = {
-            'Content-Type': content_type,
+            'Content-Type': body.content_type,
             'Content-Length': str(len(body))
         }
 
         try:
-            r = urllib2.Request(str(url), body, headers)
-            data = urllib2.urlopen(r).read()
-            try:
-                self.cookie_jar.save(self.cookie_file)
-            except IOError, e:
-                debug('Failed to write cookie file: %s' % e)
-            return data
-        except urllib2.HTTPError, e:
-            # Re-raise so callers can interpret it.
-            raise e
-        except urllib2.URLError, e:
             try:
-                debug(e.read())
-            except AttributeError:
-                pass
+                r = urllib2.Request(str(url), body, headers)
+                data = urllib2.urlopen(r).read()
+                self._save_cookies()
+                return data
+            except urllib2.HTTPError, e:
+                # Re-raise so callers can interpret it.
+                raise e
+            except urllib2.URLError, e:
+                try:
+                    debug(e.read())
+                except AttributeError:
+                    pass
 
-            die("Unable to access %s. The host path may be invalid\n%s" % \
-                (url, e))
+                die("Unable to access %s. The host path may be invalid\n%s" %
+                    (url, e))
+        finally:
+            body.close()
 
     def http_put(self, path, fields):
         """
@@ -787,16 +1189,16 @@ class ReviewBoardServer(object):
         url = self._make_url(path)
         debug('HTTP PUTting to %s: %s' % (url, fields))
 
-        content_type, body = self._encode_multipart_formdata(fields, None)
+        body = MultipartBody(fields)
         headers = {
-            'Content-Type': content_type,
+            'Content-Type': body.content_type,
             'Content-Length': str(len(body))
         }
 
         try:
             r = HTTPRequest(url, body, headers, method='PUT')
             data = urllib2.urlopen(r).read()
-            self.cookie_jar.save(self.cookie_file)
+            self._save_cookies()
             return data
         except urllib2.HTTPError, e:
             # Re-raise so callers can interpret it.
@@ -821,7 +1223,7 @@ class ReviewBoardServer(object):
         try:
             r = HTTPRequest(url, method='DELETE')
             data = urllib2.urlopen(r).read()
-            self.cookie_jar.save(self.cookie_file)
+            self._save_cookies()
             return data
         except urllib2.HTTPError, e:
             # Re-raise so callers can interpret it.
@@ -862,38 +1264,6 @@ class ReviewBoardServer(object):
         except urllib2.HTTPError, e:
             self.process_error(e.code, e.read())
 
-    def _encode_multipart_formdata(self, fields, files):
-        """
-        Encodes data for use in an HTTP POST.
-        """
-        BOUNDARY = mimetools.choose_boundary()
-        content = ""
-
-        fields = fields or {}
-        files = files or {}
-
-        for key in fields:
-            content += "--" + BOUNDARY + "\r\n"
-            content += "Content-Disposition: form-data; name=\"%s\"\r\n" % key
-            content += "\r\n"
-            content += str(fields[key]) + "\r\n"
-
-        for key in files:
-            filename = files[key]['filename']
-            value = files[key]['content']
-            content += "--" + BOUNDARY + "\r\n"
-            content += "Content-Disposition: form-data; name=\"%s\"; " % key
-            content += "filename=\"%s\"\r\n" % filename
-            content += "\r\n"
-            content += value + "\r\n"
-
-        content += "--" + BOUNDARY + "--\r\n"
-        content += "\r\n"
-
-        content_type = "multipart/form-data; boundary=%s" % BOUNDARY
-
-        return content_type, content
-
 
 def debug(s):
     """
@@ -904,10 +1274,13 @@ def debug(s):
 
 
 def tempt_fate(server, tool, changenum, diff_content=None,
-               parent_diff_content=None, submit_as=None, retries=3):
+               parent_diff_content=None, submit_as=None, retries=3,
+               diff_path=None):
     """
     Attempts to create a review request on a Review Board server and upload
     a diff. On success, the review request path is displayed.
+
+    If diff_path is given, the diff is streamed from that file.
     """
     try:
         if options.rid:
@@ -915,41 +1288,38 @@ def tempt_fate(server, tool, changenum, diff_content=None,
         else:
             review_request = server.new_review_request(changenum, submit_as)
 
+        draft_fields = {}
+
         if options.target_groups:
-            server.set_review_request_field(review_request, 'target_groups',
-                                            options.target_groups)
+            draft_fields['target_groups'] = options.target_groups
 
         if options.target_people:
-            server.set_review_request_field(review_request, 'target_people',
-                                            options.target_people)
+            draft_fields['target_people'] = options.target_people
 
         if options.summary:
-            server.set_review_request_field(review_request, 'summary',
-                                            options.summary)
+            draft_fields['summary'] = options.summary
 
         if options.branch:
-            server.set_review_request_field(review_request, 'branch',
-                                            options.branch)
+            draft_fields['branch'] = options.branch
 
         if options.bugs_closed:     # append to existing list
             options.bugs_closed = options.bugs_closed.strip(", ")
             bug_set = set(re.split("[, ]+", options.bugs_closed)) | \
                       set(review_request['bugs_closed'])
             options.bugs_closed = ",".join(bug_set)
-            server.set_review_request_field(review_request, 'bugs_closed',
-                                            options.bugs_closed)
+            draft_fields['bugs_closed'] = options.bugs_closed
 
         if options.description:
-            server.set_review_request_field(review_request, 'description',
-                                            options.description)
+            draft_fields['description'] = options.description
 
         if options.testing_done:
-            server.set_review_request_field(review_request, 'testing_done',
-                                            options.testing_done)
+            draft_fields['testing_done'] = options.testing_done
 
         if options.change_description:
-            server.set_review_request_field(review_request, 'changedescription',
-                                            options.change_description)
+            draft_fields['changedescription'] = options.change_description
+
+        if draft_fields:
+            server.set_review_request_fields(review_request, draft_fields)
     except APIError, e:
         if e.error_code == 103: # Not logged in
             retries = retries - 1
@@ -962,7 +1332,8 @@ def tempt_fate(server, tool, changenum, diff_content=None,
             if retries >= 0:
                 server.login(force=True)
                 tempt_fate(server, tool, changenum, diff_content,
-                           parent_diff_content, submit_as, retries=retries)
+                           parent_diff_content, submit_as, retries=retries,
+                           diff_path=diff_path)
                 return
 
         if options.rid:
@@ -974,7 +1345,7 @@ def tempt_fate(server, tool, changenum, diff_content=None,
     if not server.info.supports_changesets or not options.change_only:
         try:
             server.upload_diff(review_request, diff_content,
-                               parent_diff_content)
+                               parent_diff_content, diff_path)
         except APIError, e:
             sys.stderr.write('\n')
             sys.stderr.write('Error uploading diff\n')
@@ -1143,6 +1514,26 @@ def parse_options(args):
     parser.add_option("-d", "--debug",
                       action="store_true", dest="debug", default=DEBUG,
                       help="display debug output")
+    parser.add_option("--diff-engine",
+                      dest="diff_engine", default=GNU_DIFF,
+                      type="choice", choices=DIFF_ENGINES,
+                      help="how to diff files for Perforce, Plastic and "
+                           "ClearCase: 'gnu' runs GNU diff, 'builtin' diffs "
+                           "without running an external program "
+                           "(defaults to 'gnu')")
+    parser.add_option("--diff-jobs",
+                      dest="diff_jobs", type="int",
+                      default=DEFAULT_MAX_WORKERS, metavar="JOBS",
+                      help="the number of files to diff at once when "
+                           "generating Perforce changelist diffs "
+                           "(defaults to %d)" % DEFAULT_MAX_WORKERS)
+    parser.add_option("--git-backend",
+                      dest="git_backend", default=GIT_SUBPROCESS,
+                      type="choice", choices=GIT_BACKENDS,
+                      help="how to read git repositories: 'git' runs git, "
+                           "'native' reads merge bases, logs and diffs "
+                           "between commits from the repository directly "
+                           "where it can (defaults to 'git')")
     parser.add_option("--diff-filename",
                       dest="diff_filename", default=None,
                       help='upload an existing diff file, instead of '
@@ -1246,6 +1637,8 @@ def main():
     else:
         changenum = None
 
+    diff_path = None
+
     if options.revision_range:
         diff, parent_diff = tool.diff_between_revisions(options.revision_range, args,
                                                         repository_info)
@@ -1257,16 +1650,24 @@ def main():
         if options.diff_filename == '-':
             diff = sys.stdin.read()
         else:
+            # The file is streamed when it's uploaded, rather than read into
+            # memory here.
+            diff = None
+            diff_path = os.path.join(origcwd, options.diff_filename)
+
             try:
-                fp = open(os.path.join(origcwd, options.diff_filename), 'r')
-                diff = fp.read()
-                fp.close()
+                open(diff_path, 'rb').close()
             except IOError, e:
                 die("Unable to open diff filename: %s" % e)
     else:
         diff, parent_diff = tool.diff(args)
 
-    if len(diff) == 0:
+    if diff_path:
+        diff_size = os.path.getsize(diff_path)
+    else:
+        diff_size = len(diff)
+
+    if diff_size == 0:
         die("There don't seem to be any diffs!")
 
     if (isinstance(tool, PerforceClient) or
@@ -1282,8 +1683,15 @@ def main():
             server.deprecated_api = True
 
     if options.output_diff_only:
-        # The comma here isn't a typo, but rather suppresses the extra newline
-        print diff,
+        if diff_path:
+            fp = open(diff_path, 'rb')
+            shutil.copyfileobj(fp, sys.stdout)
+            fp.close()
+        else:
+            # The comma here isn't a typo, but rather suppresses the extra
+            # newline
+            print diff,
+
         sys.exit(0)
 
     # Let's begin.
@@ -1291,7 +1699,8 @@ def main():
 
     review_url = tempt_fate(server, tool, changenum, diff_content=diff,
                             parent_diff_content=parent_diff,
-                            submit_as=options.submit_as)
+                            submit_as=options.submit_as,
+                            diff_path=diff_path)
 
     # Load the review up in the browser if requested to:
     if options.open_browser:
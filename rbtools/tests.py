@@ -1,5 +1,7 @@
+import threading
 import unittest
 import urllib2
+from urlparse import parse_qs, urlparse
 
 try:
     from cStringIO import StringIO
@@ -14,32 +16,56 @@ except ImportError:
 from rbtools import postreview
 from rbtools.api.errors import APIError
 from rbtools.clients import RepositoryInfo
+from rbtools.clients.git import GIT_SUBPROCESS
 from rbtools.postreview import ReviewBoardServer
+from rbtools.utils.concurrency import DEFAULT_MAX_WORKERS
+from rbtools.utils.diff import GNU_DIFF
+from rbtools.utils.filesystem import make_tempfile
+from rbtools.utils.testbase import RBTestBase
 
 
-class MockHttpUnitTest(unittest.TestCase):
+class MockHttpUnitTest(RBTestBase):
     deprecated_api = False
 
     def setUp(self):
+        # Use a temporary home directory, so the API cache starts out empty.
+        # Cached resources are always revalidated, unless a test says
+        # otherwise.
+        super(MockHttpUnitTest, self).setUp()
+        self.saved_api_cache_ttl = postreview.API_CACHE_TTL
+        postreview.API_CACHE_TTL = 0
+
         # Save the old http_get and http_post
         postreview.options = OptionsStub()
 
         self.saved_http_get = ReviewBoardServer.http_get
+        self.saved_http_get_conditional = \
+            ReviewBoardServer.http_get_conditional
         self.saved_http_post = ReviewBoardServer.http_post
+        self.saved_http_put = ReviewBoardServer.http_put
 
         self.server = ReviewBoardServer('http://localhost:8080/',
                                         RepositoryInfo(), None)
         ReviewBoardServer.http_get = self._http_method
+        ReviewBoardServer.http_get_conditional = self._http_get_conditional
         ReviewBoardServer.http_post = self._http_method
+        ReviewBoardServer.http_put = self._http_method
 
         self.server.deprecated_api = self.deprecated_api
         self.http_response = {}
+        self.http_requests = []
 
     def tearDown(self):
+        postreview.API_CACHE_TTL = self.saved_api_cache_ttl
         ReviewBoardServer.http_get = self.saved_http_get
+        ReviewBoardServer.http_get_conditional = \
+            self.saved_http_get_conditional
         ReviewBoardServer.http_post = self.saved_http_post
+        ReviewBoardServer.http_put = self.saved_http_put
 
     def _http_method(self, path, *args, **kwargs):
+        self.http_requests.append((path,) + args[:1])
+
         if isinstance(self.http_response, dict):
             http_response = self.http_response[path]
         else:
@@ -50,6 +76,9 @@ class MockHttpUnitTest(unittest.TestCase):
         else:
             return http_response
 
+    def _http_get_conditional(self, path, etag=None):
+        return self._http_method(path), None
+
 
 class OptionsStub(object):
     def __init__(self):
@@ -60,6 +89,10 @@ class OptionsStub(object):
         self.username = None
         self.password = None
         self.repository_url = None
+        self.diff_engine = GNU_DIFF
+        self.diff_jobs = DEFAULT_MAX_WORKERS
+        self.git_backend = GIT_SUBPROCESS
+        self.p4_passwd = None
 
 
 class ApiTests(MockHttpUnitTest):
@@ -103,6 +136,259 @@ class ApiTests(MockHttpUnitTest):
         self.server.check_api_version()
         self.assertTrue(self.server.deprecated_api)
 
+    def test_api_get_cached(self):
+        """Testing caching API resources on disk"""
+        requests = []
+
+        def http_get_conditional(server, path, etag=None):
+            requests.append(etag)
+
+            if etag == '"1"':
+                return None, etag
+
+            return self.http_response[path], '"1"'
+
+        ReviewBoardServer.http_get_conditional = http_get_conditional
+        postreview.API_CACHE_TTL = 60
+
+        rsp = self.server.api_get_cached('api/')
+        self.assertEqual(rsp['links']['info']['href'], 'api/info/')
+        self.assertEqual(requests, [None])
+
+        # Fresh entries are used without asking the server.
+        self.assertEqual(self.server.api_get_cached('api/'), rsp)
+        self.assertEqual(requests, [None])
+
+        # Stale entries are revalidated.
+        postreview.API_CACHE_TTL = 0
+        self.assertEqual(self.server.api_get_cached('api/'), rsp)
+        self.assertEqual(requests, [None, '"1"'])
+
+    def test_find_repositories_by_uuid(self):
+        """Testing finding repositories by UUID with the on-disk cache"""
+        repositories = [
+            {'id': 1, 'tool': 'Subversion', 'path': 'http://svn/1'},
+            {'id': 2, 'tool': 'Git', 'path': 'git://git/2'},
+            {'id': 3, 'tool': 'Subversion', 'path': 'http://svn/3'},
+            {'id': 4, 'tool': 'Subversion', 'path': 'http://svn/4'},
+        ]
+        infos = {
+            1: {'uuid': 'uuid-1'},
+            3: {'uuid': 'uuid-3'},
+            5: {'uuid': 'uuid-5'},
+        }
+        requests = []
+
+        def get_repositories():
+            requests.append('list')
+            return list(repositories)
+
+        def get_repository_info(rid):
+            requests.append(rid)
+
+            if rid not in infos:
+                # The server couldn't fetch the repository info.
+                raise APIError(500, 210)
+
+            return infos[rid]
+
+        self.server.get_repositories = get_repositories
+        self.server.get_repository_info = get_repository_info
+
+        self.assertEqual(
+            list(self.server.find_repositories_by_uuid('Subversion',
+                                                       'uuid-3')),
+            [(repositories[2], infos[3])])
+        self.assertEqual(requests[0], 'list')
+        self.assertEqual(sorted(requests[1:]), [1, 3, 4])
+
+        # Everything is now cached.
+        del requests[:]
+        self.assertEqual(
+            list(self.server.find_repositories_by_uuid('Subversion',
+                                                       'uuid-1')),
+            [(repositories[0], infos[1])])
+        self.assertEqual(requests, [])
+
+        # A miss refreshes the list, but only fetches info for new
+        # repositories and those that failed before.
+        repositories.append({'id': 5, 'tool': 'Subversion',
+                             'path': 'http://svn/5'})
+        self.assertEqual(
+            list(self.server.find_repositories_by_uuid('Subversion',
+                                                       'uuid-5')),
+            [(repositories[4], infos[5])])
+        self.assertEqual(requests[0], 'list')
+        self.assertEqual(sorted(requests[1:]), [4, 5])
+
+    def test_find_repositories_by_uuid_early_exit(self):
+        """Testing that finding repositories by UUID stops at a match"""
+        repositories = [
+            {'id': i, 'tool': 'Subversion', 'path': 'http://svn/%d' % i}
+            for i in range(10)
+        ]
+        requests = []
+
+        def get_repository_info(rid):
+            requests.append(rid)
+            return {'uuid': 'uuid-%d' % rid}
+
+        self.server.get_repositories = lambda: repositories
+        self.server.get_repository_info = get_repository_info
+        saved_max_workers = postreview.DEFAULT_MAX_WORKERS
+        postreview.DEFAULT_MAX_WORKERS = 1
+
+        try:
+            matches = self.server.find_repositories_by_uuid('Subversion',
+                                                            'uuid-2')
+            self.assertEqual(matches.next(),
+                             (repositories[2], {'uuid': 'uuid-2'}))
+            matches.close()
+        finally:
+            postreview.DEFAULT_MAX_WORKERS = saved_max_workers
+
+        self.assertEqual(requests, [0, 1, 2])
+
+        # The info that was fetched is cached.
+        matches = self.server.find_repositories_by_uuid('Subversion',
+                                                        'uuid-1')
+        self.assertEqual(matches.next(),
+                         (repositories[1], {'uuid': 'uuid-1'}))
+        matches.close()
+        self.assertEqual(requests, [0, 1, 2])
+
+    def test_get_repositories(self):
+        """Testing fetching the pages of the repository list at once"""
+        repositories = [{'id': i} for i in range(7)]
+        requests = []
+
+        def http_get(server, path):
+            query = parse_qs(urlparse(path)[4])
+            start = int(query.get('start', ['0'])[0])
+            requests.append(start)
+            rsp = {
+                'stat': 'ok',
+                'total_results': len(repositories),
+                'repositories': repositories[start:start + 2],
+                'links': {},
+            }
+
+            if start + 2 < len(repositories):
+                rsp['links']['next'] = {
+                    'href': 'http://localhost:8080/api/repositories/'
+                            '?start=%d&max-results=2' % (start + 2),
+                }
+
+            return json.dumps(rsp)
+
+        ReviewBoardServer.http_get = http_get
+        self.server.root_resource = {
+            'links': {
+                'repositories': {
+                    'href': 'api/repositories/',
+                },
+            },
+        }
+
+        self.assertEqual(self.server.get_repositories(), repositories)
+        self.assertEqual(sorted(requests), [0, 2, 4, 6])
+
+        # Pages added after the first one was fetched are still followed.
+        del requests[:]
+        first_page = http_get(self.server, 'api/repositories/')
+        repositories.extend([{'id': 7}, {'id': 8}])
+
+        def http_get_stale(server, path):
+            if path == 'api/repositories/':
+                return first_page
+
+            return http_get(server, path)
+
+        ReviewBoardServer.http_get = http_get_stale
+
+        self.assertEqual(self.server.get_repositories(), repositories)
+        self.assertEqual(sorted(requests), [0, 2, 4, 6, 8])
+
+        # A repository added at the start after the first page was fetched
+        # shifts the others along, but none are returned twice.
+        first_page = http_get(self.server, 'api/repositories/')
+        expected = list(repositories)
+        repositories.insert(0, {'id': 9})
+
+        self.assertEqual(self.server.get_repositories(), expected)
+
+    def test_auth_challenges_serialized(self):
+        """Testing that HTTP auth challenges are handled one at a time"""
+        lock_free = []
+
+        def http_error_401(handler, *args, **kwargs):
+            # Check from another thread that the lock is held.
+            thread = threading.Thread(target=lambda: lock_free.append(
+                postreview._auth_lock.acquire(False)))
+            thread.start()
+            thread.join()
+
+        for handler_class in (postreview.ReviewBoardHTTPBasicAuthHandler,
+                              postreview.ReviewBoardHTTPDigestAuthHandler):
+            base_class = handler_class.__bases__[0]
+            saved_http_error_401 = base_class.http_error_401
+            base_class.http_error_401 = http_error_401
+
+            try:
+                handler_class().http_error_401(None, None, 401, '', {})
+            finally:
+                base_class.http_error_401 = saved_http_error_401
+
+        self.assertEqual(lock_free, [False, False])
+
+    def test_set_review_request_fields(self):
+        """Testing setting several draft fields in a single request"""
+        self.http_response = json.dumps({'stat': 'ok'})
+        review_request = {
+            'id': 1,
+            'links': {
+                'draft': {
+                    'href': 'api/review-requests/1/draft/',
+                },
+            },
+        }
+        fields = {
+            'summary': 'Summary',
+            'description': 'Description',
+            'testing_done': 'Tests',
+        }
+
+        self.server.set_review_request_fields(review_request, fields)
+        self.assertEqual(self.http_requests,
+                         [('api/review-requests/1/draft/', fields)])
+
+    def test_upload_diff_path(self):
+        """Testing uploading a diff streamed from a file"""
+        uploads = []
+
+        def http_post(server, path, fields, files=None):
+            uploads.append(files)
+            return json.dumps({'stat': 'ok'})
+
+        ReviewBoardServer.http_post = http_post
+        review_request = {
+            'id': 1,
+            'links': {
+                'diffs': {
+                    'href': 'api/review-requests/1/diffs/',
+                },
+            },
+        }
+
+        diff_path = make_tempfile('diff')
+        self.server.upload_diff(review_request, None, None, diff_path)
+        self.assertEqual(uploads, [{
+            'path': {
+                'filename': 'diff',
+                'filepath': diff_path,
+            },
+        }])
+
     def _build_info_resource(self, package_version):
         return {
             'api/info/': json.dumps({
@@ -189,5 +475,21 @@ class DeprecatedApiTests(MockHttpUnitTest):
             self.assertEqual(str(e),
                              'This is a test failure (HTTP 400, API Error 100)')
 
+    def test_set_review_request_fields(self):
+        """Testing setting several draft fields with the deprecated API"""
+        self.http_response = json.dumps({'stat': 'ok'})
+        fields = {
+            'summary': 'Summary',
+            'description': 'Description',
+        }
+
+        self.server.set_review_request_fields({'id': 1}, fields)
+        self.assertEqual(
+            sorted(self.http_requests),
+            [('api/json/reviewrequests/1/draft/set/',
+              {'description': 'Description'}),
+             ('api/json/reviewrequests/1/draft/set/',
+              {'summary': 'Summary'})])
+
     def _make_http_error(self, url, code, body):
         return urllib2.HTTPError(url, code, body, {}, StringIO(body))
@@ -0,0 +1,107 @@
+import cPickle as pickle
+import logging
+import os
+import tempfile
+
+from rbtools import get_package_version
+
+
+CACHE_DIR = '.post-review-cache'
+
+
+def get_cache_dir():
+    """Returns the directory where post-review keeps its caches."""
+    if 'APPDATA' in os.environ:
+        homepath = os.environ['APPDATA']
+    elif 'HOME' in os.environ:
+        homepath = os.environ['HOME']
+    else:
+        homepath = ''
+
+    return os.path.join(homepath, CACHE_DIR)
+
+
+def load_cache(name):
+    """
+    Loads the named cache, returning its contents as a dictionary.
+
+    An empty dictionary is returned if the cache doesn't exist, can't be
+    read, or was written by a different version of RBTools.
+    """
+    filename = os.path.join(get_cache_dir(), name)
+
+    try:
+        fp = open(filename, 'rb')
+
+        try:
+            version, data = pickle.load(fp)
+        finally:
+            fp.close()
+    except IOError:
+        return {}
+    except Exception, e:
+        logging.debug('Ignoring unreadable cache file %s: %s' % (filename, e))
+        return {}
+
+    if version != get_package_version():
+        return {}
+
+    return data
+
+
+def save_cache(name, data):
+    """
+    Saves the dictionary as the named cache.
+
+    The file is replaced atomically, so concurrent runs never see a
+    partially written cache. Failures are logged and otherwise ignored.
+    """
+    cache_dir = get_cache_dir()
+    filename = os.path.join(cache_dir, name)
+    tmpfile = None
+
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        fd, tmpfile = tempfile.mkstemp(dir=cache_dir)
+        fp = os.fdopen(fd, 'wb')
+
+        try:
+            pickle.dump((get_package_version(), data), fp,
+                        pickle.HIGHEST_PROTOCOL)
+        finally:
+            fp.close()
+
+        if os.name == 'nt' and os.path.exists(filename):
+            # Windows can't rename over an existing file.
+            os.unlink(filename)
+
+        os.rename(tmpfile, filename)
+    except (IOError, OSError), e:
+        logging.debug('Failed to write cache %s: %s' % (filename, e))
+
+        if tmpfile and os.path.exists(tmpfile):
+            try:
+                os.unlink(tmpfile)
+            except OSError:
+                pass
+
+
+def get_file_stamps(paths):
+    """
+    Returns a list of (path, mtime) tuples for the given paths, suitable for
+    checking whether a cache entry has gone stale. The mtime is None for
+    paths that don't exist.
+    """
+    stamps = []
+
+    for path in paths:
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+
+        stamps.append((path, mtime))
+
+    return stamps
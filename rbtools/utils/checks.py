@@ -1,12 +1,51 @@
 import os
 import subprocess
 import sys
+import threading
 
+from rbtools.utils.cache import load_cache, save_cache
 from rbtools.utils.process import die, execute
 
 
 GNU_DIFF_WIN32_URL = 'http://gnuwin32.sourceforge.net/packages/diffutils.htm'
 
+INSTALL_CHECKS_CACHE = 'install-checks'
+
+# Results of check_install, keyed by command. This lets scan_usable_client
+# probe every tool up front without the clients paying for it again.
+_install_checks = {}
+
+# Guards the on-disk cache, since check_install is called from several
+# threads at once.
+_install_checks_lock = threading.Lock()
+
+
+def find_executable(name):
+    """
+    Returns the full path to the executable that running 'name' would launch,
+    or None if there isn't one.
+
+    Like CreateProcess, this only tries the '.exe' extension on Windows.
+    """
+    if sys.platform.startswith('win') and not name.lower().endswith('.exe'):
+        candidates = [name, name + '.exe']
+    else:
+        candidates = [name]
+
+    if os.path.dirname(name):
+        dirs = ['']
+    else:
+        dirs = os.environ.get('PATH', os.defpath).split(os.pathsep)
+
+    for dirname in dirs:
+        for candidate in candidates:
+            path = os.path.join(dirname, candidate)
+
+            if os.path.isfile(path) and os.access(path, os.X_OK):
+                return os.path.abspath(path)
+
+    return None
+
 
 def check_install(command):
     """
@@ -14,15 +53,68 @@ def check_install(command):
     that command is installed or not.  The 'command' argument should be
     something that executes quickly, without hitting the network (for
     instance, 'svn help' or 'git --version').
+
+    The executable is first looked up in the PATH, so missing tools cost
+    nothing. Tools that are found are only launched once per PATH and
+    binary; after that, the result comes from a per-user cache. Within a
+    run, the result is remembered as well.
     """
+    if command not in _install_checks:
+        _install_checks[command] = _check_install(command)
+
+    return _install_checks[command]
+
+
+def _check_install(command):
+    args = command.split(' ')
+    executable = find_executable(args[0])
+
+    if not executable:
+        return False
+
+    stamp = (os.environ.get('PATH'), executable,
+             os.stat(executable).st_mtime)
+
+    _install_checks_lock.acquire()
+
+    try:
+        entry = load_cache(INSTALL_CHECKS_CACHE).get(command)
+    finally:
+        _install_checks_lock.release()
+
+    if entry and entry[0] == stamp:
+        return entry[1]
+
     try:
-        subprocess.Popen(command.split(' '),
-                         stdin=subprocess.PIPE,
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE)
-        return True
+        p = subprocess.Popen(args,
+                             stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+
+        # All we care about is that it could be launched. Don't leave it
+        # running or unreaped, and don't wait on commands that go to the
+        # network.
+        try:
+            p.kill()
+        except OSError:
+            # It already exited.
+            pass
+
+        p.wait()
+        installed = True
     except OSError:
-        return False
+        installed = False
+
+    _install_checks_lock.acquire()
+
+    try:
+        cache = load_cache(INSTALL_CHECKS_CACHE)
+        cache[command] = (stamp, installed)
+        save_cache(INSTALL_CHECKS_CACHE, cache)
+    finally:
+        _install_checks_lock.release()
+
+    return installed
 
 
 def check_gnu_diff():
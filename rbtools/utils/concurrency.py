@@ -0,0 +1,93 @@
+import sys
+import threading
+from Queue import Queue, Empty
+
+
+# Most of the work handed to the pool is waiting on subprocesses or the
+# network, so this can comfortably exceed the number of CPUs.
+DEFAULT_MAX_WORKERS = 8
+
+
+def imap_parallel(func, items, max_workers=DEFAULT_MAX_WORKERS, ordered=True):
+    """
+    Calls func on each of the items using a pool of worker threads, yielding
+    the results as they become available.
+
+    If ordered is True, results are yielded in the same order as items.
+    Otherwise, they're yielded as soon as each call finishes. Any exception
+    raised by func (including the SystemExit raised by die()) is re-raised
+    in the calling thread.
+
+    Closing the generator early (for instance, by breaking out of a loop
+    over it) stops the workers from picking up any remaining items. Calls
+    that are already running are left to finish in the background.
+    """
+    items = list(items)
+    num_workers = min(max_workers, len(items))
+
+    if num_workers <= 1:
+        for item in items:
+            yield func(item)
+
+        return
+
+    tasks = Queue()
+    results = Queue()
+    stop = threading.Event()
+
+    for i, item in enumerate(items):
+        tasks.put((i, item))
+
+    def worker():
+        while not stop.isSet():
+            try:
+                i, item = tasks.get_nowait()
+            except Empty:
+                return
+
+            try:
+                results.put((i, True, func(item)))
+            except:
+                results.put((i, False, sys.exc_info()))
+
+    for i in xrange(num_workers):
+        thread = threading.Thread(target=worker)
+        thread.setDaemon(True)
+        thread.start()
+
+    try:
+        pending = {}
+        next_index = 0
+
+        for i in xrange(len(items)):
+            result = _get_result(results)
+
+            if ordered:
+                pending[result[0]] = result
+
+                while next_index in pending:
+                    yield _unpack_result(pending.pop(next_index))
+                    next_index += 1
+            else:
+                yield _unpack_result(result)
+    finally:
+        stop.set()
+
+
+def _get_result(results):
+    # Queue.get() without a timeout can't be interrupted with Ctrl-C on
+    # Python 2, so poll instead.
+    while True:
+        try:
+            return results.get(True, 0.5)
+        except Empty:
+            pass
+
+
+def _unpack_result(result):
+    i, success, value = result
+
+    if not success:
+        raise value[0], value[1], value[2]
+
+    return value
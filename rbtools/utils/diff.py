@@ -0,0 +1,816 @@
+import os
+import re
+import time
+
+from rbtools.utils.process import execute
+
+
+# Generate diffs by running GNU diff on each pair of files.
+GNU_DIFF = 'gnu'
+
+# Generate diffs in-process, without spawning anything.
+BUILTIN_DIFF = 'builtin'
+
+DIFF_ENGINES = (GNU_DIFF, BUILTIN_DIFF)
+
+# The number of lines of context around each change, as with 'diff -u'.
+CONTEXT_LINES = 3
+
+# The lines that 'diff -p' considers to be function headings.
+FUNCTION_LINE_RE = re.compile(r'^[A-Za-z$_]')
+
+NO_NEWLINE_MARKER = '\\ No newline at end of file\n'
+
+
+def diff_files(old_file, new_file, engine=GNU_DIFF, show_function=False):
+    """
+    Returns the unified diff between two files as a list of lines, in the
+    form that 'diff -uN' produces. If show_function is True, each hunk
+    header carries the nearest preceding function heading, as with 'diff -p'.
+
+    Binary files are reported as a single 'Binary files ... differ' line,
+    and an empty list is returned if the files are identical. Lines with
+    '\\r\\r\\n' endings are treated as ending in '\\r\\n'.
+
+    engine selects between running GNU diff (GNU_DIFF) and generating the
+    diff in-process (BUILTIN_DIFF). Both produce the same headers, markers
+    and hunks.
+    """
+    if engine == BUILTIN_DIFF:
+        dl = _builtin_diff(old_file, new_file, show_function)
+    else:
+        dl = _gnu_diff(old_file, new_file, show_function)
+
+    # If the input file has ^M characters at end of line, lets ignore them.
+    dl = dl.replace('\r\r\n', '\r\n')
+    dl = dl.splitlines(True)
+
+    # Special handling for the output of the diff tool on binary files:
+    #     diff outputs "Files a and b differ"
+    # and the callers expect the output to start with
+    #     "Binary files "
+    if (len(dl) == 1 and
+        dl[0].startswith('Files %s and %s differ' % (old_file, new_file))):
+        dl = ['Binary files %s and %s differ\n' % (old_file, new_file)]
+
+    return dl
+
+
+def _gnu_diff(old_file, new_file, show_function):
+    if hasattr(os, 'uname') and os.uname()[0] == 'SunOS':
+        diff_cmd = ["gdiff", "-uN"]
+    else:
+        diff_cmd = ["diff", "-uN"]
+
+    if show_function:
+        diff_cmd.append("-p")
+
+    # Diff returns "1" if differences were found.
+    return execute(diff_cmd + [old_file, new_file], extra_ignore_errors=(1, 2),
+                   translate_newlines=False)
+
+
+def diff_text(old_data, new_data, old_label, new_label, show_function=False,
+              function_width=40):
+    """
+    Returns the unified diff between two strings as a list of lines, using
+    the builtin engine. The labels are used as-is in the '---' and '+++'
+    headers, and an empty list is returned if the strings are identical.
+
+    The data is always diffed as text, so callers should check for binary
+    data first. If show_function is True, function headings in the hunk
+    headers are truncated to function_width characters.
+    """
+    if old_data == new_data:
+        return []
+
+    a = _split_lines(old_data)
+    b = _split_lines(new_data)
+
+    result = [
+        '--- %s\n' % old_label,
+        '+++ %s\n' % new_label,
+    ]
+
+    function_line = None
+    function_search_start = 0
+
+    for group in _group_opcodes(_get_opcodes(a, b), CONTEXT_LINES):
+        i1, j1 = group[0][1], group[0][3]
+        i2, j2 = group[-1][2], group[-1][4]
+        header = '@@ -%s +%s @@' % (_format_range(i1, i2),
+                                    _format_range(j1, j2))
+
+        if show_function:
+            # Use the closest function heading before the hunk, carrying
+            # the last one found over from earlier hunks.
+            for i in xrange(i1 - 1, function_search_start - 1, -1):
+                if FUNCTION_LINE_RE.match(a[i]):
+                    function_line = a[i]
+                    break
+
+            function_search_start = i1
+
+            if function_line:
+                header += ' ' + function_line.strip()[:function_width].rstrip()
+
+        result.append(header + '\n')
+
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                _append_lines(result, ' ', a[i1:i2])
+            else:
+                _append_lines(result, '-', a[i1:i2])
+                _append_lines(result, '+', b[j1:j2])
+
+    return result
+
+
+def _builtin_diff(old_file, new_file, show_function):
+    old_data = _read_file(old_file)
+    new_data = _read_file(new_file)
+
+    if old_data == new_data:
+        return ''
+
+    if '\0' in old_data or '\0' in new_data:
+        return 'Binary files %s and %s differ\n' % (old_file, new_file)
+
+    return ''.join(diff_text(old_data, new_data,
+                             '%s\t%s' % (old_file,
+                                         _format_timestamp(old_file)),
+                             '%s\t%s' % (new_file,
+                                         _format_timestamp(new_file)),
+                             show_function))
+
+
+def _read_file(filename):
+    # Like 'diff -N', treat missing files as empty.
+    if not os.path.exists(filename):
+        return ''
+
+    fp = open(filename, 'rb')
+
+    try:
+        return fp.read()
+    finally:
+        fp.close()
+
+
+def _format_timestamp(filename):
+    """
+    Formats the file's modification time the way GNU diff does.
+
+    Python 2 only gives the time as a float, which can't hold nanoseconds
+    for current dates, so the time is rounded to microseconds and the last
+    three digits are zero, as GNU diff prints them on systems that keep
+    timestamps to the microsecond.
+    """
+    if os.path.exists(filename):
+        mtime = os.stat(filename).st_mtime
+    else:
+        mtime = 0
+
+    seconds, fraction = divmod(mtime, 1)
+    seconds = int(seconds)
+    microseconds = int(round(fraction * 1000000))
+
+    if microseconds == 1000000:
+        seconds += 1
+        microseconds = 0
+
+    tm = time.localtime(seconds)
+
+    if tm.tm_isdst > 0 and time.daylight:
+        offset = -time.altzone
+    else:
+        offset = -time.timezone
+
+    if offset < 0:
+        sign = '-'
+        offset = -offset
+    else:
+        sign = '+'
+
+    return '%s.%06d000 %s%02d%02d' % (time.strftime('%Y-%m-%d %H:%M:%S', tm),
+                                      microseconds, sign, offset // 3600,
+                                      offset % 3600 // 60)
+
+
+def _format_range(start, stop):
+    """Formats a hunk range the way GNU diff does."""
+    length = stop - start
+
+    if length == 1:
+        return '%d' % (start + 1)
+    elif length == 0:
+        return '%d,0' % start
+    else:
+        return '%d,%d' % (start + 1, length)
+
+
+def _append_lines(result, prefix, lines):
+    for line in lines:
+        if line.endswith('\n'):
+            result.append(prefix + line)
+        else:
+            result.append(prefix + line + '\n')
+            result.append(NO_NEWLINE_MARKER)
+
+
+def _split_lines(data):
+    """Splits data into lines the way diff does, breaking only on '\n'."""
+    lines = data.split('\n')
+
+    if lines[-1]:
+        # The last line has no newline.
+        last = lines.pop()
+    else:
+        last = None
+        lines.pop()
+
+    lines = [line + '\n' for line in lines]
+
+    if last is not None:
+        lines.append(last)
+
+    return lines
+
+
+def _get_opcodes(a, b):
+    """
+    Returns difflib-style opcodes for turning a into b, choosing the same
+    changes that GNU diff would.
+
+    The common prefix and suffix are matched up front in linear time, so
+    identical files and files that were only appended to (or had a single
+    run of lines inserted or removed) never reach the full comparison.
+    Everything else goes through a port of GNU diff's analysis: lines with
+    no counterpart in the other file are discarded up front, the rest are
+    compared with Myers' algorithm, and the resulting runs of changes are
+    slid to the same boundaries GNU diff picks.
+    """
+    prefix = 0
+    max_prefix = min(len(a), len(b))
+
+    while prefix < max_prefix and a[prefix] == b[prefix]:
+        prefix += 1
+
+    suffix = 0
+    max_suffix = max_prefix - prefix
+
+    while suffix < max_suffix and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+
+    a_end = len(a) - suffix
+    b_end = len(b) - suffix
+
+    if prefix == a_end or prefix == b_end:
+        changes = [(prefix, prefix, a_end - prefix, b_end - prefix)]
+    else:
+        # Like GNU diff, keep a few lines of the identical prefix and
+        # suffix in the comparison. This limits how far a run of changes
+        # can be slid.
+        lo = prefix - min(prefix, CONTEXT_LINES)
+        a_hi = a_end + min(suffix, CONTEXT_LINES)
+        b_hi = b_end + min(suffix, CONTEXT_LINES)
+
+        changes = [(line0 + lo, line1 + lo, deleted, inserted)
+                   for line0, line1, deleted, inserted
+                   in _compare_lines(a[lo:a_hi], b[lo:b_hi])]
+
+    opcodes = []
+    i = j = 0
+
+    for line0, line1, deleted, inserted in changes:
+        if i < line0:
+            opcodes.append(('equal', i, line0, j, line1))
+
+        if deleted and inserted:
+            tag = 'replace'
+        elif deleted:
+            tag = 'delete'
+        else:
+            tag = 'insert'
+
+        i = line0 + deleted
+        j = line1 + inserted
+        opcodes.append((tag, line0, i, line1, j))
+
+    if i < len(a):
+        opcodes.append(('equal', i, len(a), j, len(b)))
+
+    return opcodes
+
+
+def _compare_lines(a, b):
+    """
+    Compares two lists of lines, returning a list of (line0, line1,
+    deleted, inserted) tuples for each run of changes.
+    """
+    classes = {}
+    a_equivs = [classes.setdefault(line, len(classes) + 1) for line in a]
+    b_equivs = [classes.setdefault(line, len(classes) + 1) for line in b]
+
+    # The change flags have one extra, always-false entry on the end.
+    # Index -1 refers to it as well, which stands in for GNU diff's flag
+    # before the first line.
+    a_changed = [0] * (len(a) + 1)
+    b_changed = [0] * (len(b) + 1)
+
+    a_index, b_index = _discard_confusing_lines(a_equivs, b_equivs,
+                                                a_changed, b_changed)
+    _compare_seq([a_equivs[i] for i in a_index],
+                 [b_equivs[i] for i in b_index],
+                 a_changed, b_changed, a_index, b_index)
+    _shift_boundaries(a_equivs, a_changed, b_changed)
+    _shift_boundaries(b_equivs, b_changed, a_changed)
+
+    # Pair up the runs of changes, walking backwards through both files.
+    changes = []
+    i0 = len(a)
+    i1 = len(b)
+
+    while i0 >= 0 or i1 >= 0:
+        if a_changed[i0 - 1] or b_changed[i1 - 1]:
+            line0 = i0
+            line1 = i1
+
+            while a_changed[i0 - 1]:
+                i0 -= 1
+
+            while b_changed[i1 - 1]:
+                i1 -= 1
+
+            changes.append((i0, i1, line0 - i0, line1 - i1))
+
+        i0 -= 1
+        i1 -= 1
+
+    changes.reverse()
+
+    return changes
+
+
+def _discard_confusing_lines(a_equivs, b_equivs, a_changed, b_changed):
+    """
+    Marks lines that have no match in the other file as changed, along
+    with runs of lines that match too many lines to be useful, so that the
+    comparison doesn't need to consider them.
+
+    Returns the indexes of the lines that still need comparing, for each
+    file.
+    """
+    counts = []
+
+    for equivs in (a_equivs, b_equivs):
+        count = {}
+
+        for equiv in equivs:
+            count[equiv] = count.get(equiv, 0) + 1
+
+        counts.append(count)
+
+    all_discards = []
+
+    for equivs, other_counts in ((a_equivs, counts[1]),
+                                 (b_equivs, counts[0])):
+        end = len(equivs)
+        discards = [0] * end
+
+        # Lines matching more than roughly the square root of the number
+        # of lines are provisionally discardable.
+        many = 5
+        tem = end // 64
+
+        while True:
+            tem >>= 2
+
+            if tem <= 0:
+                break
+
+            many *= 2
+
+        for i, equiv in enumerate(equivs):
+            nmatch = other_counts.get(equiv, 0)
+
+            if nmatch == 0:
+                discards[i] = 1
+            elif nmatch > many:
+                discards[i] = 2
+
+        # Only discard provisional lines that are in a run of discardable
+        # lines, with non-provisional lines at the start and end.
+        i = 0
+
+        while i < end:
+            if discards[i] == 2:
+                discards[i] = 0
+            elif discards[i] != 0:
+                provisional = 0
+                j = i
+
+                while j < end and discards[j] != 0:
+                    if discards[j] == 2:
+                        provisional += 1
+
+                    j += 1
+
+                # Cancel the provisional discards at the end of the run.
+                while j > i and discards[j - 1] == 2:
+                    j -= 1
+                    discards[j] = 0
+                    provisional -= 1
+
+                length = j - i
+
+                if provisional * 4 > length:
+                    # Too many provisional lines to discard any of them.
+                    while j > i:
+                        j -= 1
+
+                        if discards[j] == 2:
+                            discards[j] = 0
+                else:
+                    # Cancel any long subruns of provisional lines.
+                    minimum = 1
+                    tem = length >> 2
+
+                    while True:
+                        tem >>= 2
+
+                        if tem <= 0:
+                            break
+
+                        minimum <<= 1
+
+                    minimum += 1
+                    consec = 0
+                    j = 0
+
+                    while j < length:
+                        if discards[i + j] != 2:
+                            consec = 0
+                        else:
+                            consec += 1
+
+                            if consec == minimum:
+                                # Back up to cancel the whole subrun.
+                                j -= consec
+                            elif consec > minimum:
+                                discards[i + j] = 0
+
+                        j += 1
+
+                    # Cancel provisional lines at either end of the run,
+                    # up to the first three non-provisional lines in a row
+                    # or the first non-provisional line 8 lines in.
+                    _cancel_provisional(discards, i, length, 1)
+                    i += length - 1
+                    _cancel_provisional(discards, i, length, -1)
+
+            i += 1
+
+        all_discards.append(discards)
+
+    indexes = []
+
+    for discards, changed in zip(all_discards, (a_changed, b_changed)):
+        index = []
+
+        for i, discard in enumerate(discards):
+            if discard:
+                changed[i] = 1
+            else:
+                index.append(i)
+
+        indexes.append(index)
+
+    return indexes
+
+
+def _cancel_provisional(discards, start, length, step):
+    consec = 0
+
+    for j in xrange(length):
+        discard = discards[start + j * step]
+
+        if j >= 8 and discard == 1:
+            break
+
+        if discard == 2:
+            consec = 0
+            discards[start + j * step] = 0
+        elif discard == 0:
+            consec = 0
+        else:
+            consec += 1
+
+        if consec == 3:
+            break
+
+
+def _compare_seq(xv, yv, x_changed, y_changed, x_index, y_index):
+    """
+    Finds a minimal set of changes between the sequences xv and yv, using
+    Myers' divide-and-conquer algorithm, and flags the changed lines.
+    """
+    # The furthest reaching paths for each diagonal, offset so that the
+    # lowest diagonal (and its neighbor) fits in the list.
+    doff = len(yv) + 1
+    fd = [0] * (len(xv) + len(yv) + 3)
+    bd = [0] * (len(xv) + len(yv) + 3)
+
+    # Past this many edit steps, settle for a good split rather than the
+    # best one.
+    too_expensive = 1
+    diags = len(xv) + len(yv) + 3
+
+    while diags:
+        too_expensive <<= 1
+        diags >>= 2
+
+    too_expensive = max(4096, too_expensive)
+
+    pending = [(0, len(xv), 0, len(yv), False)]
+
+    while pending:
+        xoff, xlim, yoff, ylim, find_minimal = pending.pop()
+
+        # Slide down the bottom initial diagonal, and up the top one.
+        while xoff < xlim and yoff < ylim and xv[xoff] == yv[yoff]:
+            xoff += 1
+            yoff += 1
+
+        while xoff < xlim and yoff < ylim and xv[xlim - 1] == yv[ylim - 1]:
+            xlim -= 1
+            ylim -= 1
+
+        if xoff == xlim:
+            for y in xrange(yoff, ylim):
+                y_changed[y_index[y]] = 1
+        elif yoff == ylim:
+            for x in xrange(xoff, xlim):
+                x_changed[x_index[x]] = 1
+        else:
+            xmid, ymid, lo_minimal, hi_minimal = _diag(
+                xv, yv, xoff, xlim, yoff, ylim, find_minimal, fd, bd, doff,
+                too_expensive)
+            pending.append((xmid, xlim, ymid, ylim, hi_minimal))
+            pending.append((xoff, xmid, yoff, ymid, lo_minimal))
+
+
+def _diag(xv, yv, xoff, xlim, yoff, ylim, find_minimal, fd, bd, doff,
+          too_expensive):
+    """
+    Finds the midpoint of the shortest edit script between the given
+    ranges of xv and yv, searching forward from the start and backward
+    from the end at the same time until the two searches overlap.
+
+    Returns (xmid, ymid, lo_minimal, hi_minimal), where the flags say
+    whether each half must be compared exactly.
+    """
+    dmin = xoff - ylim
+    dmax = xlim - yoff
+    fmid = xoff - yoff
+    bmid = xlim - ylim
+    fmin = fmax = fmid
+    bmin = bmax = bmid
+    odd = (fmid - bmid) & 1
+    fd[doff + fmid] = xoff
+    bd[doff + bmid] = xlim
+    c = 0
+    no_path = xlim + ylim + 1
+
+    while True:
+        c += 1
+
+        # Extend the forward search by an edit step in each diagonal.
+        if fmin > dmin:
+            fmin -= 1
+            fd[doff + fmin - 1] = -1
+        else:
+            fmin += 1
+
+        if fmax < dmax:
+            fmax += 1
+            fd[doff + fmax + 1] = -1
+        else:
+            fmax -= 1
+
+        for d in xrange(fmax, fmin - 1, -2):
+            tlo = fd[doff + d - 1]
+            thi = fd[doff + d + 1]
+
+            if tlo < thi:
+                x = thi
+            else:
+                x = tlo + 1
+
+            y = x - d
+
+            while x < xlim and y < ylim and xv[x] == yv[y]:
+                x += 1
+                y += 1
+
+            fd[doff + d] = x
+
+            if odd and bmin <= d <= bmax and bd[doff + d] <= x:
+                return x, y, True, True
+
+        # Similarly extend the backward search.
+        if bmin > dmin:
+            bmin -= 1
+            bd[doff + bmin - 1] = no_path
+        else:
+            bmin += 1
+
+        if bmax < dmax:
+            bmax += 1
+            bd[doff + bmax + 1] = no_path
+        else:
+            bmax -= 1
+
+        for d in xrange(bmax, bmin - 1, -2):
+            tlo = bd[doff + d - 1]
+            thi = bd[doff + d + 1]
+
+            if tlo < thi:
+                x = tlo
+            else:
+                x = thi - 1
+
+            y = x - d
+
+            while xoff < x and yoff < y and xv[x - 1] == yv[y - 1]:
+                x -= 1
+                y -= 1
+
+            bd[doff + d] = x
+
+            if not odd and fmin <= d <= fmax and x <= fd[doff + d]:
+                return x, y, True, True
+
+        if find_minimal or c < too_expensive:
+            continue
+
+        # We've gone well beyond the call of duty. Split halfway between
+        # the best forward and backward paths found so far.
+        fxybest = -1
+
+        for d in xrange(fmax, fmin - 1, -2):
+            x = min(fd[doff + d], xlim)
+            y = x - d
+
+            if ylim < y:
+                x = ylim + d
+                y = ylim
+
+            if fxybest < x + y:
+                fxybest = x + y
+                fxbest = x
+
+        bxybest = no_path * 2
+
+        for d in xrange(bmax, bmin - 1, -2):
+            x = max(xoff, bd[doff + d])
+            y = x - d
+
+            if y < yoff:
+                x = yoff + d
+                y = yoff
+
+            if x + y < bxybest:
+                bxybest = x + y
+                bxbest = x
+
+        if (xlim + ylim) - bxybest < fxybest - (xoff + yoff):
+            return fxbest, fxybest - fxbest, True, False
+        else:
+            return bxbest, bxybest - bxbest, False, True
+
+
+def _shift_boundaries(equivs, changed, other_changed):
+    """
+    Slides each run of changes as far forward as it can go, merging it
+    with neighboring runs where possible, and then back to line up with a
+    run of changes in the other file if there is one.
+    """
+    i = 0
+    j = 0
+    i_end = len(equivs)
+
+    while True:
+        # Find the start of the next run of changes, keeping track of the
+        # corresponding point in the other file.
+        while i < i_end and not changed[i]:
+            while other_changed[j]:
+                j += 1
+
+            j += 1
+            i += 1
+
+        if i == i_end:
+            break
+
+        start = i
+        i += 1
+
+        while changed[i]:
+            i += 1
+
+        while other_changed[j]:
+            j += 1
+
+        while True:
+            runlength = i - start
+
+            # Move the run back while the line before it matches its last
+            # line, merging it with any earlier runs.
+            while start and equivs[start - 1] == equivs[i - 1]:
+                start -= 1
+                changed[start] = 1
+                i -= 1
+                changed[i] = 0
+
+                while changed[start - 1]:
+                    start -= 1
+
+                j -= 1
+
+                while other_changed[j]:
+                    j -= 1
+
+            if other_changed[j - 1]:
+                corresponding = i
+            else:
+                corresponding = i_end
+
+            # Then move it forward while its first line matches the line
+            # after it, merging it with any later runs.
+            while i != i_end and equivs[start] == equivs[i]:
+                changed[start] = 0
+                start += 1
+                changed[i] = 1
+                i += 1
+
+                while changed[i]:
+                    i += 1
+
+                j += 1
+
+                while other_changed[j]:
+                    corresponding = i
+                    j += 1
+
+            if runlength == i - start:
+                break
+
+        # Move the run back to line up with a run in the other file.
+        while corresponding < i:
+            start -= 1
+            changed[start] = 1
+            i -= 1
+            changed[i] = 0
+            j -= 1
+
+            while other_changed[j]:
+                j -= 1
+
+
+def _group_opcodes(opcodes, n):
+    """
+    Groups opcodes into hunks with up to n lines of context, merging
+    changes that are close enough to share their context. This is
+    SequenceMatcher.get_grouped_opcodes() for precomputed opcodes.
+    """
+    if not opcodes:
+        return
+
+    # Trim the context before the first change and after the last one.
+    opcodes = list(opcodes)
+
+    if opcodes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = opcodes[0]
+        opcodes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+
+    if opcodes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = opcodes[-1]
+        opcodes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+
+    nn = n + n
+    group = []
+
+    for tag, i1, i2, j1, j2 in opcodes:
+        # End the current group and start a new one whenever there is a
+        # large range with no changes.
+        if tag == 'equal' and i2 - i1 > nn:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+
+        group.append((tag, i1, i2, j1, j2))
+
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
@@ -0,0 +1,356 @@
+import httplib
+import mimetools
+import os
+import socket
+import threading
+import urllib2
+from urllib import addinfourl
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+
+# The size of the blocks read from files when streaming a request body.
+CHUNK_SIZE = 64 * 1024
+
+# The methods that can be sent again if a reused connection fails before a
+# response arrives, since repeating them has no further effect.
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS',
+                                'TRACE'])
+
+
+class ConnectionPool(object):
+    """
+    Keeps idle HTTP connections around so they can be reused by later
+    requests to the same host.
+
+    A connection is only ever handed out to one request at a time, so the
+    pool can be shared between threads.
+    """
+    def __init__(self):
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns an idle connection for the key, or None if there isn't one."""
+        self._lock.acquire()
+
+        try:
+            connections = self._idle.get(key)
+
+            if connections:
+                return connections.pop()
+
+            return None
+        finally:
+            self._lock.release()
+
+    def put(self, key, conn):
+        """Returns a connection to the pool once a response has been read."""
+        self._lock.acquire()
+
+        try:
+            self._idle.setdefault(key, []).append(conn)
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """Closes all idle connections."""
+        self._lock.acquire()
+
+        try:
+            idle = self._idle
+            self._idle = {}
+        finally:
+            self._lock.release()
+
+        for connections in idle.itervalues():
+            for conn in connections:
+                conn.close()
+
+
+class KeepAliveMixin(object):
+    """
+    Replaces urllib2's do_open with one that uses HTTP/1.1 persistent
+    connections.
+
+    urllib2 sends "Connection: close" and opens a new connection for every
+    request. This keeps connections open and reuses them for later requests
+    to the same host, which saves a TCP (and, for HTTPS, TLS) handshake per
+    request.
+
+    The response body is always read in full before the connection goes
+    back to the pool, so the returned response is backed by memory rather
+    than the socket.
+    """
+    def __init__(self, pool=None):
+        self.pool = pool or ConnectionPool()
+
+    def close(self):
+        self.pool.close()
+
+    def do_open(self, http_class, req, **http_conn_args):
+        host = req.get_host()
+
+        if not host:
+            raise urllib2.URLError('no host given')
+
+        tunnel_host = getattr(req, '_tunnel_host', None)
+        key = (http_class, host, tunnel_host)
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items()
+                            if k not in headers))
+        headers['Connection'] = 'keep-alive'
+        headers = dict((name.title(), val) for name, val in headers.items())
+
+        tunnel_headers = {}
+
+        if tunnel_host:
+            proxy_auth_hdr = 'Proxy-Authorization'
+
+            if proxy_auth_hdr in headers:
+                tunnel_headers[proxy_auth_hdr] = headers.pop(proxy_auth_hdr)
+
+        conn = self.pool.get(key)
+
+        if conn is not None:
+            self._set_timeout(conn, req.timeout)
+
+            try:
+                self._send_request(conn, req, headers)
+            except (socket.error, httplib.HTTPException):
+                # The server has most likely closed the idle connection. The
+                # request wasn't fully sent, so it can't have been acted on,
+                # and it's safe to try again on a fresh one.
+                conn.close()
+                conn = None
+            else:
+                try:
+                    response = conn.getresponse()
+                except (socket.error, httplib.HTTPException), e:
+                    conn.close()
+
+                    if (req.get_method() not in IDEMPOTENT_METHODS and
+                        not _is_closed_without_response(e)):
+                        # The server may have acted on the request, so
+                        # sending it again could repeat a POST.
+                        raise urllib2.URLError(e)
+
+                    conn = None
+
+        if conn is None:
+            conn = http_class(host, timeout=req.timeout, **http_conn_args)
+
+            if tunnel_host:
+                conn.set_tunnel(tunnel_host, headers=tunnel_headers)
+
+            try:
+                self._send_request(conn, req, headers)
+                response = conn.getresponse()
+            except socket.error, e:
+                conn.close()
+                raise urllib2.URLError(e)
+
+        try:
+            data = response.read()
+        except (socket.error, httplib.HTTPException), e:
+            conn.close()
+            raise urllib2.URLError(e)
+
+        if response.will_close:
+            conn.close()
+        else:
+            self.pool.put(key, conn)
+
+        resp = addinfourl(StringIO(data), response.msg, req.get_full_url())
+        resp.code = response.status
+        resp.msg = response.reason
+
+        return resp
+
+    def _send_request(self, conn, req, headers):
+        data = req.get_data()
+
+        if hasattr(data, 'seek'):
+            # The request may be a retry, after a stale connection or an
+            # authentication challenge, so send the body from the start.
+            data.seek(0)
+
+        conn.request(req.get_method(), req.get_selector(), data, headers)
+
+    def _set_timeout(self, conn, timeout):
+        # A pooled connection keeps the timeout of the request it was opened
+        # for, so apply this request's.
+        if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+            timeout = socket.getdefaulttimeout()
+
+        conn.timeout = timeout
+
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+
+
+def _is_closed_without_response(e):
+    """
+    Returns whether an error from reading a response means the server closed
+    the connection without sending anything, as it does when it has timed
+    out an idle connection.
+    """
+    if not isinstance(e, httplib.BadStatusLine):
+        return False
+
+    # Older versions of Python give the empty line, quoted.
+    return (e.line in ('', "''") or
+            e.line.startswith('No status line received'))
+
+
+class KeepAliveHTTPHandler(KeepAliveMixin, urllib2.HTTPHandler):
+    """An HTTP handler that reuses connections through a ConnectionPool."""
+    def __init__(self, pool=None, debuglevel=0):
+        urllib2.HTTPHandler.__init__(self, debuglevel)
+        KeepAliveMixin.__init__(self, pool)
+
+
+if hasattr(httplib, 'HTTPSConnection'):
+    class KeepAliveHTTPSHandler(KeepAliveMixin, urllib2.HTTPSHandler):
+        """An HTTPS handler that reuses connections through a ConnectionPool."""
+        def __init__(self, pool=None, debuglevel=0, **kwargs):
+            urllib2.HTTPSHandler.__init__(self, debuglevel, **kwargs)
+            KeepAliveMixin.__init__(self, pool)
+
+
+def build_keepalive_handlers(pool=None):
+    """
+    Returns the handlers that make a urllib2 opener reuse connections,
+    sharing a single ConnectionPool between HTTP and HTTPS.
+    """
+    pool = pool or ConnectionPool()
+    handlers = [KeepAliveHTTPHandler(pool)]
+
+    if hasattr(httplib, 'HTTPSConnection'):
+        handlers.append(KeepAliveHTTPSHandler(pool))
+
+    return handlers
+
+
+class MultipartBody(object):
+    """
+    A multipart/form-data request body that's produced in chunks as it's
+    read, rather than built up as one string.
+
+    Each entry in files is a dictionary with a 'filename', and either the
+    'content' as a string or a 'filepath' to stream the content from.
+
+    httplib sends any body with a read() method in blocks. The length is
+    available through len(), for the Content-Length header.
+    """
+    def __init__(self, fields=None, files=None, boundary=None):
+        self.boundary = boundary or mimetools.choose_boundary()
+        self.content_type = 'multipart/form-data; boundary=%s' % self.boundary
+        self._parts = []
+        self._length = 0
+        self._chunks = None
+
+        fields = fields or {}
+        files = files or {}
+
+        for key in fields:
+            self._add_data('--%s\r\n'
+                           'Content-Disposition: form-data; name="%s"\r\n'
+                           '\r\n'
+                           '%s\r\n'
+                           % (self.boundary, key, str(fields[key])))
+
+        for key in files:
+            self._add_data('--%s\r\n'
+                           'Content-Disposition: form-data; name="%s"; '
+                           'filename="%s"\r\n'
+                           '\r\n'
+                           % (self.boundary, key, files[key]['filename']))
+            self._add_file(files[key])
+            self._add_data('\r\n')
+
+        self._add_data('--%s--\r\n\r\n' % self.boundary)
+        self.seek(0)
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        """Reads up to size bytes, or the rest of the body if size is -1."""
+        result = []
+
+        while size < 0 or size > 0:
+            if self._offset >= len(self._chunk):
+                try:
+                    self._chunk = self._chunks.next()
+                except StopIteration:
+                    break
+
+                self._offset = 0
+
+            if size < 0:
+                end = len(self._chunk)
+            else:
+                end = min(self._offset + size, len(self._chunk))
+                size -= end - self._offset
+
+            if self._offset == 0 and end == len(self._chunk):
+                result.append(self._chunk)
+            else:
+                result.append(self._chunk[self._offset:end])
+
+            self._offset = end
+
+        return ''.join(result)
+
+    def seek(self, offset):
+        """Rewinds the body. Only seeking to the start is supported."""
+        if offset != 0:
+            raise IOError('MultipartBody can only seek to the start')
+
+        if self._chunks is not None:
+            self._chunks.close()
+
+        self._chunks = self._iter_chunks()
+        self._chunk = ''
+        self._offset = 0
+
+    def close(self):
+        """Closes the file being read, if any."""
+        if self._chunks is not None:
+            self._chunks.close()
+
+    def _add_data(self, data):
+        self._parts.append((data, None))
+        self._length += len(data)
+
+    def _add_file(self, file_info):
+        if 'filepath' in file_info:
+            filepath = file_info['filepath']
+            self._parts.append((None, filepath))
+            self._length += os.path.getsize(filepath)
+        else:
+            self._add_data(file_info['content'])
+
+    def _iter_chunks(self):
+        for data, filepath in self._parts:
+            if data is not None:
+                yield data
+                continue
+
+            fp = open(filepath, 'rb')
+
+            try:
+                while True:
+                    chunk = fp.read(CHUNK_SIZE)
+
+                    if not chunk:
+                        break
+
+                    yield chunk
+            finally:
+                fp.close()
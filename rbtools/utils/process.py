@@ -2,6 +2,13 @@ import logging
 import os
 import subprocess
 import sys
+import threading
+from collections import deque
+
+
+# The number of lines (or chunks) of output from execute_stream() that are
+# kept around for error messages.
+STREAM_ERROR_TAIL_LINES = 50
 
 
 def die(msg=None):
@@ -24,6 +31,202 @@ def execute(command, env=None, split_lines=False, ignore_errors=False,
     """
     Utility function to execute a command and return the output.
     """
+    if with_errors:
+        errors_output = subprocess.STDOUT
+    else:
+        # Nobody would read from a pipe, and a chatty command would block
+        # once it filled up.
+        errors_output = open(os.devnull, 'w')
+
+    try:
+        p = _popen(command, env, translate_newlines, errors_output)
+
+        if split_lines:
+            data = p.stdout.readlines()
+        else:
+            data = p.stdout.read()
+
+        rc = p.wait()
+    finally:
+        if not with_errors:
+            errors_output.close()
+
+    if rc and not ignore_errors and rc not in extra_ignore_errors:
+        die('Failed to execute command: %s\n%s' % (command, data))
+
+    return data
+
+
+def execute_stream(command, env=None, chunk_size=None, ignore_errors=False,
+                   extra_ignore_errors=(), translate_newlines=True,
+                   with_errors=True):
+    """
+    Utility function to execute a command and yield its output as the
+    command produces it.
+
+    Output is yielded one line at a time, or in blocks of up to chunk_size
+    bytes if chunk_size is given. Errors are handled as in execute(), except
+    that only the tail of the output is included in the error message, since
+    the rest has already been consumed.
+
+    Nothing is run until the first item is requested. If the caller stops
+    early, the command is killed.
+    """
+    if with_errors:
+        errors_output = subprocess.STDOUT
+    else:
+        # Nobody would read from a pipe, and a chatty command would block
+        # once it filled up.
+        errors_output = open(os.devnull, 'w')
+
+    p = _popen(command, env, translate_newlines, errors_output)
+    tail = deque(maxlen=STREAM_ERROR_TAIL_LINES)
+
+    try:
+        if chunk_size:
+            while True:
+                data = p.stdout.read(chunk_size)
+
+                if not data:
+                    break
+
+                tail.append(data)
+                yield data
+        else:
+            # Iterating over the file directly would read ahead in large
+            # blocks, so read a line at a time instead.
+            for line in iter(p.stdout.readline, ''):
+                tail.append(line)
+                yield line
+
+        rc = p.wait()
+
+        if rc and not ignore_errors and rc not in extra_ignore_errors:
+            die('Failed to execute command: %s\n%s' % (command,
+                                                        ''.join(tail)))
+    finally:
+        if p.poll() is None:
+            try:
+                p.kill()
+            except OSError:
+                pass
+
+            p.wait()
+
+        p.stdout.close()
+
+        if not with_errors:
+            errors_output.close()
+
+
+class BatchProcess(object):
+    """
+    A long-running command that answers a stream of requests over its stdin
+    and stdout, such as 'git cat-file --batch', 'hg serve --cmdserver pipe'
+    or 'p4 -G -x -'.
+
+    The command is started on the first request and kept running, so each
+    request costs a round trip over a pipe rather than a new process.
+    Responses are read back with read_line() and read_exactly(), following
+    whatever framing the command uses: a header line giving the size, for
+    git, or a channel byte and a 4-byte length, for hg's command server.
+
+    If the command exits or the pipe breaks, IOError is raised, and the
+    command is started again on the next request. Anything it writes to
+    stderr is discarded, so that it can't get mixed up with the responses.
+    """
+    def __init__(self, command, env=None):
+        self.command = command
+        self.env = env
+        self._process = None
+        self._errors_output = None
+        self._lock = threading.Lock()
+
+    def request(self, data, read_response):
+        """
+        Sends a request and returns the response, as read by calling
+        read_response with this object. Requests from different threads are
+        handled one at a time.
+        """
+        self._lock.acquire()
+
+        try:
+            if self._process is None:
+                self._start()
+
+            try:
+                self._process.stdin.write(data)
+                self._process.stdin.flush()
+
+                return read_response(self)
+            except (IOError, OSError):
+                self._stop()
+                raise
+        finally:
+            self._lock.release()
+
+    def read_line(self):
+        """Reads a line of the response, including the newline."""
+        line = self._process.stdout.readline()
+
+        if not line.endswith('\n'):
+            raise IOError('%s exited unexpectedly' % self.command[0])
+
+        return line
+
+    def read_exactly(self, size):
+        """Reads exactly size bytes of the response."""
+        data = self._process.stdout.read(size)
+
+        if len(data) != size:
+            raise IOError('%s exited unexpectedly' % self.command[0])
+
+        return data
+
+    def close(self):
+        """Stops the command, which will be started again if needed."""
+        self._lock.acquire()
+
+        try:
+            self._stop()
+        finally:
+            self._lock.release()
+
+    def _start(self):
+        self._errors_output = open(os.devnull, 'w')
+
+        try:
+            self._process = _popen(self.command, self.env and dict(self.env),
+                                   False, self._errors_output)
+        except OSError, e:
+            self._errors_output.close()
+            self._errors_output = None
+            raise IOError('Unable to run %s: %s' % (self.command[0], e))
+
+    def _stop(self):
+        if self._process is None:
+            return
+
+        # Most batch commands exit once their input is closed.
+        try:
+            self._process.stdin.close()
+        except IOError:
+            pass
+
+        if self._process.poll() is None:
+            try:
+                self._process.kill()
+            except OSError:
+                pass
+
+        self._process.wait()
+        self._process.stdout.close()
+        self._errors_output.close()
+        self._process = None
+        self._errors_output = None
+
+
+def _popen(command, env, translate_newlines, errors_output):
     if isinstance(command, list):
         logging.debug(subprocess.list2cmdline(command))
     else:
@@ -37,36 +240,20 @@ def execute(command, env=None, split_lines=False, ignore_errors=False,
     env['LC_ALL'] = 'en_US.UTF-8'
     env['LANGUAGE'] = 'en_US.UTF-8'
 
-    if with_errors:
-        errors_output = subprocess.STDOUT
-    else:
-        errors_output = subprocess.PIPE
-
     if sys.platform.startswith('win'):
-        p = subprocess.Popen(command,
-                             stdin=subprocess.PIPE,
-                             stdout=subprocess.PIPE,
-                             stderr=errors_output,
-                             shell=False,
-                             universal_newlines=translate_newlines,
-                             env=env)
-    else:
-        p = subprocess.Popen(command,
-                             stdin=subprocess.PIPE,
-                             stdout=subprocess.PIPE,
-                             stderr=errors_output,
-                             shell=False,
-                             close_fds=True,
-                             universal_newlines=translate_newlines,
-                             env=env)
-    if split_lines:
-        data = p.stdout.readlines()
+        return subprocess.Popen(command,
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=errors_output,
+                                shell=False,
+                                universal_newlines=translate_newlines,
+                                env=env)
     else:
-        data = p.stdout.read()
-
-    rc = p.wait()
-
-    if rc and not ignore_errors and rc not in extra_ignore_errors:
-        die('Failed to execute command: %s\n%s' % (command, data))
-
-    return data
+        return subprocess.Popen(command,
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=errors_output,
+                                shell=False,
+                                close_fds=True,
+                                universal_newlines=translate_newlines,
+                                env=env)
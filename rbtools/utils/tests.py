@@ -4,8 +4,15 @@ Any new modules created under rbtools/api should be tested here."""
 import os
 import re
 import sys
+import threading
+import time
+import urllib2
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 
-from rbtools.utils import checks, filesystem, process
+from nose import SkipTest
+
+from rbtools.utils import checks, concurrency, diff, filesystem, http, \
+                          process
 from rbtools.utils.testbase import RBTestBase
 
 
@@ -15,6 +22,30 @@ class UtilitiesTest(RBTestBase):
         self.assertTrue(checks.check_install(sys.executable + ' --version'))
         self.assertFalse(checks.check_install(self.gen_uuid()))
 
+    def test_check_install_cached(self):
+        """Test 'check_install' method reusing results across runs."""
+        command = sys.executable + ' --version'
+        checks._install_checks.clear()
+        self.assertTrue(checks.check_install(command))
+
+        def fail(*args, **kwargs):
+            self.fail('The command should not have been launched')
+
+        saved_popen = checks.subprocess.Popen
+        checks.subprocess.Popen = fail
+        checks._install_checks.clear()
+
+        try:
+            self.assertTrue(checks.check_install(command))
+        finally:
+            checks.subprocess.Popen = saved_popen
+
+    def test_find_executable(self):
+        """Test 'find_executable' method."""
+        self.assertEqual(checks.find_executable(sys.executable),
+                         os.path.abspath(sys.executable))
+        self.assertEqual(checks.find_executable(self.gen_uuid()), None)
+
     def test_make_tempfile(self):
         """Test 'make_tempfile' method."""
         fname = filesystem.make_tempfile()
@@ -28,6 +59,256 @@ class UtilitiesTest(RBTestBase):
         self.assertTrue(re.match('.*?%d.%d.%d' % sys.version_info[:3],
                         process.execute([sys.executable, '-V'])))
 
+    def test_execute_stream(self):
+        """Test 'execute_stream' method."""
+        script = 'import sys; sys.stdout.write("a\\nb\\nc")'
+        self.assertEqual(
+            list(process.execute_stream([sys.executable, '-c', script])),
+            ['a\n', 'b\n', 'c'])
+        self.assertEqual(
+            ''.join(process.execute_stream([sys.executable, '-c', script],
+                                           chunk_size=2)),
+            'a\nb\nc')
+
+    def test_execute_stream_errors(self):
+        """Test 'execute_stream' method with a failing command."""
+        command = [sys.executable, '-c', 'import sys; sys.exit(3)']
+        self.assertRaises(SystemExit, list, process.execute_stream(command))
+        self.assertEqual(
+            list(process.execute_stream(command, extra_ignore_errors=(3,))),
+            [])
+
+    def test_batch_process(self):
+        """Test 'BatchProcess' sending requests to a persistent command."""
+        # Answers each line with its length on a line, then the line
+        # reversed, exiting on "exit".
+        script = ('import sys\n'
+                  'for line in iter(sys.stdin.readline, ""):\n'
+                  '    line = line.rstrip("\\n")\n'
+                  '    if line == "exit": sys.exit(1)\n'
+                  '    sys.stdout.write("%d\\n%s" % (len(line), line[::-1]))\n'
+                  '    sys.stdout.flush()\n')
+        batch = process.BatchProcess([sys.executable, '-c', script])
+
+        def read_response(batch):
+            return batch.read_exactly(int(batch.read_line()))
+
+        self.assertEqual(batch.request('abc\n', read_response), 'cba')
+        pid = batch._process.pid
+        self.assertEqual(batch.request('hello\n', read_response), 'olleh')
+        self.assertEqual(batch._process.pid, pid)
+
+        # The command is started again after it exits.
+        self.assertRaises(IOError, batch.request, 'exit\n', read_response)
+        self.assertEqual(batch._process, None)
+        self.assertEqual(batch.request('xy\n', read_response), 'yx')
+        self.assertNotEqual(batch._process.pid, pid)
+
+        batch.close()
+        self.assertEqual(batch._process, None)
+
+    def test_diff_files(self):
+        """Test 'diff_files' method with the builtin engine."""
+        old_file = filesystem.make_tempfile('a\nb\nc\nd\ne\nf\ng\nh\n')
+        new_file = filesystem.make_tempfile('a\nB\nc\nd\ne\nf\ng\nh\ni')
+
+        dl = diff.diff_files(old_file, new_file, diff.BUILTIN_DIFF)
+        self.assertTrue(dl[0].startswith('--- %s\t' % old_file))
+        self.assertTrue(dl[1].startswith('+++ %s\t' % new_file))
+        self.assertEqual(dl[2:], [
+            '@@ -1,8 +1,9 @@\n', ' a\n', '-b\n', '+B\n', ' c\n', ' d\n',
+            ' e\n', ' f\n', ' g\n', ' h\n', '+i\n',
+            '\\ No newline at end of file\n',
+        ])
+
+        self.assertEqual(diff.diff_files(old_file, old_file,
+                                         diff.BUILTIN_DIFF), [])
+
+        binary_file = filesystem.make_tempfile('a\0b\n')
+        self.assertEqual(
+            diff.diff_files(old_file, binary_file, diff.BUILTIN_DIFF),
+            ['Binary files %s and %s differ\n' % (old_file, binary_file)])
+
+    def test_diff_files_matches_gnu(self):
+        """Test 'diff_files' method's engines producing the same hunks."""
+        if not checks.check_install('diff --version'):
+            raise SkipTest('diff is not installed')
+
+        lines = ['int f()\n', '{\n', '    x;\n', '}\n', '\n'] * 20
+        old_file = filesystem.make_tempfile(''.join(lines))
+        del lines[42:47]
+        lines[10:11] = ['    y;\n', '    x;\n']
+        lines.insert(80, '}\n')
+        new_file = filesystem.make_tempfile(''.join(lines).rstrip('\n'))
+
+        # Timestamps with microseconds are printed the same way. Python 2
+        # can't set nanoseconds.
+        os.utime(old_file, (1300000000.022849, 1300000000.022849))
+        os.utime(new_file, (1300000001.999999, 1300000001.999999))
+
+        for show_function in (False, True):
+            gnu = diff.diff_files(old_file, new_file, diff.GNU_DIFF,
+                                  show_function)
+            builtin = diff.diff_files(old_file, new_file, diff.BUILTIN_DIFF,
+                                      show_function)
+            self.assertEqual(builtin, gnu)
+
     def test_die(self):
         """Test 'die' method."""
         self.assertRaises(SystemExit, process.die)
+
+    def test_imap_parallel(self):
+        """Test 'imap_parallel' method."""
+        items = range(20)
+        results = concurrency.imap_parallel(lambda x: x * 2, items)
+        self.assertEqual(list(results), [x * 2 for x in items])
+
+        results = concurrency.imap_parallel(lambda x: x * 2, items,
+                                            ordered=False)
+        self.assertEqual(sorted(results), [x * 2 for x in items])
+
+    def test_imap_parallel_errors(self):
+        """Test 'imap_parallel' method re-raising worker exceptions."""
+        def func(x):
+            if x == 5:
+                process.die()
+
+            return x
+
+        results = concurrency.imap_parallel(func, range(10))
+        self.assertRaises(SystemExit, list, results)
+
+    def _start_http_server(self):
+        connections = []
+        posts = self.http_server_posts = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                connections.append(self.client_address)
+
+            def do_GET(self):
+                body = self.path
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+                if self.path == '/drop':
+                    # Close the connection without telling the client.
+                    self.close_connection = 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                posts.append(self.path)
+
+                if self.path == '/slow':
+                    # Take longer to respond than the client waits.
+                    time.sleep(1)
+                    self.close_connection = 1
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        self.addCleanup(server.shutdown)
+
+        return 'http://127.0.0.1:%d' % server.server_port, connections
+
+    def test_keepalive_handler(self):
+        """Test 'KeepAliveHTTPHandler' reusing connections."""
+        url, connections = self._start_http_server()
+        pool = http.ConnectionPool()
+        opener = urllib2.build_opener(*http.build_keepalive_handlers(pool))
+
+        self.assertEqual(opener.open(url + '/a').read(), '/a')
+        self.assertEqual(opener.open(url + '/b', 'data').read(), 'data')
+        self.assertEqual(opener.open(url + '/c').read(), '/c')
+        self.assertEqual(len(connections), 1)
+        pool.close()
+
+    def test_keepalive_handler_multipart(self):
+        """Test 'KeepAliveHTTPHandler' sending a 'MultipartBody'."""
+        url, connections = self._start_http_server()
+        pool = http.ConnectionPool()
+        opener = urllib2.build_opener(*http.build_keepalive_handlers(pool))
+        body = http.MultipartBody({'a': 1}, boundary='XX')
+        request = urllib2.Request(url + '/a', body, {
+            'Content-Type': body.content_type,
+            'Content-Length': str(len(body)),
+        })
+
+        expected = ('--XX\r\nContent-Disposition: form-data; name="a"\r\n'
+                    '\r\n1\r\n--XX--\r\n\r\n')
+        self.assertEqual(opener.open(request).read(), expected)
+        self.assertEqual(opener.open(request).read(), expected)
+        self.assertEqual(len(connections), 1)
+        pool.close()
+
+    def test_keepalive_handler_reconnect(self):
+        """Test 'KeepAliveHTTPHandler' replacing closed connections."""
+        url, connections = self._start_http_server()
+        pool = http.ConnectionPool()
+        opener = urllib2.build_opener(*http.build_keepalive_handlers(pool))
+
+        self.assertEqual(opener.open(url + '/drop').read(), '/drop')
+        self.assertEqual(opener.open(url + '/a').read(), '/a')
+        self.assertEqual(len(connections), 2)
+        pool.close()
+
+    def test_keepalive_handler_post_not_retried(self):
+        """Test 'KeepAliveHTTPHandler' not resending a POST that timed out."""
+        url, connections = self._start_http_server()
+        pool = http.ConnectionPool()
+        opener = urllib2.build_opener(*http.build_keepalive_handlers(pool))
+
+        self.assertEqual(opener.open(url + '/a').read(), '/a')
+        self.assertRaises(urllib2.URLError, opener.open, url + '/slow',
+                          'data', 0.2)
+        self.assertEqual(self.http_server_posts, ['/slow'])
+        self.assertEqual(len(connections), 1)
+        pool.close()
+
+    def test_multipart_body(self):
+        """Test 'MultipartBody' with string and file contents."""
+        filename = filesystem.make_tempfile('file\n' * 50000)
+        files = {
+            'a': {'filename': 'a', 'content': 'string\n'},
+            'b': {'filename': 'b', 'filepath': filename},
+        }
+        body = http.MultipartBody({'field': 'value'}, files, boundary='XX')
+        content = body.read()
+        self.assertEqual(len(content), len(body))
+        self.assertTrue(content.startswith(
+            '--XX\r\nContent-Disposition: form-data; name="field"\r\n'
+            '\r\nvalue\r\n'))
+        self.assertTrue(content.endswith('--XX--\r\n\r\n'))
+        self.assertTrue('filename="a"\r\n\r\nstring\n\r\n' in content)
+        self.assertTrue('\r\n\r\n' + 'file\n' * 50000 + '\r\n' in content)
+        self.assertEqual(body.read(), '')
+
+        body.seek(0)
+        chunks = []
+
+        while True:
+            chunk = body.read(1000)
+
+            if not chunk:
+                break
+
+            self.assertTrue(len(chunk) <= 1000)
+            chunks.append(chunk)
+
+        self.assertEqual(''.join(chunks), content)
+        body.close()